@@ -0,0 +1,77 @@
+"""
+Re-record the yt-dlp fixtures used by benchmarks/run.py, or fill a replay
+store for EXTRACTOR=replay.
+
+Needs network access. The recorded dicts are sanitized with
+YoutubeDL.sanitize_info so they can be stored as JSON. With --store, the
+queries go through the bot's own resolve and search paths with EXTRACTOR=record,
+so the stored responses are exactly the ones a replay will be asked for.
+
+Usage:
+    python benchmarks/record_fixtures.py
+    python benchmarks/record_fixtures.py --video https://youtu.be/dQw4w9WgXcQ --query "pop mix"
+    python benchmarks/record_fixtures.py --store fixtures/extractor --audio-seconds 20 \\
+        --play "never gonna give you up" https://youtu.be/dQw4w9WgXcQ --search "pop mix"
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import yt_dlp  # noqa: E402
+
+import bot as musicbot  # noqa: E402
+from bot import YTDL_OPTIONS  # noqa: E402
+
+
+def record(path: str, options: dict, target: str):
+    with yt_dlp.YoutubeDL(options) as ydl:
+        data = ydl.sanitize_info(ydl.extract_info(target, download=False))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+    print(f'Recorded {target} -> {os.path.relpath(path, ROOT)}')
+
+
+async def record_store(store_dir: str, plays: list, searches: list, audio_seconds: int):
+    musicbot.EXTRACTOR_MODE = 'record'
+    musicbot.RECORD_AUDIO_SECONDS = audio_seconds
+    musicbot.fixture_store = musicbot.FixtureStore(store_dir)
+    loop = asyncio.get_running_loop()
+    for query in plays:
+        data = await musicbot.YTDLSource.resolve(query, loop=loop)
+        print(f"Recorded play {query!r} -> {data.get('title')}")
+    for query in searches:
+        results = await musicbot.search_youtube(query)
+        print(f'Recorded search {query!r} -> {len(results)} result(s)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record yt-dlp fixtures for the benchmarks')
+    parser.add_argument('--video', default='https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=43')
+    parser.add_argument('--query', default='pop mix')
+    parser.add_argument('--store', help='Record into this replay store instead of benchmarks/fixtures')
+    parser.add_argument('--play', nargs='+', default=[], help='Queries to record as the play command resolves them')
+    parser.add_argument('--search', nargs='+', default=[], help='Queries to record as the search command runs them')
+    parser.add_argument('--audio-seconds', type=int, default=0,
+                        help='Also store this many seconds of audio per played track (needs FFmpeg)')
+    args = parser.parse_args(argv)
+
+    if args.store:
+        asyncio.run(record_store(args.store, args.play, args.search, args.audio_seconds))
+        return
+
+    os.makedirs(FIXTURES, exist_ok=True)
+    record(os.path.join(FIXTURES, 'video_info.json'), YTDL_OPTIONS.copy(), args.video)
+
+    search_options = YTDL_OPTIONS.copy()
+    search_options['extract_flat'] = True
+    record(os.path.join(FIXTURES, 'search_flat.json'), search_options, f'ytsearch10:{args.query}')
+
+
+if __name__ == '__main__':
+    main()
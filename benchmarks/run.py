@@ -0,0 +1,376 @@
+"""
+Microbenchmarks for the hot paths around the queue and extraction.
+
+Every benchmark runs against bot.py as shipped, fed by the yt-dlp info dicts
+recorded in benchmarks/fixtures, so results are reproducible offline. Results
+are written as JSON and can be compared against a previous run to catch
+regressions between releases. Serialization and event-loop benchmarks run once
+per backend that is installed (json/orjson/msgspec, asyncio/uvloop), which is
+how the FAST_RUNTIME option is evaluated.
+
+Usage:
+    python benchmarks/run.py --output benchmarks/results/1.1.0.json
+    python benchmarks/run.py --compare benchmarks/results/1.1.0.json
+    python benchmarks/run.py --filter queue
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import bot as musicbot  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Register a setup function returning the callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class FixturePlayer:
+    """Carries the attributes MusicQueue reads from a YTDLSource, without FFmpeg"""
+
+    def __init__(self, data: dict, start_time: int = 0, playback_speed: float = 1.0):
+        self.track = musicbot.TrackInfo.from_info(data)
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.duration = data.get('duration')
+        self.start_time = start_time
+        self.playback_speed = playback_speed
+
+
+def make_queue(length: int) -> 'musicbot.MusicQueue':
+    info = load_fixture('video_info.json')
+    queue = musicbot.MusicQueue(guild_id=1)
+    for index in range(length):
+        queue.queue.append({
+            'player': FixturePlayer(info, start_time=index % 30),
+            'original_query': f"{info['webpage_url']}&i={index}",
+        })
+    queue.recount()
+    queue.current = {'player': FixturePlayer(info), 'original_query': info['webpage_url']}
+    queue.playback_start_time = time.time() - 42
+    return queue
+
+
+@benchmark('queue.add')
+def bench_queue_add():
+    info = load_fixture('video_info.json')
+    queue = musicbot.MusicQueue(guild_id=1)
+    queue.save_state = lambda: None
+    item = {'player': FixturePlayer(info), 'original_query': info['webpage_url']}
+
+    def run():
+        queue.add(item)
+        if len(queue.queue) > 500:
+            queue.queue.clear()
+            queue.recount()
+    return run
+
+
+@benchmark('queue.next')
+def bench_queue_next():
+    queue = make_queue(500)
+    items = list(queue.queue)
+
+    def run():
+        if not queue.queue:
+            queue.queue.extend(items)
+            queue.recount()
+        queue.next()
+    return run
+
+
+@benchmark('queue.to_dict[50]')
+def bench_queue_to_dict_50():
+    queue = make_queue(50)
+    return queue.to_dict
+
+
+@benchmark('queue.to_dict[500]')
+def bench_queue_to_dict_500():
+    queue = make_queue(500)
+    return queue.to_dict
+
+
+@benchmark('queue.render_page[5000]')
+def bench_queue_render_page():
+    queue = make_queue(5000)
+
+    def run():
+        queue.mark_changed()
+        queue.render_page(250)
+    return run
+
+
+@benchmark('queue.render_page[5000,cached]')
+def bench_queue_render_page_cached():
+    queue = make_queue(5000)
+    return lambda: queue.render_page(250)
+
+
+@benchmark('queue.save_state[50]')
+def bench_queue_save_state_50():
+    queue = make_queue(50)
+    return queue.save_state
+
+
+@benchmark('queue.save_state[500]')
+def bench_queue_save_state_500():
+    queue = make_queue(500)
+    return queue.save_state
+
+
+@benchmark('extract_start_time')
+def bench_extract_start_time():
+    urls = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=43',
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://youtu.be/dQw4w9WgXcQ?t=90',
+        'never gonna give you up',
+    ]
+
+    def run():
+        for url in urls:
+            musicbot.YTDLSource.extract_start_time(url)
+    return run
+
+
+@benchmark('classify_query')
+def bench_classify_query():
+    queries = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=43',
+        'https://youtu.be/dQw4w9WgXcQ?t=1m30s',
+        'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+        'https://cdn.example.com/audio/track.mp3',
+        'never gonna give you up',
+    ]
+
+    def run():
+        for query in queries:
+            musicbot.classify_query(query)
+    return run
+
+
+@benchmark('parse_time_input')
+def bench_parse_time_input():
+    values = ['90', '1:30', '1:30:45', ' 12:05 ']
+
+    def run():
+        for value in values:
+            musicbot.parse_time_input(value)
+    return run
+
+
+@benchmark('format_duration')
+def bench_format_duration():
+    values = [0, 59, 212, 3599, 3600, 5445, 86399]
+
+    def run():
+        for value in values:
+            musicbot.format_duration(value)
+    return run
+
+
+@benchmark('build_ffmpeg_options')
+def bench_build_ffmpeg_options():
+    cases = [(0, 1.0), (43, 1.0), (0, 1.25), (90, 0.75)]
+
+    def run():
+        for start_time, playback_speed in cases:
+            musicbot.YTDLSource.build_ffmpeg_options(start_time=start_time, playback_speed=playback_speed)
+    return run
+
+
+@benchmark('parse_search_entries')
+def bench_parse_search_entries():
+    data = load_fixture('search_flat.json')
+    return lambda: musicbot.parse_search_entries(data)
+
+
+@benchmark('voice_telemetry.record')
+def bench_voice_telemetry_record():
+    histogram = musicbot.LatencyHistogram()
+    samples = [0.00004, 0.0003, 0.0012, 0.004, 0.021]
+
+    def run():
+        for seconds in samples:
+            histogram.record(seconds)
+    return run
+
+
+def module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+JSON_CODECS = [name for name in ('json', 'orjson', 'msgspec') if name == 'json' or module_available(name)]
+EVENT_LOOPS = [name for name in ('asyncio', 'uvloop') if name == 'asyncio' or module_available(name)]
+
+
+def register_codec_benchmarks(codec_name: str):
+    @benchmark(f'state.dumps[500,{codec_name}]')
+    def bench_state_dumps():
+        codec = musicbot.JSONCodec(codec_name)
+        state = make_queue(500).to_dict()
+        return lambda: codec.dumps(state, indent=True)
+
+    @benchmark(f'state.loads[500,{codec_name}]')
+    def bench_state_loads():
+        codec = musicbot.JSONCodec(codec_name)
+        encoded = codec.dumps(make_queue(500).to_dict(), indent=True)
+        return lambda: codec.loads(encoded)
+
+
+def new_event_loop(kind: str):
+    if kind == 'uvloop':
+        import uvloop
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+async def loop_workload(callbacks: int = 1000, tasks: int = 100):
+    """Scheduler churn comparable to many guilds: call_soon callbacks, then short tasks"""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    remaining = [callbacks]
+
+    def tick():
+        remaining[0] -= 1
+        if not remaining[0]:
+            done.set_result(None)
+
+    for _ in range(callbacks):
+        loop.call_soon(tick)
+    await done
+    await asyncio.gather(*(asyncio.sleep(0) for _ in range(tasks)))
+
+
+def register_loop_benchmark(kind: str):
+    @benchmark(f'event_loop.churn[{kind}]')
+    def bench_event_loop():
+        loop = new_event_loop(kind)
+        return lambda: loop.run_until_complete(loop_workload())
+
+
+for _codec_name in JSON_CODECS:
+    register_codec_benchmarks(_codec_name)
+for _loop_kind in EVENT_LOOPS:
+    register_loop_benchmark(_loop_kind)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def measure(func, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    while number * repeat < 10 or timer.timeit(number) < min_time:
+        number *= 2
+        if number > 1 << 24:
+            break
+    samples = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_us': min(samples) * 1e6,
+        'median_us': statistics.median(samples) * 1e6,
+        'mean_us': statistics.fmean(samples) * 1e6,
+        'stdev_us': statistics.pstdev(samples) * 1e6,
+    }
+
+
+def run_benchmarks(names: list, repeat: int, min_time: float) -> dict:
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='musicologo-bench-')
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for name in names:
+            results[name] = measure(BENCHMARKS[name](), repeat, min_time)
+            print(f"{name:<28} {results[name]['min_us']:>12.3f} us", file=sys.stderr)
+    finally:
+        os.chdir(previous_cwd)
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in current.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"{name:<28} {'-':>12} {result['min_us']:>12.3f} {'new':>8}")
+            continue
+        ratio = result['min_us'] / previous['min_us'] if previous['min_us'] else float('inf')
+        flag = ' REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{name:<28} {previous['min_us']:>12.3f} {result['min_us']:>12.3f} {ratio:>7.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run musicologo microbenchmarks')
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds per timing sample')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a previous results JSON file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, args.repeat, args.min_time)
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results,
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get('benchmarks', {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
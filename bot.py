@@ -1,12 +1,28 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
+
+import abc
 import asyncio
+import audioop
+import bisect
+import hashlib
+import heapq
 import json
 import logging
 import os
+import random
 import re
-import time
+import socket
+import subprocess
+import sys
+import threading
+import tracemalloc
 import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, unquote, urlparse
 
 import aiohttp
 
@@ -14,10 +30,9 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-from openai import OpenAI
-
 from dotenv import load_dotenv
-import yt_dlp
+
+IMPORTS_FINISHED = time.perf_counter()
 
 
 load_dotenv()
@@ -35,17 +50,33 @@ logger = logging.getLogger('musicologo')
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 COMMAND_PREFIX = os.getenv('COMMAND_PREFIX', '!')
 
-if os.getenv('OPENAI_API_KEY'):
-    os.environ['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
-    openai_client = OpenAI()
-else:
-    openai_client = None
+COMMAND_TREE_HASH_FILE = os.getenv('COMMAND_TREE_HASH_FILE', 'command_tree.hash')
+
+openai_client = None
+
+
+def get_openai_client():
+    """Create the OpenAI client on first use so startup does not pay for the import"""
+    global openai_client
+    if openai_client is None and os.getenv('OPENAI_API_KEY'):
+        from openai import OpenAI
+        openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return openai_client
+
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
+
+
+class MusicCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        await before_app_command(interaction)
+        return True
+
+
+bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, tree_cls=MusicCommandTree)
 
 YTDL_OPTIONS = {
     'format': 'bestaudio/best',
@@ -63,76 +94,2170 @@ YTDL_OPTIONS = {
     'source_address': '0.0.0.0',
 }
 
-FFMPEG_OPTIONS = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn'
-}
+FFMPEG_OPTIONS = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn'
+}
+
+_ytdl = None
+
+
+def get_ytdl():
+    """Build the shared YoutubeDL instance on first use"""
+    global _ytdl
+    if _ytdl is None:
+        _ytdl = make_extractor(YTDL_OPTIONS)
+    return _ytdl
+
+
+EXTRACTOR_MODE = os.getenv('EXTRACTOR', 'yt-dlp').lower()
+EXTRACTOR_FIXTURES = os.getenv('EXTRACTOR_FIXTURES', 'fixtures/extractor')
+RECORD_AUDIO_SECONDS = int(os.getenv('RECORD_AUDIO_SECONDS', '0'))
+REPLAY_LATENCY = float(os.getenv('REPLAY_LATENCY', '0'))
+REPLAY_JITTER = float(os.getenv('REPLAY_JITTER', '0'))
+REPLAY_FAILURE_RATE = float(os.getenv('REPLAY_FAILURE_RATE', '0'))
+REPLAY_SEED = os.getenv('REPLAY_SEED')
+REPLAY_STRICT = os.getenv('REPLAY_STRICT', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+
+class FixtureStore:
+    """Recorded extract_info responses, one JSON file per (target, flat) pair.
+
+    A recording may come with a short audio snippet next to it; replays then point
+    the stream URL at that file so FFmpeg works without network as well.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(target: str, options: dict) -> str:
+        flat = options.get('extract_flat') or False
+        return hashlib.sha1(f'{flat}|{target}'.encode('utf-8')).hexdigest()[:20]
+
+    def path(self, key: str, extension: str = 'json') -> str:
+        return os.path.join(self.directory, f'{key}.{extension}')
+
+    def keys(self, options: dict) -> list:
+        """Recorded keys made with the same flat setting, in a stable order"""
+        flat = options.get('extract_flat') or False
+        found = []
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if name.endswith('.json'):
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    if json.load(f).get('flat', False) == flat:
+                        found.append(name[:-5])
+        return found
+
+    def save(self, target: str, options: dict, info: dict, snippet: Optional[str] = None, snippet_seconds: int = 0):
+        key = self.key(target, options)
+        record = {
+            'target': target,
+            'flat': options.get('extract_flat') or False,
+            'recorded_at': time.time(),
+            'snippet': snippet,
+            'snippet_seconds': snippet_seconds,
+            'info': info,
+        }
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path(key), 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=1, ensure_ascii=False)
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+class RecordingExtractor:
+    """Wraps YoutubeDL and stores every extract_info response (plus optional audio) in a FixtureStore"""
+
+    def __init__(self, ydl, options: dict, store: FixtureStore, audio_seconds: int = 0):
+        self.ydl = ydl
+        self.options = options
+        self.store = store
+        self.audio_seconds = audio_seconds
+
+    def __enter__(self):
+        self.ydl.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.ydl.__exit__(*exc_info)
+
+    def prepare_filename(self, data):
+        return self.ydl.prepare_filename(data)
+
+    def record_snippet(self, key: str, info: dict) -> Optional[str]:
+        """Cut the first audio_seconds of the stream into the store with FFmpeg"""
+        if not self.audio_seconds or not info.get('url') or info.get('is_live'):
+            return None
+        name = f'{key}.opus'
+        command = ['ffmpeg', '-y', '-v', 'error']
+        headers = ''.join(f'{k}: {v}\r\n' for k, v in (info.get('http_headers') or {}).items())
+        if headers:
+            command += ['-headers', headers]
+        command += ['-i', info['url'], '-t', str(self.audio_seconds), '-vn', '-c:a', 'libopus', self.store.path(key, 'opus')]
+        try:
+            os.makedirs(self.store.directory, exist_ok=True)
+            subprocess.run(command, check=True, capture_output=True, timeout=self.audio_seconds + 60)
+            return name
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f'Could not record audio snippet for {info.get("title")}: {e}')
+            return None
+
+    def extract_info(self, url, download=False, **kwargs):
+        info = self.ydl.sanitize_info(self.ydl.extract_info(url, download=download, **kwargs))
+        target = info['entries'][0] if 'entries' in info and not self.options.get('extract_flat') else info
+        key = self.store.key(url, self.options)
+        snippet = self.record_snippet(key, target)
+        self.store.save(url, self.options, info, snippet, self.audio_seconds if snippet else 0)
+        return info
+
+
+class ReplayExtractor:
+    """Answers extract_info from a FixtureStore, with simulated latency and failures.
+
+    Unrecorded targets raise LookupError, unless strict is off: then they are mapped
+    onto a recorded response by hash, so generated queries (load tests) still resolve.
+    """
+
+    def __init__(self, options: dict, store: FixtureStore, *, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed=None, strict: bool = True):
+        self.options = options
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fallback_keys = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def prepare_filename(self, data):
+        return data['url']
+
+    def fallback_key(self, url: str) -> Optional[str]:
+        if self._fallback_keys is None:
+            self._fallback_keys = self.store.keys(self.options)
+        if not self._fallback_keys:
+            return None
+        digest = int(hashlib.sha1(url.encode('utf-8')).hexdigest(), 16)
+        return self._fallback_keys[digest % len(self._fallback_keys)]
+
+    def extract_info(self, url, download=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.failure_rate and self.random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise RuntimeError(f'Simulated extraction failure for {url}')
+
+        record = self.store.load(self.store.key(url, self.options))
+        if record is None and not self.strict:
+            key = self.fallback_key(url)
+            record = self.store.load(key) if key else None
+        if record is None:
+            with self._lock:
+                self.misses += 1
+            raise LookupError(f'No recorded extractor response for {url}')
+
+        info = record['info']
+        if record.get('snippet'):
+            target = info['entries'][0] if 'entries' in info else info
+            target['url'] = os.path.abspath(os.path.join(self.store.directory, record['snippet']))
+            target['duration'] = record['snippet_seconds']
+            target.pop('http_headers', None)
+        return info
+
+
+fixture_store = FixtureStore(EXTRACTOR_FIXTURES)
+replay_extractors = {}
+
+
+def make_extractor(options: dict):
+    """A YoutubeDL for these options, or its record/replay stand-in per the EXTRACTOR setting"""
+    if EXTRACTOR_MODE == 'replay':
+        # Replays only differ by the flat setting; sharing one extractor per setting keeps a
+        # single seeded random sequence and scans the store for fallback keys only once
+        flat = options.get('extract_flat') or False
+        if flat not in replay_extractors:
+            replay_extractors[flat] = ReplayExtractor(
+                options, fixture_store,
+                latency=REPLAY_LATENCY, jitter=REPLAY_JITTER, failure_rate=REPLAY_FAILURE_RATE,
+                seed=REPLAY_SEED, strict=REPLAY_STRICT
+            )
+        return replay_extractors[flat]
+    import yt_dlp
+    ydl = yt_dlp.YoutubeDL(options)
+    if EXTRACTOR_MODE == 'record':
+        return RecordingExtractor(ydl, options, fixture_store, RECORD_AUDIO_SECONDS)
+    return ydl
+
+
+FAST_RUNTIME = os.getenv('FAST_RUNTIME', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+
+class JSONCodec:
+    """JSON encode/decode to and from bytes through stdlib json, orjson or msgspec"""
+
+    def __init__(self, name: str):
+        self.name = name
+        if name == 'orjson':
+            import orjson
+            options = orjson.OPT_NON_STR_KEYS
+            self._dumps = lambda obj, indent: orjson.dumps(obj, option=options | (orjson.OPT_INDENT_2 if indent else 0))
+            self.loads = orjson.loads
+        elif name == 'msgspec':
+            import msgspec
+            encoder = msgspec.json.Encoder()
+            self._dumps = lambda obj, indent: msgspec.json.format(encoder.encode(obj), indent=2) if indent else encoder.encode(obj)
+            self.loads = msgspec.json.decode
+        else:
+            self._dumps = lambda obj, indent: json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+            self.loads = json.loads
+
+    def dumps(self, obj, *, indent: bool = False) -> bytes:
+        return self._dumps(obj, indent)
+
+
+def select_json_codec(fast: bool) -> JSONCodec:
+    """orjson, then msgspec, when the fast runtime is on; stdlib json otherwise or as fallback"""
+    if fast:
+        for name in ('orjson', 'msgspec'):
+            try:
+                return JSONCodec(name)
+            except ImportError:
+                continue
+    return JSONCodec('json')
+
+
+def install_fast_event_loop() -> str:
+    """Make uvloop the event loop for bot.run when it is installed"""
+    try:
+        import uvloop
+    except ImportError:
+        return 'asyncio'
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return 'uvloop'
+
+
+json_codec = select_json_codec(FAST_RUNTIME)
+runtime_info = {'event_loop': 'asyncio', 'json': json_codec.name}
+
+
+MIN_PLAYBACK_SPEED = 0.5
+MAX_PLAYBACK_SPEED = 2.0
+PLAYBACK_SPEED_TOLERANCE = 0.005
+
+SEARCH_SESSION_TTL = 60
+SEARCH_SESSION_MAX_ENTRIES = 1000
+SEARCH_PREFETCH_COUNT = 3
+
+QUEUE_PAGE_SIZE = 10
+QUEUE_VIEW_TIMEOUT = 300
+QUEUE_TITLE_WIDTH = 80
+
+
+IDLE_TIMEOUTS = {
+    'alone': int(os.getenv('IDLE_ALONE_TIMEOUT', '300')),
+    'empty': int(os.getenv('IDLE_EMPTY_TIMEOUT', '600')),
+    'paused': int(os.getenv('IDLE_PAUSED_TIMEOUT', '1800')),
+}
+IDLE_CHECK_INTERVAL = 15
+LAZY_RESTORE_WAIT = 2.0
+LAZY_RESTORE_COMMANDS = {
+    'play', 'search', 'queue', 'nowplaying', 'pause', 'resume',
+    'skip', 'seek', 'forward', 'speed', 'volume',
+    'previous', 'replay', 'history', 'autoplay',
+}
+
+FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', '64'))
+FFMPEG_MAX_PROCESSES_PER_GUILD = int(os.getenv('FFMPEG_MAX_PROCESSES_PER_GUILD', '3'))
+FFMPEG_REAP_INTERVAL = 15
+FFMPEG_ORPHAN_GRACE = 10
+
+
+class FFmpegCapacityError(Exception):
+    pass
+
+
+class FFmpegSupervisor:
+    """Tracks every FFmpeg child by guild, enforces process caps and reaps orphans"""
+
+    def __init__(self, max_processes: int, max_per_guild: int):
+        self.max_processes = max_processes
+        self.max_per_guild = max_per_guild
+        self._sources = {}
+        self._lock = threading.Lock()
+        self.spawned_count = 0
+        self.reaped_count = 0
+        self.rejected_count = 0
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def guild_sources(self, guild_id: int) -> list:
+        with self._lock:
+            return [source for source in self._sources.values() if source.guild_id == guild_id]
+
+    @staticmethod
+    def is_live(source, live: set) -> bool:
+        """Whether a source is still needed, given the players from live_players()"""
+        if source.background:
+            # Analysis passes end on their own
+            return source.returncode is None
+        return getattr(source, 'owner', None) in live
+
+    def admit(self, source: 'SupervisedFFmpegSource', live: Optional[set] = None):
+        """Make room for a new process, evicting background work and orphans first.
+
+        live is a live_players() snapshot taken on the event loop. Without one (and for
+        background sources) nothing is evicted: the new process only gets a free slot.
+        """
+        while True:
+            with self._lock:
+                guild_sources = [s for s in self._sources.values() if s.guild_id == source.guild_id]
+                guild_full = len(guild_sources) >= self.max_per_guild
+                global_full = len(self._sources) >= self.max_processes
+                if not guild_full and not global_full:
+                    return
+            victims = []
+            if live is not None and not source.background:
+                candidates = guild_sources if guild_full else list(self._sources.values())
+                victims = [s for s in candidates if s.background or not self.is_live(s, live)]
+            if not victims:
+                break
+            victim = min(victims, key=lambda s: s.started_at)
+            logger.info(f'Killing idle FFmpeg process {victim.pid} of guild {victim.guild_id} to make room')
+            victim.cleanup()
+            with self._lock:
+                self.reaped_count += 1
+        with self._lock:
+            self.rejected_count += 1
+        raise FFmpegCapacityError(
+            f'Too many audio streams open (limit {self.max_per_guild} per server, {self.max_processes} total).'
+        )
+
+    def register(self, source: 'SupervisedFFmpegSource'):
+        with self._lock:
+            self._sources[id(source)] = source
+            self.spawned_count += 1
+
+    def unregister(self, source: 'SupervisedFFmpegSource'):
+        with self._lock:
+            self._sources.pop(id(source), None)
+
+    def reap(self, live: set) -> int:
+        """Clean up processes whose queue item is gone, once they exited or outlived the grace period.
+
+        A live source is never touched, even after FFmpeg exited: the playing track
+        still has the end of the song in its read buffer.
+        """
+        now = time.time()
+        with self._lock:
+            sources = list(self._sources.values())
+        reaped = 0
+        for source in sources:
+            if self.is_live(source, live):
+                continue
+            exited = source.returncode is not None
+            orphaned = now - source.started_at > FFMPEG_ORPHAN_GRACE
+            if exited or orphaned:
+                if orphaned and not exited:
+                    logger.info(f'Reaping orphaned FFmpeg process {source.pid} of guild {source.guild_id}')
+                source.cleanup()
+                reaped += 1
+        with self._lock:
+            self.reaped_count += reaped
+        return reaped
+
+    def snapshot(self, guild_id: Optional[int] = None) -> list:
+        """Process count, RSS and CPU usage per FFmpeg child (Linux /proc only)"""
+        with self._lock:
+            sources = list(self._sources.values())
+        rows = []
+        for source in sources:
+            if guild_id is not None and source.guild_id != guild_id:
+                continue
+            rss_bytes, cpu_seconds = read_process_usage(source.pid)
+            age = max(time.time() - source.started_at, 1e-6)
+            rows.append({
+                'pid': source.pid,
+                'guild_id': source.guild_id,
+                'age': age,
+                'rss_bytes': rss_bytes,
+                'cpu_seconds': cpu_seconds,
+                'cpu_percent': None if cpu_seconds is None else 100 * cpu_seconds / age,
+            })
+        return rows
+
+
+def read_process_usage(pid: Optional[int]) -> tuple:
+    """Return (rss_bytes, cpu_seconds) for a process, or (None, None) if unavailable"""
+    if not pid:
+        return None, None
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            rss_pages = int(f.read().split()[1])
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])
+        return rss_pages * os.sysconf('SC_PAGE_SIZE'), ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None, None
+
+
+ffmpeg_supervisor = FFmpegSupervisor(FFMPEG_MAX_PROCESSES, FFMPEG_MAX_PROCESSES_PER_GUILD)
+
+
+class SupervisedFFmpegSource(discord.AudioSource):
+    """FFmpeg PCM source whose process is spawned by start(), normally from YTDLSource.prepare()"""
+
+    background = False
+
+    def __init__(self, source, *, guild_id: Optional[int], **ffmpeg_options):
+        self.source = source
+        self.guild_id = guild_id
+        self.ffmpeg_options = ffmpeg_options
+        self.started_at = None
+        self._audio = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self) -> Optional[int]:
+        process = getattr(self._audio, '_process', None)
+        return getattr(process, 'pid', None)
+
+    @property
+    def returncode(self) -> Optional[int]:
+        process = getattr(self._audio, '_process', None)
+        return process.poll() if process else None
+
+    def start(self, live: Optional[set] = None):
+        """Spawn FFmpeg; only with a live snapshot from the event loop may this evict other processes"""
+        with self._lock:
+            if self._audio is not None or self._closed:
+                return self._audio
+        # Outside our lock: admit may clean up other sources
+        ffmpeg_supervisor.admit(self, live)
+        with self._lock:
+            if self._audio is None and not self._closed:
+                self._audio = discord.FFmpegPCMAudio(self.source, **self.ffmpeg_options)
+                self.started_at = time.time()
+                ffmpeg_supervisor.register(self)
+            return self._audio
+
+    def read(self) -> bytes:
+        # Fallback for a player that was never prepared: take a free slot, evict nothing
+        audio = self._audio or self.start()
+        return audio.read() if audio else b''
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        with self._lock:
+            self._closed = True
+            audio, self._audio = self._audio, None
+        if audio is not None:
+            audio.cleanup()
+            ffmpeg_supervisor.unregister(self)
+
+
+TRACK_METADATA_FILE = os.getenv('TRACK_METADATA_FILE', 'track_metadata.json')
+LOUDNESS_NORMALIZATION = os.getenv('LOUDNESS_NORMALIZATION', 'true').lower() in ('1', 'true', 'yes')
+LOUDNESS_TARGET_LUFS = float(os.getenv('LOUDNESS_TARGET_LUFS', '-14'))
+LOUDNESS_MAX_BOOST_DB = 10.0
+LOUDNESS_MAX_CUT_DB = 20.0
+LOUDNESS_MIN_GAIN_DB = 0.1
+LOUDNESS_TRUE_PEAK_CEILING_DB = -1.0
+LOUDNESS_ANALYSIS_MAX_SECONDS = 900
+LOUDNESS_ANALYSIS_CONCURRENCY = int(os.getenv('LOUDNESS_ANALYSIS_CONCURRENCY', '1'))
+
+
+class TrackMetadataCache:
+    """Per-video metadata that outlives a single play, persisted as JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                if os.path.exists(self.path):
+                    with open(self.path, 'rb') as f:
+                        self._entries = json_codec.loads(f.read())
+            except Exception as e:
+                logger.error(f'Failed to load track metadata cache: {e}')
+        return self._entries
+
+    def get(self, video_id: str) -> Optional[dict]:
+        return self._load().get(video_id)
+
+    def update(self, video_id: str, **fields):
+        entries = self._load()
+        entries.setdefault(video_id, {}).update(fields)
+        self.save()
+
+    def save(self):
+        try:
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(json_codec.dumps(self._load()))
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f'Failed to save track metadata cache: {e}')
+
+
+track_metadata = TrackMetadataCache(TRACK_METADATA_FILE)
+loudness_pending = set()
+_loudness_semaphore = None
+LOUDNESS_PATTERN = re.compile(r'Integrated loudness:\s+I:\s+(-?[\d.]+|-inf) LUFS')
+TRUE_PEAK_PATTERN = re.compile(r'True peak:\s+Peak:\s+(-?[\d.]+|-inf) dBFS')
+
+
+def loudness_gain_db(integrated_lufs: float, true_peak_dbfs: Optional[float] = None) -> float:
+    gain = LOUDNESS_TARGET_LUFS - integrated_lufs
+    gain = max(-LOUDNESS_MAX_CUT_DB, min(LOUDNESS_MAX_BOOST_DB, gain))
+    if gain > 0 and true_peak_dbfs is not None:
+        # Never boost the loudest peak past the ceiling; the volume filter would clip it
+        gain = max(0.0, min(gain, LOUDNESS_TRUE_PEAK_CEILING_DB - true_peak_dbfs))
+    return gain
+
+
+class LoudnessProbe:
+    """One EBU R128 analysis pass, tracked by the FFmpeg supervisor like a playback process.
+
+    It counts against the same caps and shows up in !processes, but is background work:
+    playback that needs its slot kills it, and it only ever takes a free slot itself.
+    """
+
+    background = True
+
+    def __init__(self, source: str, *, guild_id: Optional[int], local: bool = False):
+        self.source = source
+        self.guild_id = guild_id
+        self.local = local
+        self.started_at = None
+        self._process = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode if self._process else None
+
+    async def run(self) -> Optional[tuple]:
+        """(integrated LUFS, true peak dBFS or None), or None when the pass failed or was killed"""
+        ffmpeg_supervisor.admit(self)
+        args = [
+            'ffmpeg', '-nostdin', '-hide_banner', '-nostats',
+            # Same rule as YTDLSource.build_ffmpeg_options: reconnect flags are for HTTP only
+            *([] if self.local else FFMPEG_OPTIONS['before_options'].split()),
+            '-t', str(LOUDNESS_ANALYSIS_MAX_SECONDS),
+            '-i', self.source, '-vn', '-af', 'ebur128=framelog=quiet:peak=true', '-f', 'null', '-',
+        ]
+        self._process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=(lambda: os.nice(10)) if hasattr(os, 'nice') else None
+        )
+        self.started_at = time.time()
+        ffmpeg_supervisor.register(self)
+        try:
+            _, stderr = await self._process.communicate()
+        finally:
+            ffmpeg_supervisor.unregister(self)
+        output = stderr.decode('utf-8', 'replace')
+        matches = LOUDNESS_PATTERN.findall(output)
+        if self._process.returncode != 0 or not matches or matches[-1] == '-inf':
+            return None
+        peaks = TRUE_PEAK_PATTERN.findall(output)
+        true_peak = float(peaks[-1]) if peaks and peaks[-1] != '-inf' else None
+        return float(matches[-1]), true_peak
+
+    def cleanup(self):
+        if self._process is not None and self._process.returncode is None:
+            try:
+                self._process.kill()
+            except ProcessLookupError:
+                pass
+        ffmpeg_supervisor.unregister(self)
+
+
+async def analyze_track_loudness(video_id: str, source: str, guild_id: Optional[int], local: bool = False):
+    global _loudness_semaphore
+    if _loudness_semaphore is None:
+        _loudness_semaphore = asyncio.Semaphore(LOUDNESS_ANALYSIS_CONCURRENCY)
+    try:
+        async with _loudness_semaphore:
+            measured = await LoudnessProbe(source, guild_id=guild_id, local=local).run()
+        if measured is None:
+            logger.info(f'Could not measure loudness for {video_id}')
+            return
+        loudness, true_peak = measured
+        gain = loudness_gain_db(loudness, true_peak)
+        track_metadata.update(video_id, loudness_lufs=loudness, true_peak_dbfs=true_peak, gain_db=round(gain, 2))
+        logger.info(f'Measured {video_id} at {loudness:.1f} LUFS, gain {gain:+.1f} dB')
+    except FFmpegCapacityError as e:
+        logger.info(f'Not measuring loudness for {video_id}: {e}')
+    except Exception as e:
+        logger.error(f'Loudness analysis failed for {video_id}: {e}')
+    finally:
+        loudness_pending.discard(video_id)
+
+
+def track_gain_db(track: 'TrackInfo') -> Optional[float]:
+    """Normalization gain measured on an earlier play, if any"""
+    if not LOUDNESS_NORMALIZATION or not track.id or track.is_live:
+        return None
+    cached = track_metadata.get(track.id)
+    if not cached or 'gain_db' not in cached:
+        return None
+    if cached['gain_db'] > 0 and 'true_peak_dbfs' not in cached:
+        # Boost measured before peaks were checked; play it flat until it is measured again
+        return None
+    return cached['gain_db']
+
+
+def schedule_loudness_analysis(player):
+    """Measure a track that has started playing, once, in the background"""
+    track = getattr(player, 'track', None)
+    if track is None or not LOUDNESS_NORMALIZATION or not track.id or track.is_live:
+        return
+    if track.id in loudness_pending or track_gain_db(track) is not None:
+        return
+    loudness_pending.add(track.id)
+    asyncio.get_running_loop().create_task(
+        analyze_track_loudness(track.id, player.url, player.guild_id, local=os.path.isfile(player.url))
+    )
+
+
+AUDIO_FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+AUDIO_BUFFER_FRAMES = int(os.getenv('AUDIO_BUFFER_FRAMES', '50'))
+
+
+class BufferedAudioSource(discord.AudioSource):
+    """Read-ahead ring buffer over another PCM source, filled by a background thread.
+
+    The ring is allocated once, when the source starts (queued tracks hold no buffer);
+    read() hands out a memoryview of the slot, which stays valid until the next read()
+    call. Wrap it in PCMVolumeTransformer (which copies) before giving it to a voice
+    client.
+    """
+
+    def __init__(self, original, *, frames: int = AUDIO_BUFFER_FRAMES, frame_size: int = AUDIO_FRAME_SIZE):
+        self.original = original
+        self.capacity = frames
+        self.frame_size = frame_size
+        self._buffer = None
+        self._slots = None
+        self._head = 0
+        self._tail = 0
+        self._count = 0
+        self._held = False
+        self._eof = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.frames_read = 0
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.error = None
+
+    @property
+    def depth(self) -> int:
+        """Frames buffered ahead of the consumer"""
+        return self._count - (1 if self._held else 0)
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            start_original = getattr(self.original, 'start', None)
+            if start_original:
+                start_original()
+            frame_size = self.frame_size
+            self._buffer = bytearray(self.capacity * frame_size)
+            view = memoryview(self._buffer)
+            self._slots = [view[i * frame_size:(i + 1) * frame_size] for i in range(self.capacity)]
+            self._thread = threading.Thread(target=self._fill, name='audio-read-ahead', daemon=True)
+            self._thread.start()
+
+    def _fill(self):
+        frame_size = self.frame_size
+        slots = self._slots
+        try:
+            while True:
+                with self._cond:
+                    while self._count >= self.capacity and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    tail = self._tail
+                data = self.original.read()
+                if len(data) != frame_size:
+                    break
+                # The tail slot is free until it is published below, so copy outside the lock
+                slots[tail][:] = data
+                with self._cond:
+                    self._tail = (tail + 1) % self.capacity
+                    self._count += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            # cleanup() closes the inner source under a read in progress; that is just the end
+            if not self._closed:
+                self.error = e
+                logger.error(f'Audio read-ahead failed: {e}')
+        finally:
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def read(self):
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            if self._held:
+                self._head = (self._head + 1) % self.capacity
+                self._count -= 1
+                self._held = False
+                self._cond.notify_all()
+            if self._count == 0 and not self._eof:
+                if self.frames_read:
+                    self.underruns += 1
+                started = time.perf_counter()
+                while self._count == 0 and not self._eof and not self._closed:
+                    self._cond.wait()
+                if self.frames_read:
+                    self.underrun_seconds += time.perf_counter() - started
+            if self._count == 0 or self._closed:
+                return b''
+            self._held = True
+            self.frames_read += 1
+            return self._slots[self._head]
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.original.cleanup()
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'capacity': self.capacity,
+            'frames_read': self.frames_read,
+            'underruns': self.underruns,
+            'underrun_seconds': self.underrun_seconds,
+        }
+
+
+def stream_url_expiry(url: str) -> Optional[float]:
+    """Expiry timestamp signed into a stream URL (googlevideo uses expire=), if any"""
+    try:
+        parsed = urlparse(url)
+        expire = parse_qs(parsed.query).get('expire')
+        if expire:
+            return float(expire[0])
+        match = re.search(r'/expire/(\d+)', parsed.path)
+        if match:
+            return float(match.group(1))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class TrackInfo:
+    """The few fields of a yt-dlp info dict that playback uses.
+
+    extract_info returns formats, thumbnails, subtitles and headers as well, often
+    hundreds of KB per video; players keep this instead so queued tracks stay small.
+    """
+
+    __slots__ = ('id', 'title', 'duration', 'url', 'webpage_url', 'is_live', 'expires_at')
+
+    def __init__(self, *, id=None, title=None, duration=None, url=None, webpage_url=None, is_live=False):
+        self.id = id
+        self.title = title
+        self.duration = duration
+        self.url = url
+        self.webpage_url = webpage_url
+        self.is_live = is_live
+        self.expires_at = stream_url_expiry(url) if url else None
+
+    @classmethod
+    def from_info(cls, data: dict) -> 'TrackInfo':
+        return cls(
+            id=data.get('id'),
+            title=data.get('title'),
+            duration=data.get('duration'),
+            url=data.get('url'),
+            webpage_url=data.get('webpage_url'),
+            is_live=bool(data.get('is_live')),
+        )
+
+
+YOUTUBE_HOSTS = {
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+}
+YOUTUBE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_PATH_PREFIXES = ('/shorts/', '/live/', '/embed/', '/v/', '/e/')
+DIRECT_AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.wav', '.flac', '.webm', '.mka')
+TIMESTAMP_PATTERN = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$')
+RESOLVE_CACHE_SIZE = 256
+
+
+def parse_timestamp(value: str) -> int:
+    """Seconds from a t=/start= value: 90, 90s, 1m30s, 1h2m3s or 1:30"""
+    value = value.strip().lower()
+    if ':' in value:
+        try:
+            return parse_time_input(value)
+        except ValueError:
+            return 0
+    match = TIMESTAMP_PATTERN.match(value)
+    if not match or not value:
+        return 0
+    hours, minutes, seconds = (int(part) if part else 0 for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """Video ID from any YouTube URL form (watch, youtu.be, shorts, live, embed, music)"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    host = (parsed.hostname or '').lower()
+    candidate = None
+    if host == 'youtu.be':
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == '/watch':
+            candidate = parse_qs(parsed.query).get('v', [None])[0]
+        else:
+            for prefix in YOUTUBE_PATH_PREFIXES:
+                if parsed.path.startswith(prefix):
+                    candidate = parsed.path[len(prefix):].split('/')[0]
+                    break
+    if candidate and YOUTUBE_ID_PATTERN.match(candidate):
+        return candidate
+    return None
+
+
+def classify_query(query: str) -> dict:
+    """Decide how a play query is resolved before anything reaches yt-dlp.
+
+    kind is 'youtube' (video ID known, canonical watch URL as target and cache key),
+    'direct' (an audio file URL FFmpeg can open itself), 'url' (any other link, left
+    to yt-dlp's extractors) or 'search' (free text, sent as an explicit ytsearch1:).
+    """
+    query = query.strip()
+    video_id = youtube_video_id(query)
+    if video_id:
+        return {
+            'kind': 'youtube',
+            'video_id': video_id,
+            'target': f'https://www.youtube.com/watch?v={video_id}',
+            'cache_key': f'youtube:{video_id}',
+        }
+    parsed = urlparse(query)
+    if parsed.scheme in ('http', 'https') and parsed.netloc:
+        if parsed.path.lower().endswith(DIRECT_AUDIO_EXTENSIONS):
+            return {'kind': 'direct', 'video_id': None, 'target': query, 'cache_key': None}
+        return {'kind': 'url', 'video_id': None, 'target': query, 'cache_key': None}
+    return {'kind': 'search', 'video_id': None, 'target': f'ytsearch1:{query}', 'cache_key': None}
+
+
+def direct_audio_info(url: str) -> dict:
+    """Info dict for a plain audio URL, so FFmpeg plays it without any extraction"""
+    name = os.path.basename(urlparse(url).path)
+    return {
+        'id': None,
+        'title': unquote(name) or url,
+        'duration': None,
+        'url': url,
+        'webpage_url': url,
+    }
+
+
+class ResolveCache:
+    """Slim info dicts for recently resolved videos, keyed by canonical video ID"""
+
+    def __init__(self, max_entries: int = RESOLVE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        info = self._entries.get(key)
+        if info is not None:
+            expires_at = stream_url_expiry(info['url']) or info['cached_at'] + STREAM_URL_FALLBACK_TTL
+            # Anything the URL refresher would consider due is not worth handing out
+            if expires_at - URL_REFRESH_LEAD - STREAM_URL_MARGIN > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {key: value for key, value in info.items() if key != 'cached_at'}
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, data: dict):
+        if data.get('is_live') or not data.get('url'):
+            return
+        self._entries[key] = {
+            'id': data.get('id'),
+            'title': data.get('title'),
+            'duration': data.get('duration'),
+            'url': data['url'],
+            'webpage_url': data.get('webpage_url'),
+            'cached_at': time.time(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+resolve_cache = ResolveCache()
+
+
+LIBRARY_DIR = os.getenv('LIBRARY_DIR')
+LIBRARY_INDEX_FILE = os.getenv('LIBRARY_INDEX_FILE', 'library_index.json')
+LIBRARY_RESCAN_INTERVAL = int(os.getenv('LIBRARY_RESCAN_INTERVAL', '300'))
+LIBRARY_PLAY_THRESHOLD = 0.6
+LIBRARY_SEARCH_THRESHOLD = 0.45
+
+
+class SourceBackend(abc.ABC):
+    """Somewhere tracks can come from.
+
+    resolve() returns a yt-dlp style info dict (at least title and a url FFmpeg can
+    open), or None to let the next backend try; search() returns entries shaped like
+    parse_search_entries() output.
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    async def resolve(self, url: str, query: dict, *, loop, stream: bool = True, fresh: bool = False) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def search(self, text: str, max_results: int) -> list:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class YouTubeBackend(SourceBackend):
+    """yt-dlp extraction, with the resolve cache in front for YouTube videos"""
+
+    name = 'youtube'
+
+    async def resolve(self, url, query, *, loop, stream=True, fresh=False):
+        if stream and not fresh and query['cache_key']:
+            cached = resolve_cache.get(query['cache_key'])
+            if cached is not None:
+                return cached
+
+        ytdl = get_ytdl()
+        target = query['target'] if stream else url
+        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(target, download=not stream))
+
+        if 'entries' in data:
+            data = data['entries'][0]
+        if stream and data.get('id') and data.get('extractor_key', 'Youtube') == 'Youtube':
+            resolve_cache.put(f"youtube:{data['id']}", data)
+        return data
+
+    async def search(self, text, max_results):
+        return await search_youtube(text, max_results=max_results)
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(re.sub(r'[\W_]+', ' ', text.lower()).split())
+
+
+def text_trigrams(text: str) -> set:
+    padded = f'  {normalize_text(text)} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def probe_audio_file(path: str) -> dict:
+    """Title, artist, album and duration of a local file, via mutagen or ffprobe when available"""
+    tags = {'title': None, 'artist': None, 'album': None, 'duration': None}
+    try:
+        import mutagen
+        audio = mutagen.File(path, easy=True)
+        if audio is not None:
+            for key in ('title', 'artist', 'album'):
+                values = audio.get(key) if audio.tags is not None else None
+                tags[key] = values[0] if values else None
+            tags['duration'] = int(audio.info.length) if getattr(audio, 'info', None) else None
+            return tags
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.debug(f'mutagen could not read {path}: {e}')
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration:format_tags=title,artist,album',
+             '-of', 'json', path],
+            capture_output=True, text=True, timeout=10
+        )
+        probed = json.loads(result.stdout or '{}').get('format', {})
+        for key, value in probed.get('tags', {}).items():
+            if key.lower() in tags:
+                tags[key.lower()] = value
+        if probed.get('duration'):
+            tags['duration'] = int(float(probed['duration']))
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.debug(f'ffprobe could not read {path}: {e}')
+    return tags
+
+
+class LocalLibraryBackend(SourceBackend):
+    """Audio files under LIBRARY_DIR, answered from an index without touching the network.
+
+    The index (path, size, mtime, tags, duration) is persisted to LIBRARY_INDEX_FILE and
+    kept current by rescans that only probe new or modified files. Titles are matched
+    through an in-memory trigram index rebuilt from those entries.
+    """
+
+    name = 'library'
+
+    def __init__(self, directory: str, index_path: str):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.index_path = index_path
+        self.entries = {}
+        self._postings = {}
+        self._doc_trigrams = {}
+        self._loaded = False
+        self.last_scan = None
+        self.last_scan_seconds = None
+
+    @staticmethod
+    def display_title(entry: dict) -> str:
+        title = entry.get('title') or os.path.splitext(os.path.basename(entry['path']))[0]
+        return f"{entry['artist']} - {title}" if entry.get('artist') else title
+
+    def _index_entry(self, entry: dict):
+        path = entry['path']
+        words = ' '.join(filter(None, (
+            self.display_title(entry), entry.get('album'), os.path.splitext(os.path.basename(path))[0]
+        )))
+        trigrams = text_trigrams(words)
+        self._doc_trigrams[path] = trigrams
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, set()).add(path)
+
+    def _unindex_entry(self, path: str):
+        for trigram in self._doc_trigrams.pop(path, ()):
+            postings = self._postings.get(trigram)
+            if postings is not None:
+                postings.discard(path)
+                if not postings:
+                    del self._postings[trigram]
+
+    def load(self):
+        """Read the persisted index once; later changes arrive through refresh()"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'rb') as f:
+                    saved = json_codec.loads(f.read())
+                if saved.get('directory') == self.directory:
+                    self.entries = {entry['path']: entry for entry in saved.get('entries', [])}
+        except Exception as e:
+            logger.error(f'Failed to load library index: {e}')
+        for entry in self.entries.values():
+            self._index_entry(entry)
+
+    def save(self):
+        try:
+            temp_path = f'{self.index_path}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(json_codec.dumps({'directory': self.directory, 'entries': list(self.entries.values())}))
+            os.replace(temp_path, self.index_path)
+        except Exception as e:
+            logger.error(f'Failed to save library index: {e}')
+
+    def _scan_changes(self, known: dict) -> tuple:
+        """Walk the directory (in a worker thread) and probe only new or modified files"""
+        changed, seen = [], set()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.lower().endswith(DIRECT_AUDIO_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                previous = known.get(path)
+                if previous and previous['mtime'] == stat.st_mtime and previous['size'] == stat.st_size:
+                    continue
+                changed.append({
+                    'path': path,
+                    'id': 'local:' + hashlib.sha1(path.encode('utf-8')).hexdigest()[:16],
+                    'mtime': stat.st_mtime,
+                    'size': stat.st_size,
+                    **probe_audio_file(path),
+                })
+        removed = [path for path in known if path not in seen]
+        return changed, removed
+
+    async def refresh(self) -> tuple:
+        """Bring the index up to date with the directory; returns (changed, removed) counts"""
+        self.load()
+        started = time.perf_counter()
+        known = {path: {'mtime': entry['mtime'], 'size': entry['size']} for path, entry in self.entries.items()}
+        loop = asyncio.get_running_loop()
+        changed, removed = await loop.run_in_executor(None, self._scan_changes, known)
+        for path in removed:
+            self._unindex_entry(path)
+            self.entries.pop(path, None)
+        for entry in changed:
+            self._unindex_entry(entry['path'])
+            self.entries[entry['path']] = entry
+            self._index_entry(entry)
+        if changed or removed:
+            self.save()
+        self.last_scan = time.time()
+        self.last_scan_seconds = time.perf_counter() - started
+        return len(changed), len(removed)
+
+    def match(self, text: str, limit: int = 10, threshold: float = LIBRARY_SEARCH_THRESHOLD) -> list:
+        """(score, entry) pairs, best first; the score mixes trigram Dice similarity and query coverage"""
+        self.load()
+        query_trigrams = text_trigrams(text)
+        if not query_trigrams:
+            return []
+        shared = {}
+        for trigram in query_trigrams:
+            for path in self._postings.get(trigram, ()):
+                shared[path] = shared.get(path, 0) + 1
+        scored = []
+        for path, count in shared.items():
+            dice = 2 * count / (len(query_trigrams) + len(self._doc_trigrams[path]))
+            score = (dice + count / len(query_trigrams)) / 2
+            if score >= threshold:
+                scored.append((score, self.entries[path]))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:limit]
+
+    def info(self, entry: dict) -> dict:
+        return {
+            'id': entry['id'],
+            'title': self.display_title(entry),
+            'duration': entry.get('duration'),
+            'url': entry['path'],
+            'webpage_url': None,
+            'extractor_key': 'Local',
+        }
+
+    async def resolve(self, url, query, *, loop, stream=True, fresh=False):
+        if query['kind'] != 'search' or not stream:
+            return None
+        self.load()
+        entry = self.entries.get(url)
+        if entry is None:
+            matches = self.match(url, limit=1, threshold=LIBRARY_PLAY_THRESHOLD)
+            entry = matches[0][1] if matches else None
+        return self.info(entry) if entry else None
+
+    async def search(self, text, max_results):
+        return [{
+            'title': self.display_title(entry),
+            'url': entry['path'],
+            'duration': entry.get('duration') or 0,
+            'channel': entry.get('artist') or 'Local library',
+            'id': entry['id'],
+            'source': self.name,
+        } for _, entry in self.match(text, limit=max_results)]
+
+    def stats(self) -> dict:
+        return {'tracks': len(self.entries), 'last_scan_seconds': self.last_scan_seconds}
+
+
+library_backend = LocalLibraryBackend(LIBRARY_DIR, LIBRARY_INDEX_FILE) if LIBRARY_DIR else None
+source_backends = [backend for backend in (library_backend, YouTubeBackend()) if backend is not None]
+
+
+async def search_sources(query: str, max_results: int = 10) -> list:
+    """Search the backends in order and return the first non-empty result list"""
+    for backend in source_backends:
+        results = await backend.search(query, max_results)
+        if results:
+            return results
+    return []
+
+
+class YTDLSource(discord.PCMVolumeTransformer):
+    def __init__(self, source, *, track: TrackInfo, volume=0.69, start_time=0, playback_speed=1.0, guild_id=None):
+        super().__init__(source, volume)
+        self.guild_id = guild_id
+        inner = source
+        while isinstance(inner, discord.AudioSource):
+            inner.owner = self
+            inner = getattr(inner, 'original', None)
+        self.track = track
+        self.title = track.title
+        self.url = track.url
+        self.duration = track.duration
+        self.start_time = start_time
+        self.playback_speed = playback_speed
+        self.refresh_attempted_at = 0.0
+
+    @classmethod
+    async def resolve(cls, url, *, loop=None, stream=True, fresh=False) -> dict:
+        """Resolve a URL or query without starting FFmpeg.
+
+        Direct audio URLs skip every backend; anything else goes to source_backends in
+        order (the local library first when configured, YouTube last). fresh=True skips
+        cached stream URLs (used when refreshing or recovering a stream).
+        """
+        query = classify_query(url)
+        if stream and query['kind'] == 'direct':
+            return direct_audio_info(query['target'])
+
+        loop = loop or asyncio.get_event_loop()
+        for backend in source_backends:
+            data = await backend.resolve(url, query, loop=loop, stream=stream, fresh=fresh)
+            if data is not None:
+                return data
+        raise ValueError(f'No source could resolve {url}')
+
+    @classmethod
+    async def from_url(
+        cls,
+        url,
+        *,
+        loop=None,
+        stream=True,
+        start_time=0,
+        playback_speed=1.0,
+        data=None,
+        guild_id=None
+    ):
+        if data is None:
+            data = await cls.resolve(url, loop=loop, stream=stream)
+        ytdl = get_ytdl()
+
+        filename = data['url'] if stream else ytdl.prepare_filename(data)
+        track = TrackInfo.from_info(data)
+        gain_db = track_gain_db(track)
+        ffmpeg_options = cls.build_ffmpeg_options(
+            start_time=start_time,
+            playback_speed=playback_speed,
+            gain_db=gain_db,
+            local=os.path.isfile(filename)
+        )
+        source = SupervisedFFmpegSource(filename, guild_id=guild_id, **ffmpeg_options)
+        if AUDIO_BUFFER_FRAMES > 0:
+            source = BufferedAudioSource(source)
+
+        return cls(
+            source,
+            track=track,
+            start_time=start_time,
+            playback_speed=playback_speed,
+            guild_id=guild_id
+        )
+
+    def read(self) -> bytes:
+        telemetry = voice_telemetry.get(self.guild_id)
+        if telemetry is None or not telemetry.sample_volume():
+            return super().read()
+        ret = self.original.read()
+        started = time.perf_counter()
+        frame = audioop.mul(ret, 2, min(self.volume, 2.0))
+        telemetry.volume.record(time.perf_counter() - started)
+        return frame
+
+    def ffmpeg_source(self) -> Optional[SupervisedFFmpegSource]:
+        inner = self.original
+        while inner is not None:
+            if isinstance(inner, SupervisedFFmpegSource):
+                return inner
+            inner = getattr(inner, 'original', None)
+        return None
+
+    def prepare(self):
+        """Spawn FFmpeg and fill the read-ahead buffer so the track starts without delay.
+
+        Call on the event loop: making room may evict processes no live player needs.
+        """
+        ffmpeg = self.ffmpeg_source()
+        if ffmpeg is not None:
+            ffmpeg.start(live_players())
+        self.original.start()
+
+    @property
+    def started(self) -> bool:
+        """Whether FFmpeg has been spawned for this player"""
+        ffmpeg = self.ffmpeg_source()
+        return ffmpeg is not None and ffmpeg.started_at is not None
+
+    def buffer_stats(self) -> Optional[dict]:
+        if isinstance(self.original, BufferedAudioSource):
+            return self.original.stats()
+        return None
+
+    @staticmethod
+    def build_ffmpeg_options(*, start_time=0, playback_speed=1.0, gain_db=None, local=False) -> dict:
+        """Build FFmpeg arguments for seeking, loudness gain and tempo changes"""
+        ffmpeg_options = FFMPEG_OPTIONS.copy()
+        if local:
+            # The reconnect flags are HTTP protocol options; FFmpeg rejects them for plain files
+            ffmpeg_options.pop('before_options', None)
+        if start_time > 0:
+            ffmpeg_options['before_options'] = f'-ss {start_time} ' + ffmpeg_options.get('before_options', '')
+        filters = []
+        if gain_db is not None and abs(gain_db) >= LOUDNESS_MIN_GAIN_DB:
+            filters.append(f'volume={gain_db:.2f}dB')
+        if abs(playback_speed - 1.0) > PLAYBACK_SPEED_TOLERANCE:
+            speed_value = f'{playback_speed:.3f}'.rstrip('0').rstrip('.')
+            filters.append(f'atempo={speed_value}')
+        if filters:
+            options = ffmpeg_options.get('options', '').strip()
+            ffmpeg_options['options'] = f"{options} -af {','.join(filters)}".strip()
+        return ffmpeg_options
+
+    @classmethod
+    def extract_start_time(cls, url: str) -> int:
+        """Extract start time from a YouTube URL's t/start parameter or #t= fragment (in seconds)"""
+        try:
+            parsed_url = urlparse(url)
+            query_params = parse_qs(parsed_url.query)
+            fragment_params = parse_qs(parsed_url.fragment)
+            
+            for params in (query_params, fragment_params):
+                for name in ('t', 'start'):
+                    if name in params:
+                        return parse_timestamp(params[name][0])
+        except:
+            pass
+        return 0
+
+
+CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', '0'))
+MAX_CROSSFADE_SECONDS = 12.0
+FRAME_SECONDS = 0.02
+
+playback_stats = {'sessions': 0, 'transitions': 0, 'crossfades': 0, 'stall_seconds': 0.0}
+
+VOICE_TELEMETRY_SAMPLE = int(os.getenv('VOICE_TELEMETRY_SAMPLE', '10'))
+VOICE_TELEMETRY_LOG_INTERVAL = int(os.getenv('VOICE_TELEMETRY_LOG_INTERVAL', '300'))
+TELEMETRY_BUCKETS_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 40000, 80000)
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets in microseconds; recording is one bisect and a few adds"""
+
+    __slots__ = ('counts', 'count', 'total_us', 'max_us')
+
+    def __init__(self):
+        self.counts = [0] * (len(TELEMETRY_BUCKETS_US) + 1)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def record(self, seconds: float):
+        value = seconds * 1e6
+        self.counts[bisect.bisect_left(TELEMETRY_BUCKETS_US, value)] += 1
+        self.count += 1
+        self.total_us += value
+        if value > self.max_us:
+            self.max_us = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the pct-th sample (the max for the overflow bucket)"""
+        if not self.count:
+            return 0.0
+        threshold = self.count * pct / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold and count:
+                return float(TELEMETRY_BUCKETS_US[index]) if index < len(TELEMETRY_BUCKETS_US) else self.max_us
+        return self.max_us
+
+    def summary(self) -> dict:
+        return {
+            'samples': self.count,
+            'mean_us': self.total_us / self.count if self.count else 0.0,
+            'p50_us': self.percentile(50),
+            'p99_us': self.percentile(99),
+            'max_us': self.max_us,
+        }
+
+
+class VoiceTelemetry:
+    """Sampled timings of one guild's audio path.
+
+    Every sample_every-th frame is timed: the mixer read (source, FFmpeg buffer and
+    volume), the PCMVolumeTransformer multiply, the Opus encode, and how far the
+    send interval strayed from 20 ms (jitter).
+    """
+
+    PARTS = ('read', 'volume', 'encode', 'jitter')
+
+    def __init__(self, sample_every: int = VOICE_TELEMETRY_SAMPLE):
+        self.sample_every = sample_every
+        self.read = LatencyHistogram()
+        self.volume = LatencyHistogram()
+        self.encode = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self._read_ticks = 0
+        self._volume_ticks = 0
+
+    def sample_read(self) -> bool:
+        self._read_ticks += 1
+        return self._read_ticks % self.sample_every == 0
+
+    def sample_volume(self) -> bool:
+        self._volume_ticks += 1
+        return self._volume_ticks % self.sample_every == 0
+
+    def summary(self) -> dict:
+        return {part: getattr(self, part).summary() for part in self.PARTS}
+
+
+class InstrumentedEncoder:
+    """Stands in for a voice client's opus.Encoder, timing sampled encodes and send intervals"""
+
+    def __init__(self, encoder, telemetry: VoiceTelemetry):
+        self._encoder = encoder
+        self._telemetry = telemetry
+        self._frames = 0
+        self._previous = None
+
+    def __getattr__(self, name):
+        return getattr(self._encoder, name)
+
+    def encode(self, pcm, frame_size):
+        telemetry = self._telemetry
+        phase = self._frames % telemetry.sample_every
+        self._frames += 1
+        if phase == telemetry.sample_every - 1:
+            self._previous = time.perf_counter()
+        elif phase == 0 and self._previous is not None:
+            started = time.perf_counter()
+            telemetry.jitter.record(abs(started - self._previous - FRAME_SECONDS))
+            data = self._encoder.encode(pcm, frame_size)
+            telemetry.encode.record(time.perf_counter() - started)
+            return data
+        return self._encoder.encode(pcm, frame_size)
+
+
+voice_telemetry = {}
+
+
+def telemetry_for(guild_id: int) -> Optional[VoiceTelemetry]:
+    if VOICE_TELEMETRY_SAMPLE <= 0:
+        return None
+    telemetry = voice_telemetry.get(guild_id)
+    if telemetry is None:
+        telemetry = voice_telemetry[guild_id] = VoiceTelemetry()
+    return telemetry
+
+
+def combined_telemetry() -> dict:
+    """Histograms of every guild merged, as summaries"""
+    merged = {part: LatencyHistogram() for part in VoiceTelemetry.PARTS}
+    for telemetry in list(voice_telemetry.values()):
+        for part in VoiceTelemetry.PARTS:
+            merged[part].merge(getattr(telemetry, part))
+    return {part: histogram.summary() for part, histogram in merged.items()}
+
+
+def format_telemetry(summary: dict) -> str:
+    return ', '.join(
+        f"{part} p50/p99 {summary[part]['p50_us'] / 1000:.2f}/{summary[part]['p99_us'] / 1000:.2f} ms"
+        for part in VoiceTelemetry.PARTS
+    )
+
+
+RECOVERY_MIN_REMAINING = 10.0
+RECOVERY_WAIT = 30.0
+SILENT_FRAME = bytes(AUDIO_FRAME_SIZE)
+
+
+class PlaybackMixer(discord.AudioSource):
+    """One continuous voice session that moves from track to track without stopping.
+
+    The next queued player is pulled from next_provider shortly before the current one
+    ends, faded in over crossfade_seconds (or switched to on the exact frame the current
+    one runs out), and on_transition is told so the queue can catch up.
+
+    When the current stream stops well before its duration, on_stream_lost is called with
+    the player and the position reached, and silence is played for up to RECOVERY_WAIT
+    seconds while a replacement is built and handed back through recover().
+    """
+
+    def __init__(self, player, *, next_provider, on_transition, on_stream_lost=None, crossfade_seconds: float = 0.0):
+        self.current = player
+        self.next_provider = next_provider
+        self.on_transition = on_transition
+        self.on_stream_lost = on_stream_lost
+        self.crossfade_seconds = crossfade_seconds
+        self.origin = {}
+        self.telemetry = None
+        self.finished = False
+        self.detached = False
+        self.frames_out = 0
+        self._reading = None
+        self._volume = player.volume
+        self._upcoming = None
+        self._current_frames = 0
+        self._upcoming_frames = 0
+        self._skip_requested = False
+        self._recovering_since = None
+        self._lock = threading.Lock()
+        self.transitions = 0
+        self.crossfades = 0
+        self.stall_seconds = 0.0
+        playback_stats['sessions'] += 1
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = max(value, 0.0)
+        with self._lock:
+            for player in (self.current, self._upcoming):
+                if player is not None:
+                    player.volume = self._volume
+
+    @property
+    def upcoming(self):
+        """The next player once the mixer has claimed it for a crossfade or skip"""
+        return self._upcoming
+
+    @property
+    def reading(self):
+        """The player a read is currently waiting on, if any"""
+        return self._reading
+
+    def current_position(self) -> float:
+        """Position reached in the current track, judged by frames actually played"""
+        current = self.current
+        return current.start_time + self._current_frames * FRAME_SECONDS * current.playback_speed
+
+    def is_opus(self) -> bool:
+        return False
+
+    @staticmethod
+    def _remaining_seconds(player, frames: int) -> Optional[float]:
+        """Wall-clock seconds left in a player, judged by frames already read"""
+        if not player.duration:
+            return None
+        position = player.start_time + frames * FRAME_SECONDS * player.playback_speed
+        return (player.duration - position) / player.playback_speed
+
+    def _claim_upcoming(self):
+        if self._upcoming is None:
+            player = self.next_provider()
+            if player is not None and player is not self.current:
+                player.volume = self._volume
+                self._upcoming = player
+                self._upcoming_frames = 0
+        return self._upcoming
+
+    def _promote(self):
+        old, new = self.current, self._upcoming
+        offset = self._upcoming_frames * FRAME_SECONDS
+        self.current = new
+        self._current_frames = self._upcoming_frames
+        self._upcoming = None
+        self._upcoming_frames = 0
+        self._skip_requested = False
+        self.transitions += 1
+        playback_stats['transitions'] += 1
+        self.on_transition(old, new, offset)
+
+    def _read_from(self, player) -> bytes:
+        self._reading = player
+        try:
+            return player.read()
+        finally:
+            self._reading = None
+
+    def read(self) -> bytes:
+        telemetry = self.telemetry
+        if telemetry is not None and telemetry.sample_read():
+            started = time.perf_counter()
+            frame = self._next_frame()
+            telemetry.read.record(time.perf_counter() - started)
+        else:
+            frame = self._next_frame()
+        if frame:
+            self.frames_out += 1
+        return frame
+
+    def _next_frame(self) -> bytes:
+        with self._lock:
+            current = self.current
+            skip = self._skip_requested
+        frame = b'' if skip else self._read_from(current)
+        if frame:
+            self._current_frames += 1
+        elif self.current is not current:
+            # Swapped out while this read was blocked (watchdog or recovery); go on with the new one
+            return SILENT_FRAME
+        else:
+            skip = self._skip_requested
+
+        remaining = self._remaining_seconds(current, self._current_frames) if frame else None
+        if frame and self.crossfade_seconds > 0 and remaining is not None and remaining <= self.crossfade_seconds:
+            with self._lock:
+                upcoming = self._claim_upcoming()
+            if upcoming is not None:
+                upcoming_frame = self._read_from(upcoming)
+                if upcoming_frame:
+                    if self._upcoming_frames == 0:
+                        self.crossfades += 1
+                        playback_stats['crossfades'] += 1
+                    self._upcoming_frames += 1
+                    fade_in = 1.0 - max(remaining, 0.0) / self.crossfade_seconds
+                    frame = audioop.add(
+                        audioop.mul(frame, 2, 1.0 - fade_in),
+                        audioop.mul(upcoming_frame, 2, fade_in),
+                        2
+                    )
+
+        if frame:
+            return frame
+
+        if not skip and self.on_stream_lost is not None:
+            if self._recovering_since is not None:
+                if time.monotonic() - self._recovering_since < RECOVERY_WAIT:
+                    return SILENT_FRAME
+                self._recovering_since = None
+            elif self._ended_early(current):
+                self._recovering_since = time.monotonic()
+                self.on_stream_lost(current, self.current_position())
+                return SILENT_FRAME
+
+        # The current track ran out (or was skipped): continue on the very next frame
+        with self._lock:
+            upcoming = self._claim_upcoming()
+            if upcoming is None:
+                self.finished = True
+                return b''
+            self._promote()
+        started = time.perf_counter()
+        frame = self._read_from(upcoming)
+        stalled = time.perf_counter() - started
+        self.stall_seconds += stalled
+        playback_stats['stall_seconds'] += stalled
+        if frame:
+            self._current_frames += 1
+            return frame
+        return self._next_frame()
+
+    def _ended_early(self, player) -> bool:
+        track = getattr(player, 'track', None)
+        if track is None or track.is_live:
+            return False
+        remaining = self._remaining_seconds(player, self._current_frames)
+        return remaining is not None and remaining > RECOVERY_MIN_REMAINING
+
+    def recover(self, lost_player, player) -> bool:
+        """Resume with player in place of a stream that died; False if playback moved on"""
+        with self._lock:
+            if self.current is not lost_player or self._recovering_since is None or self.finished:
+                return False
+        self.replace_current(player)
+        return True
+
+    def abandon_recovery(self, lost_player):
+        """Stop waiting for a replacement and move on to the next track"""
+        with self._lock:
+            if self.current is lost_player:
+                self._recovering_since = None
+                self._skip_requested = True
+        if self._reading is lost_player:
+            # A hung source only lets go of the blocked read once it is closed
+            lost_player.cleanup()
+
+    def mark_stalled(self, player) -> bool:
+        """Treat a player whose read is hung like a lost stream; False if playback moved on"""
+        with self._lock:
+            if self.current is not player or self._recovering_since is not None or self.finished:
+                return False
+            self._recovering_since = time.monotonic()
+            return True
+
+    def drop_upcoming(self, player) -> bool:
+        """Forget a claimed next player whose read hung, closing it so that read returns"""
+        with self._lock:
+            if self._upcoming is not player:
+                return False
+            self._upcoming = None
+            self._upcoming_frames = 0
+        player.cleanup()
+        return True
+
+    def replace_current(self, player):
+        """Swap the playing track in place, e.g. for seek or speed changes"""
+        player.volume = self._volume
+        with self._lock:
+            old = self.current
+            self.current = player
+            self._current_frames = 0
+            self._skip_requested = False
+            self._recovering_since = None
+            self._upcoming = None
+            self._upcoming_frames = 0
+        if old is not player:
+            old.cleanup()
+
+    def skip(self) -> bool:
+        """Move to the next track inside this session; False when there is none"""
+        with self._lock:
+            if self._claim_upcoming() is None:
+                return False
+            self._skip_requested = True
+            return True
+
+    def cleanup(self):
+        with self._lock:
+            current = self.current
+            self.finished = True
+        current.cleanup()
+
+    def stats(self) -> dict:
+        return {
+            'transitions': self.transitions,
+            'crossfades': self.crossfades,
+            'stall_seconds': self.stall_seconds,
+            'frames_out': self.frames_out,
+        }
+
+
+HISTORY_SIZE = int(os.getenv('HISTORY_SIZE', '25'))
+STREAM_URL_MARGIN = 60
+STREAM_URL_FALLBACK_TTL = 1800
+
+
+def track_entry(track: TrackInfo, original_query: str) -> dict:
+    """JSON-safe record of a resolved track: enough to play it again without extraction"""
+    stream_url = track.url
+    return {
+        'id': track.id,
+        'title': track.title,
+        'duration': track.duration,
+        'webpage_url': track.webpage_url,
+        'original_query': original_query,
+        'stream_url': stream_url,
+        'expires_at': track.expires_at,
+        'is_live': track.is_live,
+        'cached_at': time.time(),
+    }
+
+
+def history_entry(item: dict) -> Optional[dict]:
+    player = item.get('player')
+    if not player:
+        return None
+    return track_entry(player.track, item.get('original_query', player.title))
+
+
+def stream_url_is_fresh(entry: dict) -> bool:
+    if not entry.get('stream_url') or entry.get('is_live'):
+        return False
+    expires_at = entry.get('expires_at') or entry.get('cached_at', 0) + STREAM_URL_FALLBACK_TTL
+    return expires_at - STREAM_URL_MARGIN > time.time()
+
+
+class PlaybackHistory:
+    """Bounded ring of the tracks a guild played, newest first"""
+
+    def __init__(self, maxlen: int = HISTORY_SIZE):
+        self.entries = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def record(self, item: dict):
+        entry = history_entry(item)
+        if entry is None:
+            return
+        if self.entries and entry['id'] and self.entries[0]['id'] == entry['id']:
+            self.entries.popleft()
+        self.entries.appendleft(entry)
+
+    def get(self, index: int = 0) -> Optional[dict]:
+        if 0 <= index < len(self.entries):
+            return self.entries[index]
+        return None
+
+    def remove(self, entry: dict):
+        try:
+            self.entries.remove(entry)
+        except ValueError:
+            pass
+
+    def to_list(self) -> list:
+        return list(self.entries)
+
+    def load(self, entries: list):
+        self.entries.clear()
+        self.entries.extend(entry for entry in entries if entry.get('original_query'))
+
+
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'file').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+STATE_KEY_PREFIX = os.getenv('STATE_KEY_PREFIX', 'musicologo')
+STATE_LEASE_SECONDS = int(os.getenv('STATE_LEASE_SECONDS', '15'))
+NODE_ID = os.getenv('NODE_ID') or f'{socket.gethostname()}:{os.getpid()}'
+
+
+class StateBackend(abc.ABC):
+    """Where saved queue state lives.
+
+    shared is True for backends other nodes can read; those hand out per-guild
+    leases so only one node writes (and plays) a guild at a time.
+    """
+
+    name = 'base'
+    shared = False
 
-ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+    @abc.abstractmethod
+    def save(self, guild_id: int, state: dict) -> bool:
+        ...
 
-MIN_PLAYBACK_SPEED = 0.5
-MAX_PLAYBACK_SPEED = 2.0
-PLAYBACK_SPEED_TOLERANCE = 0.005
+    @abc.abstractmethod
+    def load(self, guild_id: int) -> Optional[dict]:
+        ...
 
+    def claim(self, guild_id: int) -> bool:
+        return True
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.69, start_time=0, playback_speed=1.0):
-        super().__init__(source, volume)
-        self.data = data
-        self.title = data.get('title')
-        self.url = data.get('url')
-        self.duration = data.get('duration')
-        self.start_time = start_time
-        self.playback_speed = playback_speed
+    def release(self, guild_id: int):
+        pass
 
-    @classmethod
-    async def from_url(
-        cls,
-        url,
-        *,
-        loop=None,
-        stream=True,
-        start_time=0,
-        playback_speed=1.0
-    ):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
+    def orphaned_guilds(self) -> list:
+        return []
 
-        if 'entries' in data:
-            data = data['entries'][0]
 
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        
-        ffmpeg_options = FFMPEG_OPTIONS.copy()
-        if start_time > 0:
-            ffmpeg_options['before_options'] = f'-ss {start_time} ' + ffmpeg_options.get('before_options', '')
-        if abs(playback_speed - 1.0) > PLAYBACK_SPEED_TOLERANCE:
-            speed_value = f'{playback_speed:.3f}'.rstrip('0').rstrip('.')
-            options = ffmpeg_options.get('options', '').strip()
-            ffmpeg_options['options'] = f"{options} -af atempo={speed_value}".strip()
+class FileStateBackend(StateBackend):
+    """One queue_state_<guild_id>.json per guild in the working directory"""
+
+    name = 'file'
+
+    @staticmethod
+    def path(guild_id: int) -> str:
+        return f'queue_state_{guild_id}.json'
+
+    def save(self, guild_id, state):
+        with open(self.path(guild_id), 'wb') as f:
+            f.write(json_codec.dumps(state, indent=True))
+        return True
+
+    def load(self, guild_id):
+        if not os.path.exists(self.path(guild_id)):
+            return None
+        with open(self.path(guild_id), 'rb') as f:
+            return json_codec.loads(f.read())
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespConnection:
+    """Minimal blocking Redis (RESP2) client: single commands and pipelines, reconnecting once on failure"""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        # Reentrant so a WATCH ... EXEC sequence can hold it across several pipelines
+        self.lock = threading.RLock()
+        self.connects = 0
+
+    @staticmethod
+    def encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            return RespError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f'Unexpected reply from server: {line[:40]!r}')
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.connects += 1
+        self._reader = self._sock.makefile('rb')
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.username, self.password) if self.username else ('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        for reply in self._send(setup):
+            if isinstance(reply, RespError):
+                raise reply
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _send(self, commands: list) -> list:
+        self._sock.sendall(b''.join(self.encode(command) for command in commands))
+        return [self._read_reply() for _ in commands]
+
+    def pipeline(self, commands: list) -> list:
+        """Send every command in one write and read all replies; error replies come back as RespError"""
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(commands)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt:
+                        raise
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+
+class RedisStateBackend(StateBackend):
+    """Queue state in Redis (or anything speaking its protocol), shared by every node.
+
+    Per guild: the queue and history as lists of JSON entries, the current song and
+    the scalar settings as hashes, written in one MULTI/EXEC pipeline. A guild's owner
+    key holds the node id with a lease of STATE_LEASE_SECONDS; other nodes may only
+    load (and so take over) a guild once that lease has lapsed.
+    """
 
-        return cls(
-            discord.FFmpegPCMAudio(filename, **ffmpeg_options),
-            data=data,
-            start_time=start_time,
-            playback_speed=playback_speed
-        )
+    name = 'redis'
+    shared = True
+
+    def __init__(self, url: str, prefix: str = STATE_KEY_PREFIX, node_id: str = NODE_ID,
+                 lease_seconds: int = STATE_LEASE_SECONDS):
+        self.connection = RespConnection(url)
+        self.prefix = prefix
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self._leases = {}
+
+    def key(self, guild_id: int, part: str) -> str:
+        return f'{self.prefix}:guild:{guild_id}:{part}'
+
+    @property
+    def guilds_key(self) -> str:
+        return f'{self.prefix}:guilds'
+
+    def claim(self, guild_id):
+        """Take or renew the guild's lease; False while another node holds it"""
+        owner_key = self.key(guild_id, 'owner')
+        lease_ms = self.lease_seconds * 1000
+        if self.connection.execute('SET', owner_key, self.node_id, 'NX', 'PX', lease_ms) == 'OK':
+            self._leases[guild_id] = time.monotonic() + self.lease_seconds
+            return True
+        # Renew only while the lease is still ours: WATCH makes the extension fail if the
+        # lease lapsed and another node took it between the GET and the EXEC
+        connection = self.connection
+        with connection.lock:
+            for _ in range(2):
+                connects = connection.connects
+                _, owner = connection.pipeline([('WATCH', owner_key), ('GET', owner_key)])
+                if owner != self.node_id.encode('utf-8'):
+                    connection.pipeline([('UNWATCH',)])
+                    self._leases.pop(guild_id, None)
+                    return False
+                replies = connection.pipeline([('MULTI',), ('SET', owner_key, self.node_id, 'XX', 'PX', lease_ms), ('EXEC',)])
+                if connection.connects != connects:
+                    # Reconnected in between, so the WATCH was lost; start over
+                    continue
+                if replies[-1] is None or replies[-1][0] != 'OK':
+                    self._leases.pop(guild_id, None)
+                    return False
+                self._leases[guild_id] = time.monotonic() + self.lease_seconds
+                return True
+        self._leases.pop(guild_id, None)
+        return False
+
+    def holds_lease(self, guild_id: int) -> bool:
+        return self._leases.get(guild_id, 0) > time.monotonic() + 1
+
+    def release(self, guild_id):
+        """Give up the guild on purpose; its saved state stays loadable but is no longer up for takeover"""
+        if self._leases.pop(guild_id, None) is None:
+            return
+        owner_key = self.key(guild_id, 'owner')
+        if self.connection.execute('GET', owner_key) == self.node_id.encode('utf-8'):
+            self.connection.pipeline([('DEL', owner_key), ('SREM', self.guilds_key, guild_id)])
+
+    def save(self, guild_id, state):
+        if not self.holds_lease(guild_id) and not self.claim(guild_id):
+            logger.warning(f'Not saving state for guild {guild_id}: another node owns it')
+            return False
+        queue_key, history_key = self.key(guild_id, 'queue'), self.key(guild_id, 'history')
+        current_key, meta_key = self.key(guild_id, 'current'), self.key(guild_id, 'meta')
+        commands = [('MULTI',), ('DEL', queue_key, history_key, current_key)]
+        if state['queue']:
+            commands.append(('RPUSH', queue_key, *(json_codec.dumps(entry) for entry in state['queue'])))
+        if state['history']:
+            commands.append(('RPUSH', history_key, *(json_codec.dumps(entry) for entry in state['history'])))
+        if state['current']:
+            commands.append(('HSET', current_key, *self.hash_fields(state['current'])))
+        meta = {key: value for key, value in state.items() if key not in ('queue', 'history', 'current')}
+        commands.append(('HSET', meta_key, *self.hash_fields(meta)))
+        # Only sessions with something left to play are offered to other nodes for takeover
+        if state['queue'] or state['current']:
+            commands.append(('SADD', self.guilds_key, guild_id))
+        else:
+            commands.append(('SREM', self.guilds_key, guild_id))
+        commands.append(('EXEC',))
+        replies = self.connection.pipeline(commands)
+        errors = [reply for reply in replies if isinstance(reply, RespError)]
+        if isinstance(replies[-1], list):
+            # Commands that fail at run time (WRONGTYPE and the like) only show up in EXEC's reply
+            errors.extend(reply for reply in replies[-1] if isinstance(reply, RespError))
+        if errors or replies[-1] is None:
+            raise RespError(f'State transaction failed: {errors[0] if errors else "aborted"}')
+        return True
+
+    @staticmethod
+    def hash_fields(values: dict) -> list:
+        fields = []
+        for field, value in values.items():
+            fields.extend((field, json_codec.dumps(value)))
+        return fields
+
+    @staticmethod
+    def read_hash(reply) -> dict:
+        return {reply[i].decode('utf-8'): json_codec.loads(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+    def load(self, guild_id):
+        if not self.claim(guild_id):
+            logger.info(f'State for guild {guild_id} is owned by another node')
+            return None
+        queue, history, current, meta = self.connection.pipeline([
+            ('LRANGE', self.key(guild_id, 'queue'), 0, -1),
+            ('LRANGE', self.key(guild_id, 'history'), 0, -1),
+            ('HGETALL', self.key(guild_id, 'current')),
+            ('HGETALL', self.key(guild_id, 'meta')),
+        ])
+        if not meta:
+            return None
+        return {
+            **self.read_hash(meta),
+            'queue': [json_codec.loads(entry) for entry in queue],
+            'history': [json_codec.loads(entry) for entry in history],
+            'current': self.read_hash(current) or None,
+        }
+
+    def orphaned_guilds(self):
+        """Guilds with saved state whose owner's lease has lapsed"""
+        guild_ids = [int(member) for member in self.connection.execute('SMEMBERS', self.guilds_key)]
+        if not guild_ids:
+            return []
+        owners = self.connection.pipeline([('EXISTS', self.key(guild_id, 'owner')) for guild_id in guild_ids])
+        return [guild_id for guild_id, owned in zip(guild_ids, owners) if not owned]
 
-    @classmethod
-    def extract_start_time(cls, url: str) -> int:
-        """Extract start time from YouTube URL t parameter (in seconds)"""
-        try:
-            parsed_url = urlparse(url)
-            query_params = parse_qs(parsed_url.query)
-            
-            if 't' in query_params:
-                t_value = query_params['t'][0]
-                # if t_value.endswith('s'):
-                #     t_value = t_value[:-1]
-                return int(t_value)
-        except:
-            pass
-        return 0
+
+def make_state_backend() -> StateBackend:
+    if STATE_BACKEND == 'redis':
+        return RedisStateBackend(REDIS_URL)
+    return FileStateBackend()
+
+
+state_backend = make_state_backend()
+# One worker, so backend calls never block the event loop and still run in the order they were made
+state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state')
 
 
 class MusicQueue:
@@ -141,24 +2266,101 @@ class MusicQueue:
         self.queue = []
         self.current = None
         self.playback_start_time = None
+        self.paused_at = None
         self.playback_speed = 1.0
+        self.crossfade_seconds = CROSSFADE_SECONDS
+        self.history = PlaybackHistory()
+        self.autoplay = None
+        # Running totals over self.queue, kept in step by the methods below so the
+        # queue display never walks the whole list
+        self.revision = 0
+        self.queued_seconds = 0
+        self.unknown_durations = 0
+        self._page_cache = {}
+
+    def _count(self, item, sign: int):
+        player = item.get('player')
+        duration = player.duration if player else None
+        if duration:
+            self.queued_seconds += sign * duration
+        else:
+            self.unknown_durations += sign
+
+    def mark_changed(self):
+        """Invalidate rendered queue pages; call after changing what queued items show"""
+        self.revision += 1
+        self._page_cache.clear()
+
+    def recount(self):
+        """Recompute the running totals after self.queue was modified directly"""
+        self.queued_seconds = 0
+        self.unknown_durations = 0
+        for item in self.queue:
+            self._count(item, 1)
+        self.mark_changed()
 
     def add(self, item):
-        self.queue.append(item)
+        position = len(self.queue)
+        if not item.get('autoplay'):
+            # Requested songs go ahead of queued autoplay picks, except one the mixer
+            # has already claimed for a crossfade
+            while position > 0 and self.queue[position - 1].get('autoplay'):
+                position -= 1
+            if position == 0 and self.queue:
+                guild = bot.get_guild(self.guild_id)
+                voice_client = guild.voice_client if guild else None
+                mixer = voice_client.source if voice_client and isinstance(voice_client.source, PlaybackMixer) else None
+                if mixer and mixer.upcoming is self.queue[0].get('player'):
+                    position = 1
+        self.queue.insert(position, item)
+        self._count(item, 1)
+        self.mark_changed()
         self.save_state()
 
+    def add_front(self, item):
+        self.queue.insert(0, item)
+        self._count(item, 1)
+        self.mark_changed()
+
+    def remove_where(self, predicate) -> list:
+        """Drop queued items matching predicate; returns the removed items"""
+        kept, removed = [], []
+        for item in self.queue:
+            (removed if predicate(item) else kept).append(item)
+        if removed:
+            self.queue[:] = kept
+            for item in removed:
+                self._count(item, -1)
+            self.mark_changed()
+        return removed
+
     def next(self) -> Optional[dict]:
+        if self.current:
+            self.history.record(self.current)
+        self.mark_changed()
         if self.queue:
             self.current = self.queue.pop(0)
+            self._count(self.current, -1)
             return self.current
         self.current = None
         return None
 
     def clear(self, save_state=True):
+        if self.current:
+            self.history.record(self.current)
+        for item in self.queue:
+            player = item.get('player')
+            if player:
+                player.cleanup()
         self.queue.clear()
+        self.queued_seconds = 0
+        self.unknown_durations = 0
+        self.mark_changed()
         self.current = None
         self.playback_start_time = None
+        self.paused_at = None
         self.playback_speed = 1.0
+        self.autoplay = None
         if save_state:
             self.save_state()
 
@@ -171,19 +2373,55 @@ class MusicQueue:
             player = self.current.get('player')
             if not player:
                 return 0
-            elapsed = time.time() - self.playback_start_time
+            elapsed = (self.paused_at or time.time()) - self.playback_start_time
             progress = player.start_time + (elapsed * player.playback_speed)
             return int(progress)
         return 0
     
-    def start_playback(self):
-        """Mark the start of playback for position tracking"""
+    def start_playback(self, offset: float = 0.0):
+        """Mark the start of playback for position tracking, offset seconds ago"""
         if self.current:
             player = self.current.get('player')
             if player:
                 self.playback_speed = player.playback_speed
-        self.playback_start_time = time.time()
+        self.playback_start_time = time.time() - offset
+        self.paused_at = None
         self.save_state()
+
+    def remaining_seconds(self) -> int:
+        """Playing time left in the current song and the queue, at the current speed"""
+        remaining = self.queued_seconds
+        if self.current and self.current.get('player') and self.current['player'].duration:
+            remaining += max(0, self.current['player'].duration - self.get_current_position())
+        return int(remaining / (self.playback_speed or 1.0))
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self.queue) // QUEUE_PAGE_SIZE))
+
+    def render_page(self, page: int) -> str:
+        """The "Up Next" lines for one page, rendered once per queue revision"""
+        text = self._page_cache.get(page)
+        if text is None:
+            start = page * QUEUE_PAGE_SIZE
+            lines = []
+            for number, item in enumerate(self.queue[start:start + QUEUE_PAGE_SIZE], start + 1):
+                player = item['player']
+                title = player.title if len(player.title) <= QUEUE_TITLE_WIDTH else player.title[:QUEUE_TITLE_WIDTH - 1] + '…'
+                duration = format_duration(player.duration) if player.duration else 'Live'
+                lines.append(f'{number}. {title} ({duration})')
+            text = self._page_cache[page] = '\n'.join(lines)
+        return text
+
+    def mark_paused(self):
+        """Freeze the position clock while playback is paused"""
+        if self.playback_start_time and self.paused_at is None:
+            self.paused_at = time.time()
+
+    def mark_resumed(self):
+        if self.paused_at is not None:
+            if self.playback_start_time:
+                self.playback_start_time += time.time() - self.paused_at
+            self.paused_at = None
     
     def to_dict(self) -> dict:
         """Serialize queue state to dictionary"""
@@ -227,34 +2465,48 @@ class MusicQueue:
                 ):
                     current_volume = interaction_ref.guild.voice_client.source.volume
         
+        # Where the session was playing and talking, so another node can resume it unprompted
+        guild = bot.get_guild(self.guild_id)
+        voice_client = guild.voice_client if guild else None
+        text_channel = origin_channel(self.current) or origin_channel(self.queue[-1] if self.queue else None)
+
         return {
             'guild_id': self.guild_id,
+            'voice_channel_id': voice_client.channel.id if voice_client and voice_client.channel else None,
+            'text_channel_id': text_channel.id if text_channel else None,
             'queue': queue_data,
             'current': current_data,
             'current_volume': current_volume,
             'playback_speed': self.playback_speed,
+            'history': self.history.to_list(),
+            'autoplay': self.autoplay is not None,
             'timestamp': time.time()
         }
     
     def save_state(self):
-        """Save queue state to JSON file"""
+        """Save queue state through the configured state backend, on the state executor"""
+        state = self.to_dict()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_state(state)
+        else:
+            loop.run_in_executor(state_executor, self._write_state, state)
+
+    def _write_state(self, state: dict):
         try:
-            state_file = f'queue_state_{self.guild_id}.json'
-            with open(state_file, 'w') as f:
-                json.dump(self.to_dict(), f, indent=2)
-            logger.debug(f'Saved queue state for guild {self.guild_id}')
+            if state_backend.save(self.guild_id, state):
+                logger.debug(f'Saved queue state for guild {self.guild_id}')
         except Exception as e:
             logger.error(traceback.format_exc())
             logger.error(f'Failed to save queue state for guild {self.guild_id}: {e}')
     
     @classmethod
-    def load_state(cls, guild_id: int) -> Optional[dict]:
-        """Load queue state from JSON file"""
+    async def load_state(cls, guild_id: int) -> Optional[dict]:
+        """Load queue state through the configured state backend"""
         try:
-            state_file = f'queue_state_{guild_id}.json'
-            if os.path.exists(state_file):
-                with open(state_file, 'r') as f:
-                    data = json.load(f)
+            data = await asyncio.get_running_loop().run_in_executor(state_executor, state_backend.load, guild_id)
+            if data is not None:
                 logger.info(f'Loaded queue state for guild {guild_id}')
                 return data
         except Exception as e:
@@ -262,8 +2514,221 @@ class MusicQueue:
         return None
 
 
+ANNOUNCE_WINDOW = float(os.getenv('ANNOUNCE_WINDOW', '1.5'))
+ANNOUNCE_MAX_TITLES = 10
+
+
+class ChannelAnnouncer:
+    """Batches playback announcements per text channel.
+
+    The first announcement after a quiet period goes out on the next loop iteration;
+    anything posted within window seconds of the last send is merged into one message.
+    Queued titles are listed together, only the latest "Now playing" is kept, and a
+    "Now playing" that is still the newest message in its channel is edited in place.
+    Edits count as sent messages in saved.
+    """
+
+    def __init__(self, window: float = ANNOUNCE_WINDOW):
+        self.window = window
+        self._pending = {}
+        self._last_flush = {}
+        self._now_playing_messages = {}
+        self._tasks = set()
+        self.stats = {'requested': 0, 'sent': 0, 'edited': 0, 'dropped': 0}
+
+    def queued(self, channel, title: str):
+        self._post(channel).setdefault('queued', []).append(title)
+
+    def now_playing(self, channel, title: str):
+        batch = self._post(channel)
+        if batch.get('now_playing'):
+            self.stats['dropped'] += 1
+        batch['now_playing'] = title
+
+    @property
+    def saved(self) -> int:
+        return self.stats['requested'] - self.stats['sent'] - self.stats['edited']
+
+    def forget_guild(self, guild_id: int):
+        """Drop pending batches and remembered messages for a guild that left voice"""
+        def in_guild(channel) -> bool:
+            return getattr(getattr(channel, 'guild', None), 'id', None) == guild_id
+
+        for channel_id, batch in list(self._pending.items()):
+            if in_guild(batch['channel']):
+                del self._pending[channel_id]
+        for channel_id, (_, flushed_guild_id) in list(self._last_flush.items()):
+            if flushed_guild_id == guild_id:
+                del self._last_flush[channel_id]
+        for channel_id, message in list(self._now_playing_messages.items()):
+            if in_guild(message.channel):
+                del self._now_playing_messages[channel_id]
+
+    def _prune(self, now: float):
+        """Forget send times older than the window and messages that can no longer be edited"""
+        for channel_id, (flushed_at, _) in list(self._last_flush.items()):
+            if now - flushed_at >= self.window:
+                del self._last_flush[channel_id]
+        for channel_id, message in list(self._now_playing_messages.items()):
+            if getattr(message.channel, 'last_message_id', message.id) != message.id:
+                del self._now_playing_messages[channel_id]
+
+    def _post(self, channel) -> dict:
+        self.stats['requested'] += 1
+        batch = self._pending.get(channel.id)
+        if batch is None:
+            batch = self._pending[channel.id] = {'channel': channel}
+            flushed_at, _ = self._last_flush.get(channel.id, (0.0, None))
+            delay = max(0.0, flushed_at + self.window - time.monotonic())
+            asyncio.get_running_loop().call_later(delay, self._schedule_flush, channel.id)
+        return batch
+
+    def _schedule_flush(self, channel_id: int):
+        task = asyncio.get_running_loop().create_task(self._flush(channel_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _render(batch: dict) -> str:
+        lines = []
+        if batch.get('now_playing'):
+            lines.append(f"Now playing: **{batch['now_playing']}**")
+        queued = batch.get('queued', [])
+        if len(queued) == 1:
+            lines.append(f'Added to queue: **{queued[0]}**')
+        elif queued:
+            shown = ', '.join(f'**{title}**' for title in queued[:ANNOUNCE_MAX_TITLES])
+            more = len(queued) - ANNOUNCE_MAX_TITLES
+            lines.append(f'Added {len(queued)} songs to queue: {shown}' + (f' and {more} more' if more > 0 else ''))
+        return '\n'.join(lines)[:2000]
+
+    async def _flush(self, channel_id: int):
+        batch = self._pending.pop(channel_id, None)
+        if not batch:
+            return
+        channel = batch['channel']
+        now = time.monotonic()
+        self._prune(now)
+        self._last_flush[channel_id] = (now, getattr(getattr(channel, 'guild', None), 'id', None))
+        text = self._render(batch)
+        only_now_playing = not batch.get('queued')
+        previous = self._now_playing_messages.pop(channel_id, None)
+        try:
+            if only_now_playing and previous is not None and getattr(channel, 'last_message_id', None) == previous.id:
+                await previous.edit(content=text)
+                message = previous
+                self.stats['edited'] += 1
+            else:
+                message = await channel.send(text)
+                self.stats['sent'] += 1
+            if only_now_playing and message is not None:
+                self._now_playing_messages[channel_id] = message
+        except Exception as e:
+            logger.error(f'Failed to send announcement in channel {channel_id}: {e}')
+
+
+class SearchSessionStore:
+    """Open search menus keyed by user, expired by a single deadline timer"""
+
+    def __init__(self, ttl: float = SEARCH_SESSION_TTL, max_entries: int = SEARCH_SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = {}
+        self._deadlines = []
+        self._timer = None
+        self._sequence = 0
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._sessions
+
+    def put(self, user_id: int, session: dict):
+        previous = self.pop(user_id)
+        if previous:
+            self._release(previous)
+        while len(self._sessions) >= self.max_entries and self._deadlines:
+            _, _, oldest_user_id, oldest_session = heapq.heappop(self._deadlines)
+            if self._sessions.get(oldest_user_id) is oldest_session:
+                self._release(self._remove(oldest_user_id))
+                self.evicted_count += 1
+
+        expires_at = time.time() + self.ttl
+        session['expires_at'] = expires_at
+        self._sessions[user_id] = session
+        self._sequence += 1
+        heapq.heappush(self._deadlines, (expires_at, self._sequence, user_id, session))
+        self._schedule()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        session = self._sessions.get(user_id)
+        if session and session['expires_at'] <= time.time():
+            self._release(self._remove(user_id))
+            self.expired_count += 1
+            return None
+        return session
+
+    def pop(self, user_id: int) -> Optional[dict]:
+        if user_id not in self._sessions:
+            return None
+        return self._remove(user_id)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop every session whose deadline has passed"""
+        now = now if now is not None else time.time()
+        expired = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, user_id, session = heapq.heappop(self._deadlines)
+            if self._sessions.get(user_id) is session:
+                self._release(self._remove(user_id))
+                expired += 1
+        self.expired_count += expired
+        return expired
+
+    def _remove(self, user_id: int) -> dict:
+        session = self._sessions.pop(user_id)
+        # Stale heap entries for removed sessions are skipped lazily; compact when they dominate
+        if len(self._deadlines) > 2 * len(self._sessions) + 64:
+            self._deadlines = [
+                entry for entry in self._deadlines
+                if self._sessions.get(entry[2]) is entry[3]
+            ]
+            heapq.heapify(self._deadlines)
+        return session
+
+    @staticmethod
+    def _release(session: dict):
+        view = session.get('view')
+        if view is not None:
+            view.expire()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._deadlines:
+            return
+        delay = max(self._deadlines[0][0] - time.time(), 0)
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.expire()
+        self._schedule()
+
+
 music_queues = {}
-search_results = {}
+search_sessions = SearchSessionStore()
+announcer = ChannelAnnouncer()
+idle_since = {}
+evicted_guilds = {}
 
 
 def get_queue(guild_id: int) -> MusicQueue:
@@ -272,6 +2737,25 @@ def get_queue(guild_id: int) -> MusicQueue:
     return music_queues[guild_id]
 
 
+def parse_search_entries(data: Optional[dict]) -> list:
+    """Reduce a flat yt-dlp search result to the fields the search menu needs"""
+    if not data or 'entries' not in data:
+        return []
+    
+    results = []
+    for entry in data['entries']:
+        if entry:
+            results.append({
+                'title': entry.get('title', 'Unknown'),
+                'url': entry.get('url', ''),
+                'duration': entry.get('duration', 0),
+                'channel': entry.get('channel', entry.get('uploader', 'Unknown')),
+                'id': entry.get('id', '')
+            })
+    
+    return results
+
+
 async def search_youtube(query: str, max_results: int = 10) -> list:
     """
     Search YouTube and return a list of results.
@@ -284,30 +2768,747 @@ async def search_youtube(query: str, max_results: int = 10) -> list:
         search_opts['quiet'] = True
         
         def search_sync():
-            with yt_dlp.YoutubeDL(search_opts) as ydl:
+            with make_extractor(search_opts) as ydl:
                 return ydl.extract_info(f'ytsearch{max_results}:{query}', download=False)
         
         data = await loop.run_in_executor(None, search_sync)
-        
-        if not data or 'entries' not in data:
-            return []
-        
-        results = []
-        for entry in data['entries']:
-            if entry:
-                results.append({
-                    'title': entry.get('title', 'Unknown'),
-                    'url': entry.get('url', ''),
-                    'duration': entry.get('duration', 0),
-                    'channel': entry.get('channel', entry.get('uploader', 'Unknown')),
-                    'id': entry.get('id', '')
-                })
-        
-        return results
+        return parse_search_entries(data)
+    except Exception as e:
+        logger.error(f'YouTube search error: {e}')
+        logger.error(traceback.format_exc())
+        return []
+
+
+AUTOPLAY_BUFFER_SIZE = int(os.getenv('AUTOPLAY_BUFFER', '2'))
+AUTOPLAY_EXTRACTIONS_PER_HOUR = int(os.getenv('AUTOPLAY_EXTRACTIONS_PER_HOUR', '30'))
+AUTOPLAY_MIX_SIZE = 25
+
+
+async def fetch_related_entries(video_id: str) -> list:
+    """Flat listing of YouTube's mix for a video, without resolving any of the entries"""
+    loop = asyncio.get_event_loop()
+    try:
+        mix_opts = YTDL_OPTIONS.copy()
+        mix_opts['extract_flat'] = 'in_playlist'
+        mix_opts['noplaylist'] = False
+        mix_opts['playlistend'] = AUTOPLAY_MIX_SIZE
+
+        def fetch_sync():
+            with make_extractor(mix_opts) as ydl:
+                return ydl.extract_info(
+                    f'https://www.youtube.com/watch?v={video_id}&list=RD{video_id}',
+                    download=False
+                )
+
+        data = await loop.run_in_executor(None, fetch_sync)
+        return parse_search_entries(data)
+    except Exception as e:
+        logger.error(f'Related tracks lookup failed for {video_id}: {e}')
+        return []
+
+
+class AutoplayFeed:
+    """Radio mode for one guild: related tracks for the last played video, a few resolved ahead.
+
+    Candidates come from a flat mix listing; only AUTOPLAY_BUFFER_SIZE of them are resolved
+    at a time, and every yt-dlp call counts against an hourly per-guild budget.
+    """
+
+    def __init__(self, guild_id: int, origin: dict):
+        self.guild_id = guild_id
+        self.origin = origin
+        self.candidates = deque()
+        self.ready = deque()
+        self.listed_seed = None
+        self.seen = set()
+        self.extractions = deque()
+        self.task = None
+        self._lock = asyncio.Lock()
+
+    def spend(self) -> bool:
+        """Count one extraction against the hourly budget; False when it is used up"""
+        cutoff = time.time() - 3600
+        while self.extractions and self.extractions[0] < cutoff:
+            self.extractions.popleft()
+        if len(self.extractions) >= AUTOPLAY_EXTRACTIONS_PER_HOUR:
+            return False
+        self.extractions.append(time.time())
+        return True
+
+    def take(self) -> Optional[dict]:
+        while self.ready:
+            entry = self.ready.popleft()
+            if stream_url_is_fresh(entry):
+                return entry
+        return None
+
+    async def refill(self, seed_id: Optional[str], exclude: set):
+        async with self._lock:
+            while len(self.ready) < AUTOPLAY_BUFFER_SIZE:
+                if not self.candidates:
+                    if not seed_id or seed_id == self.listed_seed or not self.spend():
+                        return
+                    self.listed_seed = seed_id
+                    self.candidates.extend(await fetch_related_entries(seed_id))
+                    continue
+
+                candidate = self.candidates.popleft()
+                if not candidate['id'] or candidate['id'] in exclude or candidate['id'] in self.seen:
+                    continue
+                if not self.spend():
+                    self.candidates.appendleft(candidate)
+                    return
+                self.seen.add(candidate['id'])
+                try:
+                    data = await YTDLSource.resolve(candidate['url'], loop=bot.loop)
+                except Exception as e:
+                    logger.warning(f'Skipping autoplay candidate {candidate["id"]}: {e}')
+                    continue
+                self.ready.append(track_entry(TrackInfo.from_info(data), candidate['url']))
+
+    def stats(self) -> dict:
+        return {
+            'ready': len(self.ready),
+            'candidates': len(self.candidates),
+            'extractions_last_hour': len(self.extractions),
+        }
+
+
+def recent_track_ids(queue: MusicQueue) -> set:
+    """Video ids autoplay must not pick again: history, the queue and what is playing"""
+    ids = {entry.get('id') for entry in queue.history.entries}
+    for item in ([queue.current] if queue.current else []) + queue.queue:
+        player = item.get('player')
+        if player:
+            ids.add(player.track.id)
+    if queue.autoplay:
+        ids.update(entry.get('id') for entry in queue.autoplay.ready)
+    ids.discard(None)
+    return ids
+
+
+async def run_autoplay(guild_id: int):
+    """Keep one related track queued behind the current song, then top the buffer back up"""
+    queue = music_queues.get(guild_id)
+    feed = queue.autoplay if queue else None
+    if feed is None:
+        return
+
+    if queue.current:
+        seed_id = queue.current['player'].track.id
+    else:
+        seed_id = (queue.history.get(0) or {}).get('id')
+
+    if queue.is_empty():
+        entry = feed.take()
+        if entry is None:
+            await feed.refill(seed_id, recent_track_ids(queue))
+            entry = feed.take()
+        if entry is not None and queue.autoplay is feed and queue.is_empty():
+            player = await build_history_player(entry, guild_id, queue.playback_speed)
+            queue.add({'player': player, 'original_query': entry['original_query'], 'autoplay': True, **feed.origin})
+            guild = bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if voice_client and not voice_client.is_playing() and not voice_client.is_paused():
+                await advance_queue(feed.origin)
+            else:
+                prepare_next_track(guild_id)
+
+    if queue.autoplay is feed:
+        await feed.refill(seed_id, recent_track_ids(queue))
+
+
+def schedule_autoplay(guild_id: int):
+    queue = music_queues.get(guild_id)
+    feed = queue.autoplay if queue else None
+    if feed is None or (feed.task and not feed.task.done()):
+        return
+    feed.task = asyncio.create_task(run_autoplay(guild_id))
+
+
+def enable_autoplay(guild_id: int, origin: dict):
+    queue = get_queue(guild_id)
+    if queue.autoplay is None:
+        queue.autoplay = AutoplayFeed(guild_id, origin)
+    else:
+        queue.autoplay.origin = origin
+    schedule_autoplay(guild_id)
+
+
+def disable_autoplay(guild_id: int):
+    queue = get_queue(guild_id)
+    queue.autoplay = None
+    for item in queue.remove_where(lambda item: item.get('autoplay')):
+        item['player'].cleanup()
+    queue.save_state()
+
+
+class SearchResultsView(discord.ui.View):
+    """Select menu for search results, routed to its own interaction handler"""
+
+    def __init__(self, results: list, *, requester_id: int, guild_id: int, ctx=None, interaction=None):
+        super().__init__(timeout=SEARCH_SESSION_TTL)
+        self.results = results
+        self.requester_id = requester_id
+        self.guild_id = guild_id
+        self.ctx = ctx
+        self.origin_interaction = interaction
+        self.message = None
+        self.prefetched = {}
+
+        options = []
+        for i, result in enumerate(results, 1):
+            duration_str = format_duration(result['duration']) if result['duration'] else 'Live'
+            options.append(discord.SelectOption(
+                label=f"{i}. {result['title']}"[:100],
+                description=f"{result['channel']} | {duration_str}"[:100],
+                value=str(i - 1)
+            ))
+        select = discord.ui.Select(placeholder='Choose a song to play', options=options)
+        select.callback = self.on_select
+        self.add_item(select)
+
+    @staticmethod
+    def video_url(result: dict) -> str:
+        if result.get('source') == 'library':
+            return result['url']
+        return f"https://www.youtube.com/watch?v={result['id']}"
+
+    def start_prefetch(self):
+        """Resolve the top results in the background while the user is choosing"""
+        for index, result in enumerate(self.results[:SEARCH_PREFETCH_COUNT]):
+            task = bot.loop.create_task(YTDLSource.resolve(self.video_url(result), loop=bot.loop))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self.prefetched[index] = task
+
+    def close(self):
+        for task in self.prefetched.values():
+            task.cancel()
+        self.prefetched.clear()
+        self.stop()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.requester_id:
+            await interaction.response.send_message('This search belongs to someone else.', ephemeral=True)
+            return False
+        return True
+
+    def expire(self):
+        """Close the menu when the session store drops it before the view times out"""
+        self.close()
+        bot.loop.create_task(self.disable_message())
+
+    async def disable_message(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    async def on_timeout(self):
+        search_sessions.pop(self.requester_id)
+        self.close()
+        await self.disable_message()
+
+    async def resolve_selection(self, index: int):
+        task = self.prefetched.pop(index, None)
+        if task is not None:
+            try:
+                return await task
+            except Exception as e:
+                logger.warning(f'Prefetch failed for search result {index + 1}, retrying: {e}')
+        return await YTDLSource.resolve(self.video_url(self.results[index]), loop=bot.loop)
+
+    async def on_select(self, interaction: discord.Interaction):
+        index = int(interaction.data['values'][0])
+        selected = self.results[index]
+        search_sessions.pop(self.requester_id)
+        for item in self.children:
+            item.disabled = True
+        await interaction.response.edit_message(view=self)
+
+        if not interaction.user.voice:
+            self.close()
+            await interaction.followup.send('You need to be in a voice channel to play music.', ephemeral=True)
+            return
+
+        voice_channel = interaction.user.voice.channel
+        queue = get_queue(self.guild_id)
+        voice_client = interaction.guild.voice_client
+
+        try:
+            if voice_client is None:
+                voice_client = await voice_channel.connect(self_deaf=True)
+            elif voice_client.channel != voice_channel:
+                await voice_client.move_to(voice_channel)
+
+            video_url = self.video_url(selected)
+            data = await self.resolve_selection(index)
+            self.close()
+            player = await YTDLSource.from_url(
+                video_url,
+                loop=bot.loop,
+                guild_id=self.guild_id,
+                stream=True,
+                playback_speed=queue.playback_speed,
+                data=data
+            )
+
+            if self.ctx is not None:
+                queue.add({'player': player, 'ctx': self.ctx, 'original_query': video_url})
+
+                if not voice_client.is_playing():
+                    await play_next(self.ctx)
+                else:
+                    await interaction.followup.send(f'Added to queue: **{player.title}**')
+            else:
+                queue.add({'player': player, 'interaction': self.origin_interaction, 'original_query': video_url})
+
+                if not voice_client.is_playing():
+                    await play_next_slash(self.origin_interaction)
+                else:
+                    await interaction.followup.send(f'Added to queue: **{player.title}**')
+
+            logger.info(f'User {interaction.user.id} selected search result {index + 1}')
+        except Exception as e:
+            self.close()
+            await interaction.followup.send(f'An error occurred: {str(e)}')
+            logger.error(f'Error playing search result: {e}')
+
+
+def build_queue_embed(queue: MusicQueue, page: int) -> discord.Embed:
+    embed = discord.Embed(title='Music Queue', color=discord.Color.blue())
+
+    if queue.current:
+        current_title = queue.current['player'].title
+        embed.add_field(name='Now Playing', value=f'🎵 {current_title}', inline=False)
+
+    if not queue.is_empty():
+        embed.add_field(name='Up Next', value=queue.render_page(page), inline=False)
+
+    totals = f'{len(queue.queue)} song(s) queued, {format_duration(queue.remaining_seconds())} remaining'
+    if queue.unknown_durations:
+        totals += f' (+{queue.unknown_durations} of unknown length)'
+    embed.set_footer(text=f'Page {page + 1}/{queue.page_count()} | {totals}')
+    return embed
+
+
+class QueueJumpModal(discord.ui.Modal, title='Jump to page'):
+    page = discord.ui.TextInput(label='Page number', max_length=6)
+
+    def __init__(self, view: 'QueueView'):
+        super().__init__()
+        self.view = view
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            page = int(self.page.value) - 1
+        except ValueError:
+            await interaction.response.send_message('Please enter a page number.', ephemeral=True)
+            return
+        await self.view.show_page(interaction, page)
+
+
+class QueueView(discord.ui.View):
+    """Page buttons for the queue embed; only the visible page is ever rendered"""
+
+    def __init__(self, guild_id: int, page: int = 0):
+        super().__init__(timeout=QUEUE_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+        self.page = min(max(page, 0), get_queue(guild_id).page_count() - 1)
+        self.message = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        last_page = get_queue(self.guild_id).page_count() - 1
+        self.first_page.disabled = self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.last_page.disabled = self.page >= last_page
+        self.jump.disabled = last_page == 0
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        queue = get_queue(self.guild_id)
+        self.page = min(max(page, 0), queue.page_count() - 1)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=build_queue_embed(queue, self.page), view=self)
+
+    @discord.ui.button(emoji='⏮️', style=discord.ButtonStyle.secondary)
+    async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, 0)
+
+    @discord.ui.button(emoji='◀️', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(emoji='▶️', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+    @discord.ui.button(emoji='⏭️', style=discord.ButtonStyle.secondary)
+    async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, get_queue(self.guild_id).page_count() - 1)
+
+    @discord.ui.button(label='Jump', style=discord.ButtonStyle.primary)
+    async def jump(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(QueueJumpModal(self))
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
+def live_players() -> set:
+    """Every player whose FFmpeg process is still needed: mixer current and upcoming,
+    current and queued items. Event loop only; the supervisor works from this snapshot."""
+    live = set()
+    for voice_client in bot.voice_clients:
+        mixer = voice_client.source
+        if isinstance(mixer, PlaybackMixer):
+            live.add(mixer.current)
+            live.add(mixer.upcoming)
+    for queue in music_queues.values():
+        if queue.current:
+            live.add(queue.current.get('player'))
+        live.update(item.get('player') for item in queue.queue)
+    live.discard(None)
+    return live
+
+
+def prepare_next_track(guild_id: int):
+    """Open FFmpeg for the next queued item while the current one plays"""
+    queue = music_queues.get(guild_id)
+    if not queue or queue.is_empty():
+        return
+    player = queue.queue[0].get('player')
+    if not player:
+        return
+    try:
+        player.prepare()
+    except FFmpegCapacityError as e:
+        logger.info(f'Not preparing next track in guild {guild_id}: {e}')
+    except Exception as e:
+        logger.error(f'Failed to prepare next track in guild {guild_id}: {e}')
+
+
+async def periodic_ffmpeg_reaper():
+    """Background task to kill FFmpeg processes left behind by skipped or cleared items"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            reaped = ffmpeg_supervisor.reap(live_players())
+            if reaped:
+                logger.info(f'Reaped {reaped} FFmpeg process(es), {len(ffmpeg_supervisor)} running')
+        except Exception as e:
+            logger.error(f'Error in FFmpeg reaper: {e}')
+        await asyncio.sleep(FFMPEG_REAP_INTERVAL)
+
+
+URL_REFRESH_LEAD = int(os.getenv('URL_REFRESH_LEAD', '600'))
+URL_REFRESH_INTERVAL = 30
+URL_REFRESH_BATCH = int(os.getenv('URL_REFRESH_BATCH', '4'))
+URL_REFRESH_RETRY = 120
+
+url_refresh_stats = {'refreshed': 0, 'failed': 0}
+
+
+def expiring_players(now: float) -> list:
+    """(expires_at, guild_id, item) for players whose stream URL expires within the lead time.
+
+    Queued players and a paused current player are included. A playing current player
+    keeps its open connection, and a player the mixer has already claimed is about to
+    start, so neither is touched.
+    """
+    due = []
+    for guild_id, queue in list(music_queues.items()):
+        guild = bot.get_guild(guild_id)
+        voice_client = guild.voice_client if guild else None
+        mixer = voice_client.source if voice_client and isinstance(voice_client.source, PlaybackMixer) else None
+        items = list(queue.queue)
+        if queue.current and voice_client and voice_client.is_paused():
+            items.append(queue.current)
+        for item in items:
+            player = item.get('player')
+            if not player or player.track.is_live or player.track.expires_at is None:
+                continue
+            if mixer and mixer.upcoming is player:
+                continue
+            if player.track.expires_at - URL_REFRESH_LEAD > now:
+                continue
+            if now - player.refresh_attempted_at < URL_REFRESH_RETRY:
+                continue
+            due.append((player.track.expires_at, guild_id, item))
+    due.sort(key=lambda entry: entry[0])
+    return due
+
+
+async def refresh_item_stream(guild_id: int, item: dict):
+    """Re-resolve an item's stream URL and swap in a player built from it"""
+    old_player = item['player']
+    old_player.refresh_attempted_at = time.time()
+    queue = music_queues.get(guild_id)
+    query = old_player.track.webpage_url or item.get('original_query', old_player.title)
+    try:
+        data = await YTDLSource.resolve(query, loop=bot.loop, fresh=True)
+    except Exception as e:
+        url_refresh_stats['failed'] += 1
+        logger.warning(f'Could not refresh stream URL for {old_player.title} in guild {guild_id}: {e}')
+        return
+
+    is_current = queue is not None and queue.current is item
+
+    def still_refreshable() -> bool:
+        # Playback may have moved on while yt-dlp or FFmpeg were busy: never swap out a
+        # player the mixer has claimed, and only touch the current one while paused
+        guild = bot.get_guild(guild_id)
+        voice_client = guild.voice_client if guild else None
+        mixer = voice_client.source if voice_client and isinstance(voice_client.source, PlaybackMixer) else None
+        if music_queues.get(guild_id) is not queue or item['player'] is not old_player:
+            return False
+        if is_current:
+            return queue.current is item and voice_client is not None and voice_client.is_paused()
+        return item in queue.queue and not (mixer and old_player in (mixer.current, mixer.upcoming))
+
+    if queue is None or not still_refreshable():
+        return
+    start_time = queue.get_current_position() if is_current else old_player.start_time
+    new_player = await YTDLSource.from_url(
+        query,
+        loop=bot.loop,
+        guild_id=guild_id,
+        data=data,
+        start_time=start_time,
+        playback_speed=old_player.playback_speed
+    )
+    if not still_refreshable():
+        new_player.cleanup()
+        return
+    new_player.volume = old_player.volume
+    item['player'] = new_player
+    url_refresh_stats['refreshed'] += 1
+
+    if is_current:
+        start_player(bot.get_guild(guild_id).voice_client, new_player, {key: item[key] for key in ('ctx', 'interaction', 'channel') if key in item})
+        queue.start_playback()
+        queue.mark_paused()
+    else:
+        old_player.cleanup()
+        if queue.queue and queue.queue[0] is item and old_player.started:
+            prepare_next_track(guild_id)
+    logger.info(f'Refreshed stream URL for {new_player.title} in guild {guild_id}')
+
+
+async def periodic_url_refresher():
+    """Background task that re-resolves stream URLs shortly before their signed expiry"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            due = expiring_players(time.time())[:URL_REFRESH_BATCH]
+            if due:
+                await asyncio.gather(*(refresh_item_stream(guild_id, item) for _, guild_id, item in due))
+        except Exception as e:
+            logger.error(f'Error in stream URL refresher: {e}')
+        await asyncio.sleep(URL_REFRESH_INTERVAL)
+
+
+async def periodic_library_rescan():
+    """Background task that keeps the local library index in step with LIBRARY_DIR"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            changed, removed = await library_backend.refresh()
+            if changed or removed:
+                logger.info(
+                    f'Library rescan: {changed} new or changed, {removed} removed, '
+                    f'{len(library_backend.entries)} tracks ({library_backend.last_scan_seconds:.2f}s)'
+                )
+        except Exception as e:
+            logger.error(f'Error rescanning local library: {e}')
+        await asyncio.sleep(LIBRARY_RESCAN_INTERVAL)
+
+
+def idle_conditions(voice_client, queue: Optional[MusicQueue]) -> dict:
+    listeners = [member for member in voice_client.channel.members if not member.bot]
+    playing = voice_client.is_playing()
+    paused = voice_client.is_paused()
+    return {
+        'alone': not listeners,
+        'paused': paused,
+        'empty': not playing and not paused and (queue is None or (queue.current is None and queue.is_empty())),
+    }
+
+
+def origin_channel(item: Optional[dict]):
+    if not item:
+        return None
+    if item.get('ctx'):
+        return item['ctx'].channel
+    if item.get('interaction'):
+        return item['interaction'].channel
+    return item.get('channel')
+
+
+async def reclaim_guild(voice_client, reason: str):
+    """Persist the session, leave voice and drop everything the guild holds in memory"""
+    guild_id = voice_client.guild.id
+    queue = music_queues.get(guild_id)
+    channel = origin_channel(queue.current) if queue else None
+    has_session = queue is not None and (queue.current is not None or not queue.is_empty())
+
+    if has_session:
+        queue.save_state()
+        evicted_guilds[guild_id] = reason
+    await asyncio.get_running_loop().run_in_executor(state_executor, state_backend.release, guild_id)
+    if queue:
+        queue.clear(save_state=False)
+    idle_since.pop(guild_id, None)
+
+    if isinstance(voice_client.source, PlaybackMixer):
+        # stop() fires the after callback; it must not recreate the queue being dropped
+        voice_client.source.detached = True
+    voice_client.stop()
+    await voice_client.disconnect()
+    music_queues.pop(guild_id, None)
+    voice_telemetry.pop(guild_id, None)
+    announcer.forget_guild(guild_id)
+    logger.info(f'Left voice in guild {guild_id} after idle policy "{reason}" (session saved: {has_session})')
+
+    if channel and has_session:
+        try:
+            await channel.send(
+                f'Left the voice channel ({reason} for {format_duration(IDLE_TIMEOUTS[reason])}). '
+                f'Your session was saved; any music command will pick it back up.'
+            )
+        except Exception as e:
+            logger.error(f'Failed to send idle disconnect message: {e}')
+
+
+async def idle_voice_monitor():
+    """Background task applying the idle disconnect policies"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            now = time.time()
+            connected = set()
+            for voice_client in list(bot.voice_clients):
+                guild_id = voice_client.guild.id
+                connected.add(guild_id)
+                conditions = idle_conditions(voice_client, music_queues.get(guild_id))
+                timers = idle_since.setdefault(guild_id, {})
+                triggered = None
+                for policy, active in conditions.items():
+                    if not active:
+                        timers.pop(policy, None)
+                        continue
+                    started = timers.setdefault(policy, now)
+                    timeout = IDLE_TIMEOUTS[policy]
+                    if timeout > 0 and now - started >= timeout:
+                        triggered = policy
+                if triggered:
+                    await reclaim_guild(voice_client, triggered)
+            for guild_id in list(idle_since):
+                if guild_id not in connected:
+                    del idle_since[guild_id]
+        except Exception as e:
+            logger.error(f'Error in idle voice monitor: {e}')
+            logger.error(traceback.format_exc())
+        await asyncio.sleep(IDLE_CHECK_INTERVAL)
+
+
+async def rehydrate_evicted_session(guild, member, origin: dict, send) -> bool:
+    """Bring back a session that was saved and evicted by an idle policy"""
+    if guild.id not in evicted_guilds or not member.voice:
+        return False
+    reason = evicted_guilds.pop(guild.id)
+    saved_state = await MusicQueue.load_state(guild.id)
+    if not saved_state or (not saved_state.get('current') and not saved_state.get('queue')):
+        return False
+
+    try:
+        voice_channel = member.voice.channel
+        voice_client = guild.voice_client
+        if voice_client is None:
+            voice_client = await voice_channel.connect(self_deaf=True)
+        elif voice_client.channel != voice_channel:
+            await voice_client.move_to(voice_channel)
+
+        logger.info(f'Rehydrating session for guild {guild.id} evicted after "{reason}"')
+        await restore_saved_state(saved_state, voice_client, origin, send)
+        return True
     except Exception as e:
-        logger.error(f'YouTube search error: {e}')
+        logger.error(f'Failed to rehydrate session for guild {guild.id}: {e}')
         logger.error(traceback.format_exc())
-        return []
+        return False
+
+
+restore_tasks = {}
+
+
+def start_restore(guild_id: int, coro) -> asyncio.Task:
+    """Run a session restore as the guild's one restore task"""
+    task = bot.loop.create_task(coro)
+    restore_tasks[guild_id] = task
+    task.add_done_callback(lambda _: restore_tasks.pop(guild_id, None))
+    return task
+
+
+def lazy_restore(guild, member, origin: dict, send) -> Optional[asyncio.Task]:
+    """The guild's running restore, started if the guild was evicted; None when there is nothing to restore.
+
+    Every command that arrives while a restore runs waits on the same task, so none of
+    them connects or starts playback alongside it.
+    """
+    task = restore_tasks.get(guild.id)
+    if task is None and guild.id in evicted_guilds:
+        task = start_restore(guild.id, rehydrate_evicted_session(guild, member, origin, send))
+    return task
+
+
+@bot.before_invoke
+async def before_command(ctx):
+    if ctx.guild and ctx.command and ctx.command.name in LAZY_RESTORE_COMMANDS:
+        task = lazy_restore(ctx.guild, ctx.author, {'ctx': ctx}, ctx.send)
+        if task is not None:
+            async with ctx.typing():
+                await asyncio.shield(task)
+
+
+async def respond(interaction: discord.Interaction, *args, **kwargs):
+    """Answer a slash command, through the follow-up once a lazy restore has deferred it"""
+    if interaction.response.is_done():
+        if interaction.extras.pop('public_defer', False):
+            # The first follow-up replaces the public "thinking" message and cannot be
+            # ephemeral; say so here instead of letting Discord ignore the flag
+            kwargs.pop('ephemeral', None)
+        return await interaction.followup.send(*args, **kwargs)
+    return await interaction.response.send_message(*args, **kwargs)
+
+
+async def defer_response(interaction: discord.Interaction):
+    """Defer publicly; the answer that follows is public too, whatever it asks for"""
+    if not interaction.response.is_done():
+        await interaction.response.defer(thinking=True)
+        interaction.extras['public_defer'] = True
+
+
+async def before_app_command(interaction: discord.Interaction):
+    command = interaction.command
+    if interaction.guild and command and command.name in LAZY_RESTORE_COMMANDS:
+        task = lazy_restore(interaction.guild, interaction.user, {'interaction': interaction}, interaction.channel.send)
+        if task is None:
+            return
+        # Interactions must be answered within 3s: past a short wait, defer and let the
+        # command answer through its follow-up once the restore is done
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=LAZY_RESTORE_WAIT)
+        except asyncio.TimeoutError:
+            await defer_response(interaction)
+            await asyncio.shield(task)
 
 
 async def periodic_state_saver():
@@ -324,17 +3525,176 @@ async def periodic_state_saver():
             await asyncio.sleep(30)
 
 
-@bot.event
-async def on_ready():
-    logger.info(f'{bot.user} has connected to Discord!')
-    logger.info(f'Bot is ready to play music in {len(bot.guilds)} server(s)')
+async def periodic_telemetry_dump():
+    """Background task logging each guild's voice-path timings"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(VOICE_TELEMETRY_LOG_INTERVAL)
+        try:
+            for guild_id, telemetry in list(voice_telemetry.items()):
+                summary = telemetry.summary()
+                if summary['read']['samples']:
+                    logger.info(f'Voice path for guild {guild_id}: {format_telemetry(summary)}')
+        except Exception as e:
+            logger.error(f'Error dumping voice telemetry: {e}')
+
+
+async def drop_lost_session(guild_id: int):
+    """Stop a guild whose lease another node now holds, leaving its saved state to that node"""
+    queue = music_queues.pop(guild_id, None)
+    guild = bot.get_guild(guild_id)
+    voice_client = guild.voice_client if guild else None
+    if voice_client:
+        if isinstance(voice_client.source, PlaybackMixer):
+            # Keep the after callback from starting the next song
+            voice_client.source.detached = True
+        voice_client.stop()
+        await voice_client.disconnect()
+    if queue:
+        queue.clear(save_state=False)
+    idle_since.pop(guild_id, None)
+    evicted_guilds.pop(guild_id, None)
+    voice_telemetry.pop(guild_id, None)
+
+
+async def take_over_session(guild) -> bool:
+    """Resume a session whose owner node died, in the voice and text channels it was using"""
+    saved_state = await MusicQueue.load_state(guild.id)
+    if not saved_state or (not saved_state.get('current') and not saved_state.get('queue')):
+        return False
+    voice_channel = guild.get_channel(saved_state.get('voice_channel_id') or 0)
+    text_channel = guild.get_channel(saved_state.get('text_channel_id') or 0) or guild.system_channel
+    listeners = [member for member in voice_channel.members if not member.bot] if voice_channel else []
+    if not listeners or text_channel is None:
+        # Nobody left to play to: resume on the next music command, as after an idle disconnect
+        evicted_guilds[guild.id] = 'takeover'
+        logger.info(f'Guild {guild.id} has an orphaned session with no listeners; it will be restored on the next command')
+        return False
+
+    try:
+        voice_client = guild.voice_client
+        if voice_client is None:
+            voice_client = await voice_channel.connect(self_deaf=True)
+        elif voice_client.channel != voice_channel:
+            await voice_client.move_to(voice_channel)
+        logger.info(f'Taking over the session of guild {guild.id} from a node that stopped')
+        await restore_saved_state(saved_state, voice_client, {'channel': text_channel}, text_channel.send)
+        if not voice_client.is_playing() and not voice_client.is_paused():
+            await play_next_in_channel(text_channel)
+        return True
+    except Exception as e:
+        logger.error(f'Failed to take over session for guild {guild.id}: {e}')
+        logger.error(traceback.format_exc())
+        evicted_guilds[guild.id] = 'takeover'
+        return False
+
+
+async def state_lease_keeper():
+    """Background task renewing this node's guild leases and picking up sessions whose owner died"""
+    await bot.wait_until_ready()
+    loop = asyncio.get_running_loop()
+    while not bot.is_closed():
+        try:
+            active = {guild_id for guild_id, queue in music_queues.items() if queue.current or not queue.is_empty()}
+            active.update(voice_client.guild.id for voice_client in bot.voice_clients)
+            for guild_id in active:
+                if not await loop.run_in_executor(state_executor, state_backend.claim, guild_id):
+                    logger.warning(f'Lost the state lease for guild {guild_id} to another node; stopping here')
+                    await drop_lost_session(guild_id)
+            for guild_id in await loop.run_in_executor(state_executor, state_backend.orphaned_guilds):
+                guild = bot.get_guild(guild_id)
+                if guild and guild_id not in music_queues and guild_id not in evicted_guilds and guild_id not in restore_tasks:
+                    start_restore(guild_id, take_over_session(guild))
+        except Exception as e:
+            logger.error(f'Error in state lease keeper: {e}')
+        await asyncio.sleep(STATE_LEASE_SECONDS / 3)
+
+
+def command_tree_hash() -> str:
+    """Hash the payload of every registered slash command"""
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload.sort(key=lambda entry: entry['name'])
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def load_synced_tree_hash() -> Optional[str]:
+    try:
+        if os.path.exists(COMMAND_TREE_HASH_FILE):
+            with open(COMMAND_TREE_HASH_FILE, 'r') as f:
+                return f.read().strip() or None
+    except Exception as e:
+        logger.error(f'Failed to read command tree hash: {e}')
+    return None
+
+
+def save_synced_tree_hash(tree_hash: str):
+    try:
+        with open(COMMAND_TREE_HASH_FILE, 'w') as f:
+            f.write(tree_hash)
+    except Exception as e:
+        logger.error(f'Failed to save command tree hash: {e}')
+
+
+async def sync_command_tree():
+    """Sync slash commands only when their signatures changed since the last sync"""
+    tree_hash = command_tree_hash()
+    if tree_hash == load_synced_tree_hash():
+        logger.info('Slash commands unchanged since last sync, skipping sync')
+        return
     try:
         synced = await bot.tree.sync()
+        save_synced_tree_hash(tree_hash)
         logger.info(f'Synced {len(synced)} slash command(s)')
     except Exception as e:
         logger.error(f'Failed to sync commands: {e}')
-    
+
+
+startup_timings = {'import': IMPORTS_FINISHED - BOOT_STARTED}
+startup_complete = False
+
+
+def log_startup_report():
+    phases = ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in startup_timings.items())
+    total = time.perf_counter() - BOOT_STARTED
+    logger.info(f'Startup timings: {phases} (total {total * 1000:.0f}ms)')
+    logger.info(f"Runtime: {runtime_info['event_loop']} event loop, {runtime_info['json']} serialization")
+
+
+@bot.event
+async def setup_hook():
+    startup_timings['login'] = time.perf_counter() - run_started
+
+
+@bot.event
+async def on_ready():
+    global startup_complete
+    logger.info(f'{bot.user} has connected to Discord!')
+    logger.info(f'Bot is ready to play music in {len(bot.guilds)} server(s)')
+
+    # on_ready fires again after every reconnect; only the first one does startup work
+    if startup_complete:
+        return
+    startup_complete = True
+    startup_timings['ready'] = time.perf_counter() - run_started - startup_timings.get('login', 0)
+
+    sync_started = time.perf_counter()
+    await sync_command_tree()
+    startup_timings['sync'] = time.perf_counter() - sync_started
+    log_startup_report()
+
     bot.loop.create_task(periodic_state_saver())
+    bot.loop.create_task(periodic_ffmpeg_reaper())
+    bot.loop.create_task(periodic_url_refresher())
+    if WATCHDOG_STALL_SECONDS > 0:
+        bot.loop.create_task(playback_watchdog())
+    if VOICE_TELEMETRY_SAMPLE > 0 and VOICE_TELEMETRY_LOG_INTERVAL > 0:
+        bot.loop.create_task(periodic_telemetry_dump())
+    if library_backend:
+        bot.loop.create_task(periodic_library_rescan())
+    if state_backend.shared:
+        bot.loop.create_task(state_lease_keeper())
+    bot.loop.create_task(idle_voice_monitor())
 
 
 @bot.event
@@ -351,6 +3711,8 @@ async def on_command_error(ctx, error):
         await ctx.send(f'Missing required argument: {error.param.name}')
     elif isinstance(error, commands.BadArgument):
         await ctx.send(f'Bad argument: {error}')
+    elif isinstance(error, commands.NotOwner):
+        await ctx.send('Only the bot owner can use this command.')
     else:
         logger.error(f'Command error in {ctx.command}: {error}')
         logger.error(traceback.format_exc())
@@ -363,71 +3725,6 @@ async def on_message(message):
         return
     
     await bot.process_commands(message)
-    
-    if message.author.id in search_results:
-        search_data = search_results[message.author.id]
-        
-        if message.channel.id != search_data['channel_id']:
-            return
-        
-        if time.time() - search_data['timestamp'] > 60:
-            del search_results[message.author.id]
-            return
-        
-        try:
-            selection = int(message.content.strip())
-            if 1 <= selection <= len(search_data['results']):
-                selected = search_data['results'][selection - 1]
-                
-                del search_results[message.author.id]
-                
-                if not message.author.voice:
-                    await message.channel.send('You need to be in a voice channel to play music.')
-                    return
-                
-                voice_channel = message.author.voice.channel
-                queue = get_queue(search_data['guild_id'])
-                guild = bot.get_guild(search_data['guild_id'])
-                voice_client = guild.voice_client if guild else None
-                
-                if voice_client is None:
-                    voice_client = await voice_channel.connect(self_deaf=True)
-                elif voice_client.channel != voice_channel:
-                    await voice_client.move_to(voice_channel)
-                
-                async with message.channel.typing():
-                    try:
-                        video_url = f"https://www.youtube.com/watch?v={selected['id']}"
-                        player = await YTDLSource.from_url(
-                            video_url,
-                            loop=bot.loop,
-                            stream=True,
-                            playback_speed=queue.playback_speed
-                        )
-                        
-                        if 'ctx' in search_data:
-                            ctx = search_data['ctx']
-                            queue.add({'player': player, 'ctx': ctx, 'original_query': video_url})
-                            
-                            if not voice_client.is_playing():
-                                await play_next(ctx)
-                            else:
-                                await message.channel.send(f'Added to queue: **{player.title}**')
-                        else:
-                            interaction = search_data['interaction']
-                            queue.add({'player': player, 'interaction': interaction, 'original_query': video_url})
-                            
-                            if not voice_client.is_playing():
-                                await play_next_slash(interaction)
-                            else:
-                                await message.channel.send(f'Added to queue: **{player.title}**')
-                        
-                        logger.info(f'User {message.author.id} selected search result {selection}')
-                    except Exception as e:
-                        await message.channel.send(f'An error occurred: {str(e)}')
-                        logger.error(f'Error playing search result: {e}')
-        except ValueError:
-            pass
 
 
 @bot.command(name='play', help='Plays audio from YouTube URL or search query')
@@ -450,6 +3747,7 @@ async def play(ctx, *, query: str):
             player = await YTDLSource.from_url(
                 query,
                 loop=bot.loop,
+                guild_id=ctx.guild.id,
                 stream=True,
                 start_time=start_time,
                 playback_speed=queue.playback_speed
@@ -459,7 +3757,7 @@ async def play(ctx, *, query: str):
             if not ctx.voice_client.is_playing():
                 await play_next(ctx)
             else:
-                await ctx.send(f'Added to queue: **{player.title}**')
+                announcer.queued(ctx.channel, player.title)
         except Exception as e:
             await ctx.send(f'An error occurred: {str(e)}')
 
@@ -471,7 +3769,7 @@ async def search(ctx, *, query: str):
         return
     
     async with ctx.typing():
-        results = await search_youtube(query, max_results=10)
+        results = await search_sources(query, max_results=10)
         
         if not results:
             await ctx.send('No results found for your search.')
@@ -479,7 +3777,7 @@ async def search(ctx, *, query: str):
         
         embed = discord.Embed(
             title=f'Search Results for: {query}',
-            description='Reply with a number (1-10) to select a song',
+            description='Pick a song from the menu below',
             color=discord.Color.blue()
         )
         
@@ -491,16 +3789,16 @@ async def search(ctx, *, query: str):
                 inline=False
             )
         
-        embed.set_footer(text='This search will expire in 60 seconds')
-        await ctx.send(embed=embed)
+        embed.set_footer(text=f'This search will expire in {SEARCH_SESSION_TTL} seconds')
+        view = SearchResultsView(results, requester_id=ctx.author.id, guild_id=ctx.guild.id, ctx=ctx)
+        view.start_prefetch()
+        view.message = await ctx.send(embed=embed, view=view)
         
-        search_results[ctx.author.id] = {
-            'results': results,
+        search_sessions.put(ctx.author.id, {
             'channel_id': ctx.channel.id,
             'guild_id': ctx.guild.id,
-            'timestamp': time.time(),
-            'ctx': ctx
-        }
+            'view': view
+        })
         
         logger.info(f'User {ctx.author.id} searched for: {query}')
 
@@ -509,7 +3807,11 @@ async def play_next(ctx):
     queue = get_queue(ctx.guild.id)
     
     if queue.is_empty():
-        queue.current = None
+        queue.next()  # moves the finished song into history
+        schedule_autoplay(ctx.guild.id)
+        return
+
+    if not ctx.voice_client or ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
         return
 
     item = queue.next()
@@ -517,25 +3819,18 @@ async def play_next(ctx):
         return
 
     player = item['player']
-    
-    def after_playing(error):
-        if error:
-            logger.error(f'Player error in guild {ctx.guild.id}: {error}')
-            logger.error(traceback.format_exc())
-        try:
-            asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-        except Exception as e:
-            logger.error(f'Failed to queue next song: {e}')
-
-    ctx.voice_client.play(player, after=after_playing)
+    start_player(ctx.voice_client, player, {'ctx': ctx})
     queue.start_playback()
-    await ctx.send(f'Now playing: **{player.title}**')
+    prepare_next_track(ctx.guild.id)
+    schedule_autoplay(ctx.guild.id)
+    announcer.now_playing(ctx.channel, player.title)
 
 
 @bot.command(name='pause', help='Pauses the current audio')
 async def pause(ctx):
     if ctx.voice_client and ctx.voice_client.is_playing():
         ctx.voice_client.pause()
+        get_queue(ctx.guild.id).mark_paused()
         await ctx.send('Playback paused.')
     else:
         await ctx.send('Nothing is currently playing.')
@@ -545,6 +3840,7 @@ async def pause(ctx):
 async def resume(ctx):
     if ctx.voice_client and ctx.voice_client.is_paused():
         ctx.voice_client.resume()
+        get_queue(ctx.guild.id).mark_resumed()
         await ctx.send('Playback resumed.')
     else:
         await ctx.send('Playback is not paused.')
@@ -552,8 +3848,7 @@ async def resume(ctx):
 
 @bot.command(name='skip', help='Skips the current song')
 async def skip(ctx):
-    if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.stop()
+    if skip_current(ctx.voice_client):
         await ctx.send('Skipped to the next song.')
     else:
         await ctx.send('Nothing is currently playing.')
@@ -572,24 +3867,15 @@ async def stop(ctx):
 
 
 @bot.command(name='queue', help='Shows the current queue')
-async def show_queue(ctx):
+async def show_queue(ctx, page: int = 1):
     queue = get_queue(ctx.guild.id)
     
     if queue.current is None and queue.is_empty():
         await ctx.send('The queue is empty.')
         return
 
-    embed = discord.Embed(title='Music Queue', color=discord.Color.blue())
-    
-    if queue.current:
-        current_title = queue.current['player'].title
-        embed.add_field(name='Now Playing', value=f'🎵 {current_title}', inline=False)
-    
-    if not queue.is_empty():
-        queue_text = '\n'.join([f'{i+1}. {item["player"].title}' for i, item in enumerate(queue.queue)])
-        embed.add_field(name='Up Next', value=queue_text, inline=False)
-    
-    await ctx.send(embed=embed)
+    view = QueueView(ctx.guild.id, page - 1)
+    view.message = await ctx.send(embed=build_queue_embed(queue, view.page), view=view)
 
 
 @bot.command(name='leave', help='Disconnects the bot from the voice channel')
@@ -657,6 +3943,7 @@ async def joke(ctx):
 
 @bot.command(name='ia', help='Ask OpenAI a question')
 async def ia(ctx, *, prompt: str):
+    openai_client = get_openai_client()
     if not openai_client:
         await ctx.send('OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.')
         return
@@ -670,21 +3957,493 @@ async def ia(ctx, *, prompt: str):
                     input=prompt
                 )
             )
-            
-            output = response.output_text
-            
-            if len(output) > 2000:
-                chunks = [output[i:i+2000] for i in range(0, len(output), 2000)]
-                for chunk in chunks:
-                    await ctx.send(chunk)
-            else:
-                await ctx.send(output)
-            
-            logger.info(f'OpenAI query from guild {ctx.guild.id}: {prompt[:50]}...')
-            
+            
+            output = response.output_text
+            
+            if len(output) > 2000:
+                chunks = [output[i:i+2000] for i in range(0, len(output), 2000)]
+                for chunk in chunks:
+                    await ctx.send(chunk)
+            else:
+                await ctx.send(output)
+            
+            logger.info(f'OpenAI query from guild {ctx.guild.id}: {prompt[:50]}...')
+            
+        except Exception as e:
+            logger.error(f'OpenAI API error: {e}')
+            await ctx.send(f'An error occurred while calling OpenAI: {str(e)}')
+
+
+def upcoming_player(guild_id: int):
+    """Player of the next queued item, read from the audio thread by the mixer"""
+    queue = music_queues.get(guild_id)
+    if not queue or not queue.queue:
+        return None
+    return queue.queue[0].get('player')
+
+
+def announce_now_playing(item: dict, fallback_channel=None):
+    channel = origin_channel(item) or fallback_channel
+    if channel is not None:
+        announcer.now_playing(channel, item['player'].title)
+
+
+async def handle_track_transition(guild_id: int, old_player, new_player, offset: float):
+    """Catch the queue up after the mixer moved on to the next track"""
+    old_player.cleanup()
+    queue = music_queues.get(guild_id)
+    if not queue or not queue.queue:
+        return
+    if queue.queue[0].get('player') is not new_player:
+        # A song was queued ahead of an autoplay pick just as the mixer claimed it
+        claimed = next((item for item in queue.queue if item.get('autoplay') and item.get('player') is new_player), None)
+        if claimed is None:
+            return
+        queue.remove_where(lambda item: item is claimed)
+        queue.add_front(claimed)
+    schedule_loudness_analysis(new_player)
+    item = queue.next()
+    queue.start_playback(offset=offset)
+    prepare_next_track(guild_id)
+    schedule_autoplay(guild_id)
+    announce_now_playing(item)
+
+
+RECOVERY_BACKOFF = (0.0, 2.0, 5.0)
+RECOVERY_MAX_PER_TRACK = 3
+
+recovery_stats = {'attempts': 0, 'recovered': 0, 'failed': 0}
+
+WATCHDOG_INTERVAL = 2.0
+WATCHDOG_STALL_SECONDS = float(os.getenv('WATCHDOG_STALL_SECONDS', '8'))
+
+watchdog_stats = {'stalls': 0, 'source_restarts': 0, 'skipped': 0, 'voice_reconnects': 0, 'failed': 0}
+watchdog_tasks = set()
+
+
+async def build_resume_player(guild_id: int, item: dict, lost_player, position: float, *, reuse_url: bool = True):
+    """A new player for the same song starting at position, reusing the stream URL while it is valid"""
+    track = lost_player.track
+    query = track.webpage_url or item.get('original_query', lost_player.title)
+    if reuse_url and track.expires_at and track.expires_at - STREAM_URL_MARGIN > time.time():
+        data = {
+            'id': track.id,
+            'title': track.title,
+            'duration': track.duration,
+            'webpage_url': track.webpage_url,
+            'url': track.url,
+        }
+    else:
+        data = await YTDLSource.resolve(query, loop=bot.loop, fresh=True)
+    player = await YTDLSource.from_url(
+        query,
+        loop=bot.loop,
+        guild_id=guild_id,
+        data=data,
+        start_time=int(position),
+        playback_speed=lost_player.playback_speed
+    )
+    player.prepare()
+    return player
+
+
+async def recover_stream(guild_id: int, lost_player, position: float):
+    """Rebuild a stream that died mid-track and resume it where it stopped.
+
+    The first attempt reuses the stream URL when it has not expired (the connection
+    dropped, the URL is fine); later ones resolve the video again. Each song gets at
+    most RECOVERY_MAX_PER_TRACK recoveries so a track with a wrong duration cannot loop.
+    """
+    queue = music_queues.get(guild_id)
+    guild = bot.get_guild(guild_id)
+    voice_client = guild.voice_client if guild else None
+    mixer = voice_client.source if voice_client and isinstance(voice_client.source, PlaybackMixer) else None
+    item = queue.current if queue else None
+    if mixer is None or item is None or item.get('player') is not lost_player:
+        return
+    if item.get('recoveries', 0) >= RECOVERY_MAX_PER_TRACK:
+        logger.warning(f'Giving up on {lost_player.title} in guild {guild_id} after {item["recoveries"]} recoveries')
+        recovery_stats['failed'] += 1
+        mixer.abandon_recovery(lost_player)
+        return
+    item['recoveries'] = item.get('recoveries', 0) + 1
+
+    logger.warning(f'Stream for {lost_player.title} in guild {guild_id} ended at {format_duration(position)}, recovering')
+    for attempt, delay in enumerate(RECOVERY_BACKOFF):
+        await asyncio.sleep(delay)
+        if item.get('player') is not lost_player or queue.current is not item:
+            return
+        recovery_stats['attempts'] += 1
+        try:
+            player = await build_resume_player(guild_id, item, lost_player, position, reuse_url=attempt == 0)
+        except Exception as e:
+            logger.warning(f'Recovery attempt {attempt + 1} for {lost_player.title} failed: {e}')
+            continue
+
+        if not mixer.recover(lost_player, player):
+            player.cleanup()
+            return
+        item['player'] = player
+        queue.start_playback()
+        recovery_stats['recovered'] += 1
+        logger.info(f'Resumed {player.title} in guild {guild_id} at {format_duration(position)}')
+        return
+
+    recovery_stats['failed'] += 1
+    mixer.abandon_recovery(lost_player)
+    logger.error(f'Could not recover {lost_player.title} in guild {guild_id}, moving on')
+
+
+async def reconnect_voice(voice_client, mixer: PlaybackMixer):
+    """Move a session whose voice connection stopped taking frames onto a fresh connection"""
+    guild_id = voice_client.guild.id
+    queue = music_queues.get(guild_id)
+    item = queue.current if queue else None
+    if item is None or item.get('player') is not mixer.current:
+        return
+    position = mixer.current_position()
+    channel = voice_client.channel
+    try:
+        player = await build_resume_player(guild_id, item, mixer.current, position)
+    except Exception as e:
+        watchdog_stats['failed'] += 1
+        logger.error(f'Could not rebuild {mixer.current.title} for a voice reconnect in guild {guild_id}: {e}')
+        return
+
+    mixer.detached = True
+    try:
+        await voice_client.disconnect(force=True)
+        voice_client = await channel.connect(self_deaf=True)
+    except Exception as e:
+        watchdog_stats['failed'] += 1
+        player.cleanup()
+        mixer.cleanup()
+        logger.error(f'Voice reconnect failed in guild {guild_id}: {e}')
+        return
+    mixer.cleanup()
+    item['player'] = player
+    start_player(voice_client, player, mixer.origin)
+    queue.start_playback()
+    watchdog_stats['voice_reconnects'] += 1
+    logger.info(f'Reconnected voice in guild {guild_id}, resumed {player.title} at {format_duration(position)}')
+
+
+async def recover_stalled_playback(voice_client, mixer: PlaybackMixer):
+    """Restart a hung source at the same position, or reconnect voice if the source is fine"""
+    guild_id = voice_client.guild.id
+    watchdog_stats['stalls'] += 1
+    stuck = mixer.reading
+    if stuck is not None and stuck is mixer.upcoming:
+        # The next song hung while fading in: drop it so the mixer claims the one after
+        logger.warning(f'Playback in guild {guild_id} stalled fading in {stuck.title}, skipping it')
+        queue = music_queues.get(guild_id)
+        if queue and queue.remove_where(lambda item: item.get('player') is stuck):
+            queue.save_state()
+        if mixer.drop_upcoming(stuck):
+            watchdog_stats['skipped'] += 1
+        prepare_next_track(guild_id)
+        return
+    if stuck is not None:
+        logger.warning(f'Playback in guild {guild_id} stalled waiting on {stuck.title}, restarting the stream')
+        if mixer.mark_stalled(stuck):
+            watchdog_stats['source_restarts'] += 1
+            await recover_stream(guild_id, stuck, mixer.current_position())
+        return
+    logger.warning(f'Playback in guild {guild_id} stalled with no read pending, reconnecting voice')
+    await reconnect_voice(voice_client, mixer)
+
+
+async def playback_watchdog():
+    """Background task that notices sessions reporting is_playing() while no frames flow"""
+    await bot.wait_until_ready()
+    progress = {}
+    recovering = set()
+
+    async def recover(voice_client, mixer):
+        guild_id = voice_client.guild.id
+        recovering.add(guild_id)
+        try:
+            await recover_stalled_playback(voice_client, mixer)
+        except Exception as e:
+            watchdog_stats['failed'] += 1
+            logger.error(f'Stall recovery failed in guild {guild_id}: {e}')
+        finally:
+            recovering.discard(guild_id)
+
+    while not bot.is_closed():
+        now = time.monotonic()
+        active = set()
+        for voice_client in list(bot.voice_clients):
+            guild_id = voice_client.guild.id
+            mixer = voice_client.source if isinstance(voice_client.source, PlaybackMixer) else None
+            if mixer is None or mixer.finished or not voice_client.is_playing() or guild_id in recovering:
+                continue
+            active.add(guild_id)
+            frames, since = progress.get(guild_id, (None, now))
+            if frames != mixer.frames_out:
+                progress[guild_id] = (mixer.frames_out, now)
+            elif now - since >= WATCHDOG_STALL_SECONDS:
+                progress.pop(guild_id, None)
+                task = bot.loop.create_task(recover(voice_client, mixer))
+                watchdog_tasks.add(task)
+                task.add_done_callback(watchdog_tasks.discard)
+        for guild_id in list(progress):
+            if guild_id not in active:
+                del progress[guild_id]
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+
+
+def start_player(voice_client, player, origin: dict) -> PlaybackMixer:
+    """Play through the guild's mixer, swapping in place when a session is already running"""
+    schedule_loudness_analysis(player)
+    try:
+        # Spawn here on the loop, where making room can see which players are live
+        player.prepare()
+    except FFmpegCapacityError as e:
+        logger.info(f'Could not make room for FFmpeg in guild {voice_client.guild.id}: {e}')
+    mixer = voice_client.source if isinstance(voice_client.source, PlaybackMixer) else None
+    if mixer and not mixer.finished and (voice_client.is_playing() or voice_client.is_paused()):
+        mixer.origin = origin
+        mixer.replace_current(player)
+        return mixer
+
+    guild_id = voice_client.guild.id
+    queue = get_queue(guild_id)
+
+    def on_transition(old_player, new_player, offset):
+        asyncio.run_coroutine_threadsafe(
+            handle_track_transition(guild_id, old_player, new_player, offset),
+            bot.loop
+        )
+
+    def on_stream_lost(lost_player, position):
+        asyncio.run_coroutine_threadsafe(
+            recover_stream(guild_id, lost_player, position),
+            bot.loop
+        )
+
+    mixer = PlaybackMixer(
+        player,
+        next_provider=lambda: upcoming_player(guild_id),
+        on_transition=on_transition,
+        on_stream_lost=on_stream_lost,
+        crossfade_seconds=queue.crossfade_seconds
+    )
+    mixer.origin = origin
+    mixer.telemetry = telemetry_for(guild_id)
+
+    def after_playing(error):
+        if error:
+            logger.error(f'Player error in guild {guild_id}: {error}')
+            logger.error(traceback.format_exc())
+        if mixer.detached:
+            # The session moved to a new voice connection or is being dropped
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(advance_queue(mixer.origin), bot.loop)
+        except Exception as e:
+            logger.error(f'Failed to queue next song: {e}')
+
+    voice_client.play(mixer, after=after_playing)
+    encoder = getattr(voice_client, 'encoder', None)
+    if mixer.telemetry is not None and encoder and not isinstance(encoder, InstrumentedEncoder):
+        voice_client.encoder = InstrumentedEncoder(encoder, mixer.telemetry)
+    return mixer
+
+
+def skip_current(voice_client) -> bool:
+    """Skip within the running mixer when possible, otherwise stop the session"""
+    if not voice_client or not voice_client.is_playing():
+        return False
+    mixer = voice_client.source
+    if isinstance(mixer, PlaybackMixer) and mixer.skip():
+        return True
+    voice_client.stop()
+    return True
+
+
+async def build_history_player(entry: dict, guild_id: int, playback_speed: float = 1.0):
+    """Player for a history entry, reusing its cached stream URL while it is still valid"""
+    if stream_url_is_fresh(entry):
+        data = {
+            'id': entry.get('id'),
+            'title': entry['title'],
+            'duration': entry.get('duration'),
+            'webpage_url': entry.get('webpage_url'),
+            'url': entry['stream_url'],
+        }
+        return await YTDLSource.from_url(
+            entry['original_query'],
+            loop=bot.loop,
+            guild_id=guild_id,
+            data=data,
+            playback_speed=playback_speed
+        )
+    return await YTDLSource.from_url(
+        entry.get('webpage_url') or entry['original_query'],
+        loop=bot.loop,
+        guild_id=guild_id,
+        stream=True,
+        playback_speed=playback_speed
+    )
+
+
+def play_item_now(voice_client, item: dict, origin: dict):
+    """Make item the current song, swapping it into the running session if there is one"""
+    guild_id = voice_client.guild.id
+    queue = get_queue(guild_id)
+    queue.current = item
+    start_player(voice_client, item['player'], origin)
+    if voice_client.is_paused():
+        voice_client.resume()
+    queue.start_playback()
+    prepare_next_track(guild_id)
+
+
+async def play_previous(voice_client, origin: dict) -> Optional[str]:
+    """Go back to the last played song; the interrupted one is queued to play next"""
+    guild_id = voice_client.guild.id
+    queue = get_queue(guild_id)
+    entry = queue.history.get(0)
+    if entry is None:
+        return None
+
+    player = await build_history_player(entry, guild_id, queue.playback_speed)
+    queue.history.remove(entry)
+    if queue.current:
+        interrupted = history_entry(queue.current)
+        resumed = dict(queue.current)
+        resumed['player'] = await build_history_player(interrupted, guild_id, queue.playback_speed)
+        queue.add_front(resumed)
+    play_item_now(voice_client, {'player': player, 'original_query': entry['original_query'], **origin}, origin)
+    return player.title
+
+
+async def replay_track(voice_client, origin: dict, index: Optional[int] = None) -> Optional[tuple]:
+    """Restart the current song, or queue the given history entry (1 is the most recent).
+
+    Returns (title, queued), where queued is False when the song started right away.
+    """
+    guild_id = voice_client.guild.id
+    queue = get_queue(guild_id)
+    if index is None and queue.current:
+        item = dict(queue.current)
+        item['player'] = await build_history_player(history_entry(queue.current), guild_id, queue.playback_speed)
+        play_item_now(voice_client, item, origin)
+        return item['player'].title, False
+
+    entry = queue.history.get((index or 1) - 1)
+    if entry is None:
+        return None
+    player = await build_history_player(entry, guild_id, queue.playback_speed)
+    queue.add({'player': player, 'original_query': entry['original_query'], **origin})
+    if not voice_client.is_playing() and not voice_client.is_paused():
+        await advance_queue(origin)
+        return player.title, False
+    return player.title, True
+
+
+def build_history_embed(guild_id: int) -> discord.Embed:
+    queue = get_queue(guild_id)
+    embed = discord.Embed(title='Recently Played', color=discord.Color.blue())
+    lines = []
+    for number, entry in enumerate(queue.history.entries, start=1):
+        duration = format_duration(entry['duration']) if entry.get('duration') else 'Live'
+        lines.append(f"{number}. {entry['title']} ({duration})")
+    embed.description = '\n'.join(lines)[:4096]
+    return embed
+
+
+async def advance_queue(origin: dict):
+    """Start the next queued item using whichever command origin queued it"""
+    if 'ctx' in origin:
+        await play_next(origin['ctx'])
+    elif 'interaction' in origin:
+        await play_next_slash(origin['interaction'])
+    else:
+        await play_next_in_channel(origin['channel'])
+
+
+async def play_next_in_channel(channel):
+    """play_next for a session resumed without a command, e.g. taken over from another node"""
+    guild_id = channel.guild.id
+    queue = get_queue(guild_id)
+    voice_client = channel.guild.voice_client
+
+    if queue.is_empty():
+        queue.next()  # moves the finished song into history
+        schedule_autoplay(guild_id)
+        return
+
+    if not voice_client or voice_client.is_playing() or voice_client.is_paused():
+        return
+
+    item = queue.next()
+    if item is None:
+        return
+
+    player = item['player']
+    start_player(voice_client, player, {'channel': channel})
+    queue.start_playback()
+    prepare_next_track(guild_id)
+    schedule_autoplay(guild_id)
+    announcer.now_playing(channel, player.title)
+
+
+async def restore_saved_state(saved_state: dict, voice_client, origin: dict, send) -> int:
+    """Rebuild players for a saved session, resume the current song and refill the queue"""
+    guild_id = voice_client.guild.id
+    queue = get_queue(guild_id)
+    queue.playback_speed = saved_state.get('playback_speed', 1.0)
+    queue.history.load(saved_state.get('history', []))
+    if saved_state.get('autoplay'):
+        enable_autoplay(guild_id, origin)
+    restored_count = 0
+    
+    if saved_state.get('current'):
+        current = saved_state['current']
+        logger.info(f'Resuming: {current["title"]} at position {current.get("position", 0)}s')
+        
+        position = current.get('position', 0)
+        playback_speed = current.get('playback_speed', queue.playback_speed)
+        player = await YTDLSource.from_url(
+            current['original_query'],
+            loop=bot.loop,
+            guild_id=guild_id,
+            stream=True,
+            start_time=position,
+            playback_speed=playback_speed
+        )
+        queue.current = {'player': player, 'original_query': current['original_query'], **origin}
+        
+        start_player(voice_client, player, origin)
+        if saved_state.get('current_volume'):
+            logger.info(f'Restored volume to {saved_state["current_volume"]}')
+            voice_client.source.volume = saved_state['current_volume']
+        queue.start_playback()
+        restored_count += 1
+        await send(f'Resumed: **{current["title"]}** at {format_duration(position)}')
+    
+    for item in saved_state.get('queue', []):
+        try:
+            player = await YTDLSource.from_url(
+                item['original_query'],
+                loop=bot.loop,
+                guild_id=guild_id,
+                stream=True,
+                start_time=item.get('start_time', 0),
+                playback_speed=item.get('playback_speed', queue.playback_speed)
+            )
+            queue.add({'player': player, 'original_query': item['original_query'], **origin})
+            restored_count += 1
         except Exception as e:
-            logger.error(f'OpenAI API error: {e}')
-            await ctx.send(f'An error occurred while calling OpenAI: {str(e)}')
+            logger.error(f'Failed to restore song {item["title"]}: {e}')
+    
+    if restored_count > 1:
+        await send(f'Restored {restored_count} song(s) from saved session.')
+    
+    logger.info(f'Guild {guild_id} resumed session with {restored_count} songs')
+    return restored_count
 
 
 @bot.command(name='restore', aliases=['resumesession'], help='Restore playback from saved session')
@@ -696,7 +4455,8 @@ async def restore_session(ctx):
     voice_channel = ctx.author.voice.channel
     queue = get_queue(ctx.guild.id)
     
-    saved_state = MusicQueue.load_state(ctx.guild.id)
+    evicted_guilds.pop(ctx.guild.id, None)
+    saved_state = await MusicQueue.load_state(ctx.guild.id)
     if not saved_state:
         await ctx.send('No saved session found for this server.')
         return
@@ -717,59 +4477,7 @@ async def restore_session(ctx):
     
     async with ctx.typing():
         try:
-            restored_count = 0
-            
-            if saved_state.get('current'):
-                current = saved_state['current']
-                logger.info(f'Resuming: {current["title"]} at position {current.get("position", 0)}s')
-                
-                position = current.get('position', 0)
-                playback_speed = current.get('playback_speed', queue.playback_speed)
-                player = await YTDLSource.from_url(
-                    current['original_query'],
-                    loop=bot.loop,
-                    stream=True,
-                    start_time=position,
-                    playback_speed=playback_speed
-                )
-                queue.current = {'player': player, 'ctx': ctx, 'original_query': current['original_query']}
-                
-                def after_playing(error):
-                    if error:
-                        logger.error(f'Player error in guild {ctx.guild.id}: {error}')
-                        logger.error(traceback.format_exc())
-                    try:
-                        asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-                    except Exception as e:
-                        logger.error(f'Failed to queue next song: {e}')
-                
-                ctx.voice_client.play(player, after=after_playing)
-                if saved_state.get('current_volume'):
-                    logger.info(f'Restored volume to {saved_state["current_volume"]}')
-                    ctx.voice_client.source.volume = saved_state['current_volume']
-                queue.start_playback()
-                restored_count += 1
-                await ctx.send(f'Resumed: **{current["title"]}** at {format_duration(position)}')
-            
-            for item in saved_state.get('queue', []):
-                try:
-                    player = await YTDLSource.from_url(
-                        item['original_query'],
-                        loop=bot.loop,
-                        stream=True,
-                        start_time=item.get('start_time', 0),
-                        playback_speed=item.get('playback_speed', queue.playback_speed)
-                    )
-                    queue.add({'player': player, 'ctx': ctx, 'original_query': item['original_query']})
-                    restored_count += 1
-                except Exception as e:
-                    logger.error(f'Failed to restore song {item["title"]}: {e}')
-            
-            if restored_count > 1:
-                await ctx.send(f'Restored {restored_count} song(s) from saved session.')
-            
-            logger.info(f'Guild {ctx.guild.id} resumed session with {restored_count} songs')
-            
+            await restore_saved_state(saved_state, ctx.voice_client, {'ctx': ctx}, ctx.send)
         except Exception as e:
             logger.error(f'Error resuming session: {e}')
             logger.error(traceback.format_exc())
@@ -800,6 +4508,8 @@ async def status(ctx):
     embed.add_field(name='Voice Status', value=voice_status, inline=True)
     
     queue_info = f'{len(queue.queue)} song(s)' if not queue.is_empty() else 'Empty'
+    if queue.autoplay:
+        queue_info += f" + autoplay ({len(queue.autoplay.ready)} ready)"
     embed.add_field(name='Queue', value=queue_info, inline=True)
     
     if queue.current:
@@ -809,13 +4519,295 @@ async def status(ctx):
             value=format_duration(current_pos),
             inline=True
         )
+        buffer = queue.current['player'].buffer_stats()
+        if buffer:
+            embed.add_field(
+                name='Audio Buffer',
+                value=f"{buffer['depth']}/{buffer['capacity']} frames, {buffer['underruns']} underrun(s)",
+                inline=True
+            )
     
     embed.add_field(name='Servers', value=len(bot.guilds), inline=True)
+    embed.add_field(name='Search Sessions', value=len(search_sessions), inline=True)
+    embed.add_field(
+        name='Resolve Cache',
+        value=f'{len(resolve_cache)} videos ({resolve_cache.hits} hits, {resolve_cache.misses} misses)',
+        inline=True
+    )
+    if library_backend:
+        embed.add_field(name='Library', value=f'{len(library_backend.entries)} tracks', inline=True)
+    embed.add_field(name='FFmpeg Processes', value=len(ffmpeg_supervisor), inline=True)
+    if voice_telemetry:
+        embed.add_field(name='Voice Path', value=format_telemetry(combined_telemetry()), inline=False)
+    embed.add_field(
+        name='Playback Watchdog',
+        value=(
+            f"{watchdog_stats['stalls']} stall(s): {watchdog_stats['source_restarts']} stream restart(s), "
+            f"{watchdog_stats['skipped']} skipped, {watchdog_stats['voice_reconnects']} voice reconnect(s), "
+            f"{watchdog_stats['failed']} failed"
+        ),
+        inline=True
+    )
+    embed.add_field(
+        name='Stream URLs Refreshed',
+        value=f"{url_refresh_stats['refreshed']} ({url_refresh_stats['failed']} failed)",
+        inline=True
+    )
+    embed.add_field(name='Idle Sessions Saved', value=len(evicted_guilds), inline=True)
+    embed.add_field(
+        name='Stream Recoveries',
+        value=f"{recovery_stats['recovered']} recovered, {recovery_stats['failed']} failed",
+        inline=True
+    )
+    embed.add_field(
+        name='Track Transitions',
+        value=f"{playback_stats['transitions']} ({playback_stats['crossfades']} crossfaded, "
+              f"{playback_stats['stall_seconds'] * 1000:.0f}ms stalled)",
+        inline=True
+    )
+    embed.add_field(
+        name='Announcements',
+        value=f"{announcer.stats['sent']} sent, {announcer.stats['edited']} edited ({announcer.saved} saved)",
+        inline=True
+    )
+    embed.add_field(name='Runtime', value=f"{runtime_info['event_loop']} + {runtime_info['json']}", inline=True)
+    embed.add_field(name='State Backend', value=f'{state_backend.name} ({NODE_ID})' if state_backend.shared else state_backend.name, inline=True)
     embed.add_field(name='Bot Version', value='1.0.0', inline=True)
     
     await ctx.send(embed=embed)
 
 
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 300
+PROFILE_TRACE_FRAMES = 10
+PROFILE_TOP = 10
+PROFILE_MODES = ('cpu', 'memory', 'tasks')
+# Innermost Python frames of threads that are blocked rather than running: lock and
+# condition waits, the event loop's select, idle executor workers and queue reads.
+PROFILE_IDLE_FRAMES = {
+    ('wait', 'threading.py'), ('_wait_for_tstate_lock', 'threading.py'), ('join', 'threading.py'),
+    ('select', 'selectors.py'), ('poll', 'selectors.py'), ('_worker', 'thread.py'),
+    ('get', 'queue.py'), ('recv_into', 'socket.py'), ('accept', 'socket.py'),
+}
+
+profile_lock = asyncio.Lock()
+
+
+def sample_stacks(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> tuple:
+    """Sample every other thread's Python stack for seconds; returns ({collapsed stack: count}, rounds, idle).
+
+    Samples are wall-clock, so threads blocked in a wait (PROFILE_IDLE_FRAMES) are
+    counted in idle and left out of the stacks instead of drowning the busy ones.
+    Runs in its own thread and only exists while a profile is being taken, so the
+    bot carries no profiling overhead otherwise.
+    """
+    own_ident = threading.get_ident()
+    stacks = {}
+    rounds = idle = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if (frame.f_code.co_name, os.path.basename(frame.f_code.co_filename)) in PROFILE_IDLE_FRAMES:
+                idle += 1
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            parts.append(thread_names.get(ident, f'thread-{ident}'))
+            key = ';'.join(reversed(parts))
+            stacks[key] = stacks.get(key, 0) + 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds, idle
+
+
+def profile_path(kind: str, extension: str = 'txt') -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+
+async def profile_cpu(seconds: float) -> tuple:
+    """Sampling CPU profile of all threads; writes collapsed stacks (flamegraph.pl / speedscope input)
+
+    The sampler gets a thread of its own rather than a default executor slot, which
+    it would otherwise hold for up to PROFILE_MAX_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def sample():
+        try:
+            result = sample_stacks(seconds)
+        except Exception as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, result)
+
+    threading.Thread(target=sample, name='profile-sampler', daemon=True).start()
+    stacks, rounds, idle = await future
+    path = profile_path('cpu')
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(stacks.items(), key=lambda pair: pair[1], reverse=True):
+            f.write(f'{stack} {count}\n')
+
+    per_thread, leaves = {}, {}
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        per_thread[frames[0]] = per_thread.get(frames[0], 0) + count
+        if len(frames) > 1:
+            leaves[frames[-1]] = leaves.get(frames[-1], 0) + count
+    busy = sum(stacks.values())
+    total = busy or 1
+    lines = [
+        f'{rounds} rounds over {seconds:g}s (wall-clock), {len(per_thread)} busy thread(s)',
+        f'{busy} busy samples, {idle} idle samples (blocked in a wait) left out',
+        '', 'Top functions (self, % of busy samples):',
+    ]
+    for name, count in sorted(leaves.items(), key=lambda pair: pair[1], reverse=True)[:PROFILE_TOP]:
+        lines.append(f'{100 * count / total:5.1f}%  {name}')
+    return '\n'.join(lines), path
+
+
+def memory_report(before, after, seconds: float, traced: int, peak: int) -> tuple:
+    """Compare two tracemalloc snapshots into a summary and a full report file"""
+    stats = after.compare_to(before, 'traceback')
+
+    path = profile_path('memory')
+    with open(path, 'w', encoding='utf-8') as f:
+        for stat in stats:
+            if not stat.size_diff:
+                continue
+            f.write(f'{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), {stat.size / 1024:.1f} KiB now\n')
+            for line in stat.traceback.format():
+                f.write(f'    {line}\n')
+            f.write('\n')
+
+    growth = sum(stat.size_diff for stat in stats)
+    lines = [f'{growth / 1024:+.1f} KiB over {seconds:g}s (traced {traced / 1048576:.1f} MiB, peak {peak / 1048576:.1f} MiB)', '', 'Top allocators:']
+    for stat in after.compare_to(before, 'lineno')[:PROFILE_TOP]:
+        frame = stat.traceback[0]
+        lines.append(f'{stat.size_diff / 1024:+9.1f} KiB  {os.path.basename(frame.filename)}:{frame.lineno}')
+    return '\n'.join(lines), path
+
+
+async def profile_memory(seconds: float) -> tuple:
+    """tracemalloc growth over seconds, by allocating line"""
+    loop = asyncio.get_running_loop()
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(PROFILE_TRACE_FRAMES)
+    try:
+        # Snapshots walk every traced block; take and compare them off the event loop
+        before = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+        await asyncio.sleep(seconds)
+        after = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+        traced, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    return await loop.run_in_executor(None, memory_report, before, after, seconds, traced, peak)
+
+
+async def profile_tasks() -> tuple:
+    """Every asyncio task with its current stack"""
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    path = profile_path('tasks')
+    counts = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        for task in tasks:
+            coro = task.get_coro()
+            name = getattr(coro, '__qualname__', repr(coro))
+            counts[name] = counts.get(name, 0) + 1
+            f.write(f'{task.get_name()}: {name}\n')
+            task.print_stack(file=f)
+            f.write('\n')
+    lines = [f'{len(tasks)} task(s)', '']
+    for name, count in sorted(counts.items(), key=lambda pair: pair[1], reverse=True)[:PROFILE_TOP]:
+        lines.append(f'{count:5d}  {name}')
+    return '\n'.join(lines), path
+
+
+async def run_profile(mode: str, seconds: float) -> tuple:
+    """Take one profile; returns (summary, path). Only one profile runs at a time."""
+    seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+    async with profile_lock:
+        if mode == 'cpu':
+            return await profile_cpu(seconds)
+        if mode == 'memory':
+            return await profile_memory(seconds)
+        return await profile_tasks()
+
+
+PROFILE_ATTACHMENT_LIMIT = 8 * 1024 * 1024
+
+
+def profile_reply(mode: str, summary: str, path: str) -> dict:
+    """Message arguments for a finished profile: the summary, plus the file when Discord accepts its size"""
+    reply = {'content': f'**{mode} profile** saved to `{path}`\n```\n{summary[:1800]}\n```'}
+    if os.path.getsize(path) <= PROFILE_ATTACHMENT_LIMIT:
+        reply['file'] = discord.File(path)
+    return reply
+
+
+def build_processes_embed(guild_id: int) -> discord.Embed:
+    rows = ffmpeg_supervisor.snapshot()
+    guild_rows = [row for row in rows if row['guild_id'] == guild_id]
+    embed = discord.Embed(title='FFmpeg Processes', color=discord.Color.blue())
+    total_rss = sum(row['rss_bytes'] or 0 for row in rows)
+    embed.add_field(
+        name='All Servers',
+        value=f'{len(rows)} process(es), {total_rss / 1048576:.1f} MiB RSS',
+        inline=False
+    )
+    embed.add_field(
+        name='Limits',
+        value=f'{ffmpeg_supervisor.max_per_guild} per server, {ffmpeg_supervisor.max_processes} total',
+        inline=False
+    )
+    if guild_rows:
+        lines = []
+        for row in guild_rows:
+            rss = f"{row['rss_bytes'] / 1048576:.1f} MiB" if row['rss_bytes'] is not None else 'n/a'
+            cpu = f"{row['cpu_percent']:.1f}%" if row['cpu_percent'] is not None else 'n/a'
+            lines.append(f"PID {row['pid']}: {rss}, CPU {cpu}, up {format_duration(row['age'])}")
+        embed.add_field(name='This Server', value='\n'.join(lines)[:1024], inline=False)
+    else:
+        embed.add_field(name='This Server', value='No FFmpeg processes', inline=False)
+    embed.set_footer(
+        text=f'Spawned {ffmpeg_supervisor.spawned_count}, reaped {ffmpeg_supervisor.reaped_count}, '
+             f'rejected {ffmpeg_supervisor.rejected_count}'
+    )
+    return embed
+
+
+@bot.command(name='processes', aliases=['ffmpeg'], help='Show FFmpeg process usage')
+async def processes(ctx):
+    await ctx.send(embed=build_processes_embed(ctx.guild.id))
+
+
+@bot.command(name='profile', help='Owner only: profile the running bot (cpu|memory|tasks) [seconds]')
+@commands.is_owner()
+async def profile(ctx, mode: str = 'cpu', seconds: float = 10.0):
+    mode = mode.lower()
+    if mode not in PROFILE_MODES:
+        await ctx.send(f"Mode must be one of: {', '.join(PROFILE_MODES)}.")
+        return
+    if profile_lock.locked():
+        await ctx.send('A profile is already being taken.')
+        return
+    if mode != 'tasks':
+        await ctx.send(f'Taking a {mode} profile for {min(max(seconds, 1.0), PROFILE_MAX_SECONDS):g}s...')
+    summary, path = await run_profile(mode, seconds)
+    logger.info(f'{mode} profile requested by {ctx.author.id} saved to {path}')
+    await ctx.send(**profile_reply(mode, summary, path))
+
+
 @bot.command(name='seek', help='Seek to a specific time in the current song (format: seconds or MM:SS)')
 async def seek(ctx, *, time: str):
     queue = get_queue(ctx.guild.id)
@@ -838,13 +4830,11 @@ async def seek(ctx, *, time: str):
         
         async with ctx.typing():
             original_query = queue.current.get('original_query', player_data.title)
-            current_source = ctx.voice_client.source
-            current_volume = getattr(current_source, 'volume', None) if current_source else None
-            ctx.voice_client.stop()
             
             new_player = await YTDLSource.from_url(
                 original_query,
                 loop=bot.loop,
+                guild_id=ctx.guild.id,
                 stream=True,
                 start_time=seek_seconds,
                 playback_speed=player_data.playback_speed
@@ -856,14 +4846,7 @@ async def seek(ctx, *, time: str):
             metadata['original_query'] = original_query
             queue.current = metadata
             
-            def after_playing(error):
-                if error:
-                    logger.error(f'Player error in guild {ctx.guild.id}: {error}')
-                asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-            
-            ctx.voice_client.play(new_player, after=after_playing)
-            if current_volume is not None:
-                new_player.volume = current_volume
+            start_player(ctx.voice_client, new_player, {'ctx': ctx})
             queue.start_playback()
             logger.info(f'Guild {ctx.guild.id} seeked to {seek_seconds}s')
             await ctx.send(f'Seeked to {format_duration(seek_seconds)} in **{new_player.title}**')
@@ -901,13 +4884,11 @@ async def forward(ctx, seconds: int):
         
         async with ctx.typing():
             original_query = queue.current.get('original_query', player_data.title)
-            current_source = ctx.voice_client.source
-            current_volume = getattr(current_source, 'volume', None) if current_source else None
-            ctx.voice_client.stop()
             
             new_player = await YTDLSource.from_url(
                 original_query,
                 loop=bot.loop,
+                guild_id=ctx.guild.id,
                 stream=True,
                 start_time=new_position,
                 playback_speed=player_data.playback_speed
@@ -919,14 +4900,7 @@ async def forward(ctx, seconds: int):
             metadata['original_query'] = original_query
             queue.current = metadata
             
-            def after_playing(error):
-                if error:
-                    logger.error(f'Player error in guild {ctx.guild.id}: {error}')
-                asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-            
-            ctx.voice_client.play(new_player, after=after_playing)
-            if current_volume is not None:
-                new_player.volume = current_volume
+            start_player(ctx.voice_client, new_player, {'ctx': ctx})
             queue.start_playback()
             
             direction = 'forward' if seconds > 0 else 'backward'
@@ -976,13 +4950,10 @@ async def change_speed(ctx, speed: float):
             if current_player.duration and current_position >= current_player.duration:
                 current_position = max(current_player.duration - 1, 0)
 
-            current_source = voice_client.source
-            current_volume = getattr(current_source, 'volume', None) if current_source else None
-            voice_client.stop()
-
             new_player = await YTDLSource.from_url(
                 original_query,
                 loop=bot.loop,
+                guild_id=ctx.guild.id,
                 stream=True,
                 start_time=current_position,
                 playback_speed=speed
@@ -994,18 +4965,7 @@ async def change_speed(ctx, speed: float):
             metadata['original_query'] = original_query
             queue.current = metadata
 
-            def after_playing(error):
-                if error:
-                    logger.error(f'Player error in guild {ctx.guild.id}: {error}')
-                    logger.error(traceback.format_exc())
-                try:
-                    asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-                except Exception as exc:
-                    logger.error(f'Failed to queue next song: {exc}')
-
-            voice_client.play(new_player, after=after_playing)
-            if current_volume is not None:
-                new_player.volume = current_volume
+            start_player(voice_client, new_player, {'ctx': ctx})
             queue.start_playback()
 
             await ctx.send(
@@ -1018,6 +4978,86 @@ async def change_speed(ctx, speed: float):
             await ctx.send(f'An error occurred while changing playback speed: {str(e)}')
 
 
+@bot.command(name='crossfade', aliases=['fade'], help=f'Crossfade between songs (0-{int(MAX_CROSSFADE_SECONDS)} seconds, 0 for gapless)')
+async def crossfade(ctx, seconds: float):
+    if not 0 <= seconds <= MAX_CROSSFADE_SECONDS:
+        await ctx.send(f'Crossfade must be between 0 and {int(MAX_CROSSFADE_SECONDS)} seconds.')
+        return
+
+    queue = get_queue(ctx.guild.id)
+    queue.crossfade_seconds = seconds
+    if ctx.voice_client and isinstance(ctx.voice_client.source, PlaybackMixer):
+        ctx.voice_client.source.crossfade_seconds = seconds
+
+    if seconds:
+        await ctx.send(f'Crossfading {seconds:g} seconds between songs.')
+    else:
+        await ctx.send('Crossfade disabled, songs will play back to back.')
+
+
+@bot.command(name='autoplay', aliases=['radio'], help='Toggles playing related songs when the queue runs out')
+async def autoplay(ctx):
+    queue = get_queue(ctx.guild.id)
+    if queue.autoplay is None:
+        enable_autoplay(ctx.guild.id, {'ctx': ctx})
+        await ctx.send('Autoplay on: related songs will play when the queue runs out.')
+    else:
+        disable_autoplay(ctx.guild.id)
+        await ctx.send('Autoplay off.')
+
+
+@bot.command(name='previous', aliases=['prev', 'back'], help='Plays the previous song again')
+async def previous(ctx):
+    if not ctx.voice_client or not ctx.voice_client.is_connected():
+        await ctx.send('I am not in a voice channel.')
+        return
+
+    async with ctx.typing():
+        try:
+            title = await play_previous(ctx.voice_client, {'ctx': ctx})
+        except Exception as e:
+            logger.error(f'Error going back in guild {ctx.guild.id}: {e}')
+            await ctx.send(f'An error occurred: {str(e)}')
+            return
+
+    if title is None:
+        await ctx.send('There is no previous song.')
+    else:
+        await ctx.send(f'Back to: **{title}**')
+
+
+@bot.command(name='replay', aliases=['again'], help='Restarts the current song, or queues a song from history by number')
+async def replay(ctx, number: Optional[int] = None):
+    if not ctx.voice_client or not ctx.voice_client.is_connected():
+        await ctx.send('I am not in a voice channel.')
+        return
+
+    async with ctx.typing():
+        try:
+            replayed = await replay_track(ctx.voice_client, {'ctx': ctx}, number)
+        except Exception as e:
+            logger.error(f'Error replaying in guild {ctx.guild.id}: {e}')
+            await ctx.send(f'An error occurred: {str(e)}')
+            return
+
+    if replayed is None:
+        await ctx.send('Nothing to replay. Use the history command to see recent songs.')
+        return
+    title, queued = replayed
+    if queued:
+        await ctx.send(f'Added to queue: **{title}**')
+    elif number is None:
+        await ctx.send(f'Replaying **{title}** from the start.')
+
+
+@bot.command(name='history', aliases=['recent'], help='Shows recently played songs')
+async def history(ctx):
+    if not len(get_queue(ctx.guild.id).history):
+        await ctx.send('No songs have been played yet.')
+        return
+    await ctx.send(embed=build_history_embed(ctx.guild.id))
+
+
 def parse_time_input(time_str: str) -> int:
     """Parse time input from various formats to seconds"""
     time_str = time_str.strip()
@@ -1057,7 +5097,7 @@ def format_speed(speed: float) -> str:
 @app_commands.describe(query='YouTube URL or search query')
 async def slash_play(interaction: discord.Interaction, query: str):
     if not interaction.user.voice:
-        await interaction.response.send_message('You need to be in a voice channel to use this command.', ephemeral=True)
+        await respond(interaction, 'You need to be in a voice channel to use this command.', ephemeral=True)
         return
 
     voice_channel = interaction.user.voice.channel
@@ -1070,13 +5110,14 @@ async def slash_play(interaction: discord.Interaction, query: str):
     elif voice_client.channel != voice_channel:
         await voice_client.move_to(voice_channel)
 
-    await interaction.response.defer()
+    await defer_response(interaction)
     
     try:
         start_time = YTDLSource.extract_start_time(query)
         player = await YTDLSource.from_url(
             query,
             loop=bot.loop,
+            guild_id=interaction.guild.id,
             stream=True,
             start_time=start_time,
             playback_speed=queue.playback_speed
@@ -1096,7 +5137,11 @@ async def play_next_slash(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
     
     if queue.is_empty():
-        queue.current = None
+        queue.next()  # moves the finished song into history
+        schedule_autoplay(interaction.guild.id)
+        return
+
+    if not voice_client or voice_client.is_playing() or voice_client.is_paused():
         return
 
     item = queue.next()
@@ -1104,27 +5149,18 @@ async def play_next_slash(interaction: discord.Interaction):
         return
 
     player = item['player']
-    
-    def after_playing(error):
-        if error:
-            logger.error(f'Player error in guild {interaction.guild.id}: {error}')
-            logger.error(traceback.format_exc())
-        try:
-            asyncio.run_coroutine_threadsafe(play_next_slash(interaction), bot.loop)
-        except Exception as e:
-            logger.error(f'Failed to queue next song: {e}')
-
-    voice_client.play(player, after=after_playing)
+    start_player(voice_client, player, {'interaction': interaction})
     queue.start_playback()
-    
-    try:
-        if 'interaction' in item:
+    prepare_next_track(interaction.guild.id)
+    schedule_autoplay(interaction.guild.id)
+    if 'interaction' in item:
+        # The slash command that queued this is still waiting for its deferred response
+        try:
             await item['interaction'].followup.send(f'Now playing: **{player.title}**')
-        else:
-            channel = interaction.channel
-            await channel.send(f'Now playing: **{player.title}**')
-    except Exception as e:
-        logger.error(f'Failed to send now playing message: {e}')
+        except Exception as e:
+            logger.error(f'Failed to send now playing message: {e}')
+    else:
+        announce_now_playing(item, fallback_channel=interaction.channel)
 
 
 @bot.tree.command(name='pause', description='Pause the current audio')
@@ -1132,9 +5168,10 @@ async def slash_pause(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
     if voice_client and voice_client.is_playing():
         voice_client.pause()
-        await interaction.response.send_message('Playback paused.')
+        get_queue(interaction.guild.id).mark_paused()
+        await respond(interaction, 'Playback paused.')
     else:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
 
 
 @bot.tree.command(name='resume', description='Resume the paused audio')
@@ -1142,19 +5179,19 @@ async def slash_resume(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
     if voice_client and voice_client.is_paused():
         voice_client.resume()
-        await interaction.response.send_message('Playback resumed.')
+        get_queue(interaction.guild.id).mark_resumed()
+        await respond(interaction, 'Playback resumed.')
     else:
-        await interaction.response.send_message('Playback is not paused.', ephemeral=True)
+        await respond(interaction, 'Playback is not paused.', ephemeral=True)
 
 
 @bot.tree.command(name='skip', description='Skip the current song')
 async def slash_skip(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
-    if voice_client and voice_client.is_playing():
-        voice_client.stop()
-        await interaction.response.send_message('Skipped to the next song.')
+    if skip_current(voice_client):
+        await respond(interaction, 'Skipped to the next song.')
     else:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
 
 
 @bot.tree.command(name='stop', description='Stop playback and clear the queue')
@@ -1171,24 +5208,17 @@ async def slash_stop(interaction: discord.Interaction):
 
 
 @bot.tree.command(name='queue', description='Show the current queue')
-async def slash_queue(interaction: discord.Interaction):
+@app_commands.describe(page='Page of the queue to show (default 1)')
+async def slash_queue(interaction: discord.Interaction, page: int = 1):
     queue = get_queue(interaction.guild.id)
     
     if queue.current is None and queue.is_empty():
-        await interaction.response.send_message('The queue is empty.', ephemeral=True)
+        await respond(interaction, 'The queue is empty.', ephemeral=True)
         return
 
-    embed = discord.Embed(title='Music Queue', color=discord.Color.blue())
-    
-    if queue.current:
-        current_title = queue.current['player'].title
-        embed.add_field(name='Now Playing', value=f'🎵 {current_title}', inline=False)
-    
-    if not queue.is_empty():
-        queue_text = '\n'.join([f'{i+1}. {item["player"].title}' for i, item in enumerate(queue.queue)])
-        embed.add_field(name='Up Next', value=queue_text, inline=False)
-    
-    await interaction.response.send_message(embed=embed)
+    view = QueueView(interaction.guild.id, page - 1)
+    await respond(interaction, embed=build_queue_embed(queue, view.page), view=view)
+    view.message = await interaction.original_response()
 
 
 @bot.tree.command(name='leave', description='Disconnect the bot from the voice channel')
@@ -1208,7 +5238,7 @@ async def slash_nowplaying(interaction: discord.Interaction):
     queue = get_queue(interaction.guild.id)
     
     if queue.current is None:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
         return
 
     player = queue.current['player']
@@ -1219,7 +5249,7 @@ async def slash_nowplaying(interaction: discord.Interaction):
         minutes, seconds = divmod(player.duration, 60)
         embed.add_field(name='Duration', value=f'{int(minutes)}:{int(seconds):02d}', inline=True)
     
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 
 @bot.tree.command(name='volume', description='Change the volume (0-200, where 100 is normal)')
@@ -1227,20 +5257,20 @@ async def slash_nowplaying(interaction: discord.Interaction):
 async def slash_volume(interaction: discord.Interaction, volume: int):
     voice_client = interaction.guild.voice_client
     if not voice_client:
-        await interaction.response.send_message('I am not connected to a voice channel.', ephemeral=True)
+        await respond(interaction, 'I am not connected to a voice channel.', ephemeral=True)
         return
 
     if not 0 <= volume <= 200:
-        await interaction.response.send_message('Volume must be between 0 and 200 (100 is normal, 200 is amplified).', ephemeral=True)
+        await respond(interaction, 'Volume must be between 0 and 200 (100 is normal, 200 is amplified).', ephemeral=True)
         return
 
     if voice_client.source:
         actual_volume = volume / 100
         voice_client.source.volume = actual_volume
         status = 'amplified' if volume > 100 else 'normal' if volume == 100 else 'reduced'
-        await interaction.response.send_message(f'Volume set to {volume}% ({status})')
+        await respond(interaction, f'Volume set to {volume}% ({status})')
     else:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
 
 
 @bot.tree.command(name='joke', description='Get a random joke')
@@ -1265,12 +5295,12 @@ async def slash_seek(interaction: discord.Interaction, time: str):
     queue = get_queue(interaction.guild.id)
     
     if queue.current is None:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
         return
     
     voice_client = interaction.guild.voice_client
     if not voice_client or not voice_client.is_connected():
-        await interaction.response.send_message('I am not in a voice channel.', ephemeral=True)
+        await respond(interaction, 'I am not in a voice channel.', ephemeral=True)
         return
     
     try:
@@ -1278,20 +5308,20 @@ async def slash_seek(interaction: discord.Interaction, time: str):
         
         player_data = queue.current['player']
         if player_data.duration and seek_seconds > player_data.duration:
-            await interaction.response.send_message(
+            await respond(
+                interaction,
                 f'Seek time exceeds song duration ({format_duration(player_data.duration)}).',
                 ephemeral=True
             )
             return
         
-        await interaction.response.defer()
+        await defer_response(interaction)
         
         original_query = queue.current.get('original_query', player_data.title)
-        voice_client.stop()
-        
         new_player = await YTDLSource.from_url(
             original_query,
             loop=bot.loop,
+            guild_id=interaction.guild.id,
             stream=True,
             start_time=seek_seconds,
             playback_speed=player_data.playback_speed
@@ -1303,23 +5333,15 @@ async def slash_seek(interaction: discord.Interaction, time: str):
         metadata['original_query'] = original_query
         queue.current = metadata
         
-        def after_playing(error):
-            if error:
-                logger.error(f'Player error in guild {interaction.guild.id}: {error}')
-            asyncio.run_coroutine_threadsafe(play_next_slash(interaction), bot.loop)
-        
-        current_source = voice_client.source
-        current_volume = getattr(current_source, 'volume', None) if current_source else None
-        voice_client.play(new_player, after=after_playing)
-        if current_volume is not None:
-            new_player.volume = current_volume
+        start_player(voice_client, new_player, {'interaction': interaction})
         queue.start_playback()
         await interaction.followup.send(
             f'Seeked to {format_duration(seek_seconds)} in **{new_player.title}**'
         )
         
     except ValueError:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             'Invalid time format. Use seconds (e.g., 90) or MM:SS format (e.g., 1:30).',
             ephemeral=True
         )
@@ -1327,7 +5349,7 @@ async def slash_seek(interaction: discord.Interaction, time: str):
         if interaction.response.is_done():
             await interaction.followup.send(f'An error occurred while seeking: {str(e)}')
         else:
-            await interaction.response.send_message(f'An error occurred while seeking: {str(e)}', ephemeral=True)
+            await respond(interaction, f'An error occurred while seeking: {str(e)}', ephemeral=True)
 
 
 @bot.tree.command(name='forward', description='Skip forward or backward by seconds')
@@ -1336,12 +5358,12 @@ async def slash_forward(interaction: discord.Interaction, seconds: int):
     queue = get_queue(interaction.guild.id)
     
     if queue.current is None:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
         return
     
     voice_client = interaction.guild.voice_client
     if not voice_client or not voice_client.is_connected():
-        await interaction.response.send_message('I am not in a voice channel.', ephemeral=True)
+        await respond(interaction, 'I am not in a voice channel.', ephemeral=True)
         return
     
     try:
@@ -1353,20 +5375,20 @@ async def slash_forward(interaction: discord.Interaction, seconds: int):
         
         player_data = queue.current['player']
         if player_data.duration and new_position > player_data.duration:
-            await interaction.response.send_message(
+            await respond(
+                interaction,
                 'Cannot skip beyond song duration. Use skip to go to next song.',
                 ephemeral=True
             )
             return
         
-        await interaction.response.defer()
+        await defer_response(interaction)
         
         original_query = queue.current.get('original_query', player_data.title)
-        voice_client.stop()
-        
         new_player = await YTDLSource.from_url(
             original_query,
             loop=bot.loop,
+            guild_id=interaction.guild.id,
             stream=True,
             start_time=new_position,
             playback_speed=player_data.playback_speed
@@ -1378,16 +5400,7 @@ async def slash_forward(interaction: discord.Interaction, seconds: int):
         metadata['original_query'] = original_query
         queue.current = metadata
         
-        def after_playing(error):
-            if error:
-                logger.error(f'Player error in guild {interaction.guild.id}: {error}')
-            asyncio.run_coroutine_threadsafe(play_next_slash(interaction), bot.loop)
-        
-        current_source = voice_client.source
-        current_volume = getattr(current_source, 'volume', None) if current_source else None
-        voice_client.play(new_player, after=after_playing)
-        if current_volume is not None:
-            new_player.volume = current_volume
+        start_player(voice_client, new_player, {'interaction': interaction})
         queue.start_playback()
         
         direction = 'forward' if seconds > 0 else 'backward'
@@ -1400,7 +5413,7 @@ async def slash_forward(interaction: discord.Interaction, seconds: int):
         if interaction.response.is_done():
             await interaction.followup.send(f'An error occurred while skipping: {str(e)}')
         else:
-            await interaction.response.send_message(f'An error occurred while skipping: {str(e)}', ephemeral=True)
+            await respond(interaction, f'An error occurred while skipping: {str(e)}', ephemeral=True)
 
 
 @bot.tree.command(name='speed', description='Change playback speed (0.5x-2.0x)')
@@ -1408,16 +5421,17 @@ async def slash_forward(interaction: discord.Interaction, seconds: int):
 async def slash_speed(interaction: discord.Interaction, speed: float):
     queue = get_queue(interaction.guild.id)
     if queue.current is None:
-        await interaction.response.send_message('Nothing is currently playing.', ephemeral=True)
+        await respond(interaction, 'Nothing is currently playing.', ephemeral=True)
         return
 
     voice_client = interaction.guild.voice_client
     if not voice_client or not voice_client.is_connected():
-        await interaction.response.send_message('I am not in a voice channel.', ephemeral=True)
+        await respond(interaction, 'I am not in a voice channel.', ephemeral=True)
         return
 
     if not MIN_PLAYBACK_SPEED <= speed <= MAX_PLAYBACK_SPEED:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             f'Playback speed must be between {MIN_PLAYBACK_SPEED}x and {MAX_PLAYBACK_SPEED}x.',
             ephemeral=True
         )
@@ -1426,30 +5440,28 @@ async def slash_speed(interaction: discord.Interaction, speed: float):
     current_item = queue.current
     current_player = current_item.get('player') if current_item else None
     if not current_player:
-        await interaction.response.send_message('Playback data is not available.', ephemeral=True)
+        await respond(interaction, 'Playback data is not available.', ephemeral=True)
         return
 
     if abs(current_player.playback_speed - speed) <= PLAYBACK_SPEED_TOLERANCE:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             f'Playback speed is already {format_speed(speed)}x.',
             ephemeral=True
         )
         return
 
-    await interaction.response.defer()
+    await defer_response(interaction)
     try:
         original_query = current_item.get('original_query', current_player.title)
         current_position = queue.get_current_position()
         if current_player.duration and current_position >= current_player.duration:
             current_position = max(current_player.duration - 1, 0)
 
-        current_source = voice_client.source
-        current_volume = getattr(current_source, 'volume', None) if current_source else None
-        voice_client.stop()
-
         new_player = await YTDLSource.from_url(
             original_query,
             loop=bot.loop,
+            guild_id=interaction.guild.id,
             stream=True,
             start_time=current_position,
             playback_speed=speed
@@ -1461,18 +5473,7 @@ async def slash_speed(interaction: discord.Interaction, speed: float):
         metadata['original_query'] = original_query
         queue.current = metadata
 
-        def after_playing(error):
-            if error:
-                logger.error(f'Player error in guild {interaction.guild.id}: {error}')
-                logger.error(traceback.format_exc())
-            try:
-                asyncio.run_coroutine_threadsafe(play_next_slash(interaction), bot.loop)
-            except Exception as exc:
-                logger.error(f'Failed to queue next song: {exc}')
-
-        voice_client.play(new_player, after=after_playing)
-        if current_volume is not None:
-            new_player.volume = current_volume
+        start_player(voice_client, new_player, {'interaction': interaction})
         queue.start_playback()
 
         await interaction.followup.send(
@@ -1487,6 +5488,94 @@ async def slash_speed(interaction: discord.Interaction, speed: float):
         )
 
 
+@bot.tree.command(name='crossfade', description='Crossfade between songs (0 for gapless)')
+@app_commands.describe(seconds=f'Seconds of overlap between songs (0-{int(MAX_CROSSFADE_SECONDS)})')
+async def slash_crossfade(interaction: discord.Interaction, seconds: float):
+    if not 0 <= seconds <= MAX_CROSSFADE_SECONDS:
+        await interaction.response.send_message(
+            f'Crossfade must be between 0 and {int(MAX_CROSSFADE_SECONDS)} seconds.',
+            ephemeral=True
+        )
+        return
+
+    queue = get_queue(interaction.guild.id)
+    queue.crossfade_seconds = seconds
+    voice_client = interaction.guild.voice_client
+    if voice_client and isinstance(voice_client.source, PlaybackMixer):
+        voice_client.source.crossfade_seconds = seconds
+
+    if seconds:
+        await interaction.response.send_message(f'Crossfading {seconds:g} seconds between songs.')
+    else:
+        await interaction.response.send_message('Crossfade disabled, songs will play back to back.')
+
+
+@bot.tree.command(name='autoplay', description='Toggle playing related songs when the queue runs out')
+async def slash_autoplay(interaction: discord.Interaction):
+    queue = get_queue(interaction.guild.id)
+    if queue.autoplay is None:
+        enable_autoplay(interaction.guild.id, {'interaction': interaction})
+        await respond(interaction, 'Autoplay on: related songs will play when the queue runs out.')
+    else:
+        disable_autoplay(interaction.guild.id)
+        await respond(interaction, 'Autoplay off.')
+
+
+@bot.tree.command(name='previous', description='Play the previous song again')
+async def slash_previous(interaction: discord.Interaction):
+    voice_client = interaction.guild.voice_client
+    if not voice_client or not voice_client.is_connected():
+        await respond(interaction, 'I am not in a voice channel.', ephemeral=True)
+        return
+
+    await defer_response(interaction)
+    try:
+        title = await play_previous(voice_client, {'interaction': interaction})
+    except Exception as e:
+        logger.error(f'Error going back in guild {interaction.guild.id}: {e}')
+        await interaction.followup.send(f'An error occurred: {str(e)}')
+        return
+
+    if title is None:
+        await interaction.followup.send('There is no previous song.')
+    else:
+        await interaction.followup.send(f'Back to: **{title}**')
+
+
+@bot.tree.command(name='replay', description='Restart the current song, or queue a song from history')
+@app_commands.describe(number='Position in /history to queue (leave empty to restart the current song)')
+async def slash_replay(interaction: discord.Interaction, number: Optional[int] = None):
+    voice_client = interaction.guild.voice_client
+    if not voice_client or not voice_client.is_connected():
+        await respond(interaction, 'I am not in a voice channel.', ephemeral=True)
+        return
+
+    await defer_response(interaction)
+    try:
+        replayed = await replay_track(voice_client, {'interaction': interaction}, number)
+    except Exception as e:
+        logger.error(f'Error replaying in guild {interaction.guild.id}: {e}')
+        await interaction.followup.send(f'An error occurred: {str(e)}')
+        return
+
+    if replayed is None:
+        await interaction.followup.send('Nothing to replay. Use /history to see recent songs.')
+        return
+    title, queued = replayed
+    if queued:
+        await interaction.followup.send(f'Added to queue: **{title}**')
+    elif number is None:
+        await interaction.followup.send(f'Replaying **{title}** from the start.')
+
+
+@bot.tree.command(name='history', description='Show recently played songs')
+async def slash_history(interaction: discord.Interaction):
+    if not len(get_queue(interaction.guild.id).history):
+        await respond(interaction, 'No songs have been played yet.', ephemeral=True)
+        return
+    await respond(interaction, embed=build_history_embed(interaction.guild.id))
+
+
 @bot.tree.command(name='status', description='Check bot status and connection health')
 async def slash_status(interaction: discord.Interaction):
     queue = get_queue(interaction.guild.id)
@@ -1512,6 +5601,8 @@ async def slash_status(interaction: discord.Interaction):
     embed.add_field(name='Voice Status', value=voice_status, inline=True)
     
     queue_info = f'{len(queue.queue)} song(s)' if not queue.is_empty() else 'Empty'
+    if queue.autoplay:
+        queue_info += f" + autoplay ({len(queue.autoplay.ready)} ready)"
     embed.add_field(name='Queue', value=queue_info, inline=True)
     
     if queue.current:
@@ -1521,16 +5612,89 @@ async def slash_status(interaction: discord.Interaction):
             value=format_duration(current_pos),
             inline=True
         )
+        buffer = queue.current['player'].buffer_stats()
+        if buffer:
+            embed.add_field(
+                name='Audio Buffer',
+                value=f"{buffer['depth']}/{buffer['capacity']} frames, {buffer['underruns']} underrun(s)",
+                inline=True
+            )
     
     embed.add_field(name='Servers', value=len(bot.guilds), inline=True)
+    embed.add_field(name='Search Sessions', value=len(search_sessions), inline=True)
+    embed.add_field(
+        name='Resolve Cache',
+        value=f'{len(resolve_cache)} videos ({resolve_cache.hits} hits, {resolve_cache.misses} misses)',
+        inline=True
+    )
+    if library_backend:
+        embed.add_field(name='Library', value=f'{len(library_backend.entries)} tracks', inline=True)
+    embed.add_field(name='FFmpeg Processes', value=len(ffmpeg_supervisor), inline=True)
+    if voice_telemetry:
+        embed.add_field(name='Voice Path', value=format_telemetry(combined_telemetry()), inline=False)
+    embed.add_field(
+        name='Playback Watchdog',
+        value=(
+            f"{watchdog_stats['stalls']} stall(s): {watchdog_stats['source_restarts']} stream restart(s), "
+            f"{watchdog_stats['skipped']} skipped, {watchdog_stats['voice_reconnects']} voice reconnect(s), "
+            f"{watchdog_stats['failed']} failed"
+        ),
+        inline=True
+    )
+    embed.add_field(
+        name='Stream URLs Refreshed',
+        value=f"{url_refresh_stats['refreshed']} ({url_refresh_stats['failed']} failed)",
+        inline=True
+    )
+    embed.add_field(name='Idle Sessions Saved', value=len(evicted_guilds), inline=True)
+    embed.add_field(
+        name='Stream Recoveries',
+        value=f"{recovery_stats['recovered']} recovered, {recovery_stats['failed']} failed",
+        inline=True
+    )
+    embed.add_field(
+        name='Track Transitions',
+        value=f"{playback_stats['transitions']} ({playback_stats['crossfades']} crossfaded, "
+              f"{playback_stats['stall_seconds'] * 1000:.0f}ms stalled)",
+        inline=True
+    )
+    embed.add_field(
+        name='Announcements',
+        value=f"{announcer.stats['sent']} sent, {announcer.stats['edited']} edited ({announcer.saved} saved)",
+        inline=True
+    )
+    embed.add_field(name='Runtime', value=f"{runtime_info['event_loop']} + {runtime_info['json']}", inline=True)
+    embed.add_field(name='State Backend', value=f'{state_backend.name} ({NODE_ID})' if state_backend.shared else state_backend.name, inline=True)
     embed.add_field(name='Bot Version', value='1.0.0', inline=True)
     
     await interaction.response.send_message(embed=embed)
 
 
+@bot.tree.command(name='processes', description='Show FFmpeg process usage')
+async def slash_processes(interaction: discord.Interaction):
+    await interaction.response.send_message(embed=build_processes_embed(interaction.guild.id))
+
+
+@bot.tree.command(name='profile', description='Owner only: profile the running bot')
+@app_commands.describe(mode='What to profile', seconds='How long to sample (cpu and memory)')
+@app_commands.choices(mode=[app_commands.Choice(name=mode, value=mode) for mode in PROFILE_MODES])
+async def slash_profile(interaction: discord.Interaction, mode: str = 'cpu', seconds: float = 10.0):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message('Only the bot owner can use this command.', ephemeral=True)
+        return
+    if profile_lock.locked():
+        await interaction.response.send_message('A profile is already being taken.', ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    summary, path = await run_profile(mode, seconds)
+    logger.info(f'{mode} profile requested by {interaction.user.id} saved to {path}')
+    await interaction.followup.send(**profile_reply(mode, summary, path), ephemeral=True)
+
+
 @bot.tree.command(name='ia', description='Ask OpenAI a question')
 @app_commands.describe(prompt='Your question or prompt for OpenAI')
 async def slash_ia(interaction: discord.Interaction, prompt: str):
+    openai_client = get_openai_client()
     if not openai_client:
         await interaction.response.send_message('OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.', ephemeral=True)
         return
@@ -1572,7 +5736,8 @@ async def slash_restore_session(interaction: discord.Interaction):
     voice_channel = interaction.user.voice.channel
     queue = get_queue(interaction.guild.id)
     
-    saved_state = MusicQueue.load_state(interaction.guild.id)
+    evicted_guilds.pop(interaction.guild.id, None)
+    saved_state = await MusicQueue.load_state(interaction.guild.id)
     if not saved_state:
         await interaction.response.send_message('No saved session found for this server.', ephemeral=True)
         return
@@ -1595,59 +5760,12 @@ async def slash_restore_session(interaction: discord.Interaction):
     await interaction.response.defer()
     
     try:
-        restored_count = 0
-        
-        if saved_state.get('current'):
-            current = saved_state['current']
-            logger.info(f'Resuming: {current["title"]} at position {current.get("position", 0)}s')
-            
-            position = current.get('position', 0)
-            playback_speed = current.get('playback_speed', queue.playback_speed)
-            player = await YTDLSource.from_url(
-                current['original_query'],
-                loop=bot.loop,
-                stream=True,
-                start_time=position,
-                playback_speed=playback_speed
-            )
-            queue.current = {'player': player, 'interaction': interaction, 'original_query': current['original_query']}
-            
-            def after_playing(error):
-                if error:
-                    logger.error(f'Player error in guild {interaction.guild.id}: {error}')
-                    logger.error(traceback.format_exc())
-                try:
-                    asyncio.run_coroutine_threadsafe(play_next_slash(interaction), bot.loop)
-                except Exception as e:
-                    logger.error(f'Failed to queue next song: {e}')
-            
-            voice_client.play(player, after=after_playing)
-            if saved_state.get('current_volume'):
-                logger.info(f'Restored volume to {saved_state["current_volume"]}')
-                voice_client.source.volume = saved_state['current_volume']
-            queue.start_playback()
-            restored_count += 1
-            await interaction.followup.send(f'Resumed: **{current["title"]}** at {format_duration(position)}')
-        
-        for item in saved_state.get('queue', []):
-            try:
-                player = await YTDLSource.from_url(
-                    item['original_query'],
-                    loop=bot.loop,
-                    stream=True,
-                    start_time=item.get('start_time', 0),
-                    playback_speed=item.get('playback_speed', queue.playback_speed)
-                )
-                queue.add({'player': player, 'interaction': interaction, 'original_query': item['original_query']})
-                restored_count += 1
-            except Exception as e:
-                logger.error(f'Failed to restore song {item["title"]}: {e}')
-        
-        if restored_count > 1:
-            await interaction.followup.send(f'Restored {restored_count} song(s) from saved session.')
-        
-        logger.info(f'Guild {interaction.guild.id} resumed session with {restored_count} songs')
-        
+        await restore_saved_state(
+            saved_state,
+            voice_client,
+            {'interaction': interaction},
+            interaction.followup.send
+        )
     except Exception as e:
         logger.error(f'Error resuming session: {e}')
         logger.error(traceback.format_exc())
@@ -1661,12 +5779,12 @@ async def slash_restore_session(interaction: discord.Interaction):
 @app_commands.describe(query='Search query for YouTube')
 async def slash_search(interaction: discord.Interaction, query: str):
     if not interaction.user.voice:
-        await interaction.response.send_message('You need to be in a voice channel to use this command.', ephemeral=True)
+        await respond(interaction, 'You need to be in a voice channel to use this command.', ephemeral=True)
         return
     
-    await interaction.response.defer()
+    await defer_response(interaction)
     
-    results = await search_youtube(query, max_results=10)
+    results = await search_sources(query, max_results=10)
     
     if not results:
         await interaction.followup.send('No results found for your search.')
@@ -1674,7 +5792,7 @@ async def slash_search(interaction: discord.Interaction, query: str):
     
     embed = discord.Embed(
         title=f'Search Results for: {query}',
-        description='Reply with a number (1-10) to select a song',
+        description='Pick a song from the menu below',
         color=discord.Color.blue()
     )
     
@@ -1686,26 +5804,38 @@ async def slash_search(interaction: discord.Interaction, query: str):
             inline=False
         )
     
-    embed.set_footer(text='This search will expire in 60 seconds')
-    await interaction.followup.send(embed=embed)
+    embed.set_footer(text=f'This search will expire in {SEARCH_SESSION_TTL} seconds')
+    view = SearchResultsView(
+        results,
+        requester_id=interaction.user.id,
+        guild_id=interaction.guild.id,
+        interaction=interaction
+    )
+    view.start_prefetch()
+    view.message = await interaction.followup.send(embed=embed, view=view, wait=True)
     
-    search_results[interaction.user.id] = {
-        'results': results,
+    search_sessions.put(interaction.user.id, {
         'channel_id': interaction.channel.id,
         'guild_id': interaction.guild.id,
-        'timestamp': time.time(),
-        'interaction': interaction
-    }
+        'view': view
+    })
     
     logger.info(f'User {interaction.user.id} searched for: {query}')
 
 
+run_started = time.perf_counter()
+
+
 def main():
+    global run_started
     if not DISCORD_TOKEN:
         print('Error: DISCORD_TOKEN not found in environment variables.')
         print('Please create a .env file with your Discord bot token.')
         return
 
+    if FAST_RUNTIME:
+        runtime_info['event_loop'] = install_fast_event_loop()
+    run_started = time.perf_counter()
     bot.run(DISCORD_TOKEN)
 
 
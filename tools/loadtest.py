@@ -0,0 +1,536 @@
+"""
+Offline load test for the playback path.
+
+Runs the real command handlers from bot.py (play, skip, seek, play_next,
+restore_session) against a simulated gateway. Voice clients are replaced by
+FakeVoiceClient, which pulls 20 ms frames from the AudioSource on its own
+thread in real time like discord.py's AudioPlayer does. yt-dlp is replaced by
+StubExtractor, which answers after a configurable latency with local audio
+files served over HTTP, so FFmpeg does the same work it does in production.
+
+Usage:
+    python tools/loadtest.py --guilds 1 10 50 100 --duration 60
+    python tools/loadtest.py --audio-dir ~/music --latency 0.8 --json report.json
+    python tools/loadtest.py --replay fixtures/extractor --guilds 10 --duration 30
+
+Requires FFmpeg on PATH and the packages from requirements.txt.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web  # noqa: E402
+
+import bot as musicbot  # noqa: E402
+
+FRAME_DURATION = 0.02
+FRAMES_PER_SECOND = 50
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.ogg', '.opus', '.wav', '.flac', '.webm')
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Stats:
+    """Counters shared by every simulated guild in one stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.short_frames = 0
+        self.late_frames = 0
+        self.transition_gaps = []
+        self.commands = 0
+        self.command_errors = 0
+        self.messages = 0
+        self.loop_lag = []
+
+    def as_dict(self) -> dict:
+        return {
+            'frames': self.frames,
+            'short_frames': self.short_frames,
+            'late_frames': self.late_frames,
+            'commands': self.commands,
+            'command_errors': self.command_errors,
+            'messages': self.messages,
+            'transitions': len(self.transition_gaps),
+        }
+
+
+class FakeVoiceClient:
+    """Stands in for discord.VoiceClient, consuming frames in real time on a thread"""
+
+    def __init__(self, channel, stats: Stats):
+        self.channel = channel
+        self.guild = channel.guild
+        self.stats = stats
+        self.source = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._connected = True
+        self._ended_at = None
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._resume_event.is_set()
+
+    def is_paused(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._resume_event.is_set()
+
+    def play(self, source, *, after=None):
+        if self.is_playing() or self.is_paused():
+            raise RuntimeError('Already playing audio.')
+        self.source = source
+        self._stop_event = threading.Event()
+        self._resume_event.set()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(source, after, self._stop_event),
+            name=f'fake-voice-{self.guild.id}',
+            daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, source, after, stop_event):
+        error = None
+        first_frame = True
+        next_tick = time.perf_counter()
+        try:
+            while not stop_event.is_set():
+                if not self._resume_event.is_set():
+                    self._resume_event.wait(0.1)
+                    next_tick = time.perf_counter()
+                    continue
+                frame = source.read()
+                if not frame:
+                    break
+                now = time.perf_counter()
+                with self.stats.lock:
+                    self.stats.frames += 1
+                    if len(frame) < 3840:
+                        self.stats.short_frames += 1
+                    if now - next_tick > FRAME_DURATION:
+                        self.stats.late_frames += 1
+                    if first_frame and self._ended_at is not None:
+                        self.stats.transition_gaps.append(now - self._ended_at)
+                first_frame = False
+                next_tick += FRAME_DURATION
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as exc:
+            error = exc
+        finally:
+            self._ended_at = time.perf_counter()
+            try:
+                source.cleanup()
+            except Exception:
+                pass
+            if after is not None:
+                try:
+                    after(error)
+                except Exception:
+                    pass
+
+    def stop(self):
+        # Like discord.py, stop() detaches the player immediately; its thread finishes on its own
+        self._stop_event.set()
+        self._resume_event.set()
+        self._thread = None
+
+    def pause(self):
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild, stats: Stats):
+        self.id = channel_id
+        self.guild = guild
+        self.stats = stats
+
+    async def send(self, content=None, **kwargs):
+        self.stats.messages += 1
+
+    def typing(self):
+        return _Typing()
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id: int, guild, stats: Stats):
+        self.id = channel_id
+        self.guild = guild
+        self.stats = stats
+
+    async def connect(self, *, self_deaf=False, **kwargs):
+        voice_client = FakeVoiceClient(self, self.stats)
+        self.guild.voice_client = voice_client
+        return voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, stats: Stats):
+        self.id = guild_id
+        self.voice_client = None
+        self.text_channel = FakeChannel(guild_id * 10 + 1, self, stats)
+        self.voice_channel = FakeVoiceChannel(guild_id * 10 + 2, self, stats)
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: FakeGuild):
+        self.id = member_id
+        self.bot = False
+        self.voice = FakeVoiceState(guild.voice_channel)
+
+
+class FakeContext:
+    """The subset of commands.Context used by the music commands"""
+
+    def __init__(self, guild: FakeGuild, author: FakeMember, command_name: str = ''):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+        self.command = command_name
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    def typing(self):
+        return self.channel.typing()
+
+
+class StubExtractor:
+    """Replacement for YoutubeDL.extract_info that serves local files over HTTP"""
+
+    def __init__(self, tracks: list, base_url: str, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.tracks = tracks
+        self.base_url = base_url
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def extract_info(self, url, download=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(f'Simulated extraction failure for {url}')
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        track = self.tracks[int(digest, 16) % len(self.tracks)]
+        return {
+            'id': digest[:11],
+            'title': f'{track["name"]} ({url[:40]})',
+            'url': f'{self.base_url}/{track["name"]}',
+            'duration': track['duration'],
+            'webpage_url': url,
+        }
+
+    def prepare_filename(self, data):
+        return data['url']
+
+
+def probe_duration(path: str) -> int:
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return int(float(output))
+    except Exception:
+        return 0
+
+
+def prepare_tracks(audio_dir: str, workdir: str, track_length: int) -> tuple:
+    """Return (directory, tracks), generating sine tones when no library is given"""
+    if audio_dir:
+        names = sorted(
+            name for name in os.listdir(audio_dir)
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+        if not names:
+            raise SystemExit(f'No audio files found in {audio_dir}')
+        return audio_dir, [
+            {'name': name, 'duration': probe_duration(os.path.join(audio_dir, name))}
+            for name in names
+        ]
+
+    tone_dir = os.path.join(workdir, 'audio')
+    os.makedirs(tone_dir, exist_ok=True)
+    tracks = []
+    for index, frequency in enumerate((220, 330, 440, 550)):
+        name = f'tone_{index}.mp3'
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi',
+             '-i', f'sine=frequency={frequency}:duration={track_length}',
+             '-ac', '2', '-ar', '48000', os.path.join(tone_dir, name)],
+            check=True
+        )
+        tracks.append({'name': name, 'duration': track_length})
+    return tone_dir, tracks
+
+
+async def serve_directory(directory: str) -> tuple:
+    app = web.Application()
+    app.router.add_static('/', directory)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f'http://{host}:{port}'
+
+
+async def monitor_loop_lag(stats: Stats, stop: asyncio.Event, interval: float = 0.05):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(time.perf_counter() - started - interval, 0.0))
+
+
+async def run_command(stats: Stats, handler, ctx, *args, **kwargs):
+    stats.commands += 1
+    try:
+        await handler(ctx, *args, **kwargs)
+    except Exception:
+        stats.command_errors += 1
+
+
+async def simulate_guild(guild: FakeGuild, stats: Stats, deadline: float, queue_depth: int, rng: random.Random):
+    member = FakeMember(guild.id * 100, guild)
+    ctx = FakeContext(guild, member)
+
+    for index in range(queue_depth):
+        await run_command(stats, musicbot.play.callback, ctx, query=f'loadtest {guild.id} track {index}')
+
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(rng.uniform(3, 8))
+        action = rng.random()
+        if action < 0.35:
+            await run_command(stats, musicbot.skip.callback, ctx)
+        elif action < 0.65:
+            await run_command(stats, musicbot.seek.callback, ctx, time=str(rng.randint(0, 10)))
+        else:
+            await run_command(stats, musicbot.play.callback, ctx, query=f'loadtest {guild.id} extra {rng.random()}')
+
+    queue = musicbot.get_queue(guild.id)
+    queue.save_state()
+
+
+async def restore_guilds(guilds: list, stats: Stats):
+    """Tear playback down and bring it back through restore_session"""
+    for guild in guilds:
+        musicbot.get_queue(guild.id).clear(save_state=False)
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+    await asyncio.gather(*(
+        run_command(stats, musicbot.restore_session.callback, FakeContext(guild, FakeMember(guild.id * 100, guild)))
+        for guild in guilds
+    ))
+
+
+async def shutdown_guilds(guilds: list):
+    for guild in guilds:
+        musicbot.get_queue(guild.id).clear(save_state=False)
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+    musicbot.music_queues.clear()
+    await asyncio.sleep(0.5)
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+async def run_stage(guild_count: int, args, seed: int) -> dict:
+    stats = Stats()
+    rng = random.Random(seed)
+    guilds = [FakeGuild(100000 + index, stats) for index in range(guild_count)]
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(stats, stop))
+
+    cpu_started = cpu_seconds()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        simulate_guild(guild, stats, deadline, args.queue_depth, random.Random(rng.random()))
+        for guild in guilds
+    ))
+    restore_sample = guilds[:max(1, int(len(guilds) * args.restore_fraction))]
+    await restore_guilds(restore_sample, stats)
+    await asyncio.sleep(args.restore_settle)
+    elapsed = time.perf_counter() - started
+
+    await shutdown_guilds(guilds)
+    stop.set()
+    await lag_task
+    cpu_used = cpu_seconds() - cpu_started
+
+    stream_seconds = stats.frames / FRAMES_PER_SECOND
+    gaps_ms = [gap * 1000 for gap in stats.transition_gaps]
+    lag_ms = [lag * 1000 for lag in stats.loop_lag]
+    return {
+        'guilds': guild_count,
+        'elapsed_s': round(elapsed, 2),
+        'frames_per_s': round(stats.frames / elapsed, 1),
+        'realtime_ratio': round(stream_seconds / (elapsed * guild_count), 3),
+        'commands_per_s': round(stats.commands / elapsed, 2),
+        'cpu_s': round(cpu_used, 2),
+        'cpu_per_stream_pct': round(100 * cpu_used / stream_seconds, 2) if stream_seconds else 0.0,
+        'gap_ms_p50': round(percentile(gaps_ms, 50), 1),
+        'gap_ms_p95': round(percentile(gaps_ms, 95), 1),
+        'gap_ms_max': round(max(gaps_ms, default=0.0), 1),
+        'loop_lag_ms_mean': round(statistics.fmean(lag_ms), 2) if lag_ms else 0.0,
+        'loop_lag_ms_p99': round(percentile(lag_ms, 99), 2),
+        'loop_lag_ms_max': round(max(lag_ms, default=0.0), 2),
+        'extractor_calls': musicbot.get_ytdl().calls,
+        **stats.as_dict(),
+    }
+
+
+def print_report(results: list):
+    columns = [
+        ('guilds', 'guilds'), ('frames/s', 'frames_per_s'), ('realtime', 'realtime_ratio'),
+        ('cmd/s', 'commands_per_s'), ('cpu%/stream', 'cpu_per_stream_pct'),
+        ('gap p50', 'gap_ms_p50'), ('gap p95', 'gap_ms_p95'), ('gap max', 'gap_ms_max'),
+        ('lag mean', 'loop_lag_ms_mean'), ('lag p99', 'loop_lag_ms_p99'), ('errors', 'command_errors'),
+    ]
+    header = ' '.join(f'{title:>11}' for title, _ in columns)
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(' '.join(f'{result[key]:>11}' for _, key in columns))
+
+
+async def main_async(args) -> list:
+    workdir = tempfile.mkdtemp(prefix='musicologo-loadtest-')
+    audio_dir, tracks = prepare_tracks(args.audio_dir, workdir, args.track_length)
+    runner, base_url = await serve_directory(audio_dir)
+
+    musicbot.bot.loop = asyncio.get_running_loop()
+    if args.replay:
+        musicbot._ytdl = musicbot.ReplayExtractor(
+            musicbot.YTDL_OPTIONS, musicbot.FixtureStore(os.path.abspath(args.replay)),
+            latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+            seed=args.seed, strict=False
+        )
+    else:
+        musicbot._ytdl = StubExtractor(
+            tracks, base_url,
+            latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate
+        )
+    if args.executor_workers:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=args.executor_workers)
+        )
+
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        for stage, guild_count in enumerate(args.guilds):
+            print(f'Running stage with {guild_count} guild(s) for {args.duration}s...', file=sys.stderr)
+            results.append(await run_stage(guild_count, args, seed=args.seed + stage))
+    finally:
+        os.chdir(previous_cwd)
+        await runner.cleanup()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load test for the music playback path')
+    parser.add_argument('--guilds', type=int, nargs='+', default=[1, 10, 50, 100],
+                        help='Guild counts to run, one stage per value')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of simulated activity per stage')
+    parser.add_argument('--queue-depth', type=int, default=3, help='Tracks each guild queues up front')
+    parser.add_argument('--latency', type=float, default=0.3, help='Stub extractor latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Random extra extractor latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of extractions that fail')
+    parser.add_argument('--audio-dir', help='Directory of local audio files (default: generated tones)')
+    parser.add_argument('--replay', help='Answer extractions from this recorded store (EXTRACTOR=replay) '
+                                          'instead of the stub; record it with audio snippets')
+    parser.add_argument('--track-length', type=int, default=20, help='Length of generated tones in seconds')
+    parser.add_argument('--restore-fraction', type=float, default=0.25,
+                        help='Fraction of guilds that go through restore_session at the end of a stage')
+    parser.add_argument('--restore-settle', type=float, default=3.0,
+                        help='Seconds to keep streaming after restores before measuring')
+    parser.add_argument('--executor-workers', type=int, default=0,
+                        help='Size of the default executor (0 keeps asyncio default)')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep generated audio and state files')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not shutil.which('ffmpeg'):
+        raise SystemExit('FFmpeg must be installed and on PATH to run the load test.')
+    results = asyncio.run(main_async(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Memory report for queued tracks.
+
+Fills the queues of several simulated guilds with real YTDLSource players built
+from the recorded yt-dlp info dict in benchmarks/fixtures (no network, and no
+FFmpeg since players only spawn it when they start), then uses tracemalloc to
+report how many bytes each queued track keeps alive. The "full-info" row also
+keeps every extract_info dict referenced next to its player, which is what
+players retained before they switched to TrackInfo, for comparison.
+
+Usage:
+    python tools/memreport.py --guilds 10 --tracks 50 500
+    python tools/memreport.py --tracks 200 --top 10 --json memory.json
+"""
+import argparse
+import asyncio
+import copy
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import bot as musicbot  # noqa: E402
+
+
+def read_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def load_info() -> dict:
+    with open(os.path.join(FIXTURES, 'video_info.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def fill_queues(info: dict, guild_count: int, tracks_per_guild: int, keep_info: bool) -> list:
+    """Queue tracks_per_guild players in each guild; returns the info dicts kept alive, if any"""
+    retained = []
+    for guild_id in range(1, guild_count + 1):
+        queue = musicbot.get_queue(guild_id)
+        queue.save_state = lambda: None
+        for index in range(tracks_per_guild):
+            # extract_info hands back a fresh dict per call, so every track gets its own copy
+            data = copy.deepcopy(info)
+            query = f"{info['webpage_url']}&i={index}"
+            player = await musicbot.YTDLSource.from_url(query, loop=musicbot.bot.loop, data=data, guild_id=guild_id)
+            queue.add({'player': player, 'original_query': query})
+            if keep_info:
+                retained.append(data)
+            del data
+    return retained
+
+
+def clear_queues():
+    for queue in musicbot.music_queues.values():
+        queue.clear(save_state=False)
+    musicbot.music_queues.clear()
+    gc.collect()
+
+
+async def measure(info: dict, guild_count: int, tracks_per_guild: int, keep_info: bool, top: int) -> dict:
+    clear_queues()
+    rss_before = read_rss_bytes()
+    before = tracemalloc.take_snapshot()
+    retained = await fill_queues(info, guild_count, tracks_per_guild, keep_info)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    rss_after = read_rss_bytes()
+
+    stats = after.compare_to(before, 'lineno')
+    allocated = sum(stat.size_diff for stat in stats)
+    total_tracks = guild_count * tracks_per_guild
+    result = {
+        'mode': 'full-info' if keep_info else 'slim',
+        'guilds': guild_count,
+        'tracks_per_guild': tracks_per_guild,
+        'total_tracks': total_tracks,
+        'allocated_bytes': allocated,
+        'bytes_per_track': allocated // total_tracks if total_tracks else 0,
+        'rss_delta_bytes': rss_after - rss_before,
+        'top_sites': [
+            {'site': str(stat.traceback[0]), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+            for stat in stats[:top]
+        ],
+    }
+    del retained
+    clear_queues()
+    return result
+
+
+def print_report(results: list):
+    header = f"{'mode':>10} {'guilds':>7} {'tracks':>7} {'bytes/track':>12} {'total KiB':>10} {'RSS KiB':>9}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(
+            f"{result['mode']:>10} {result['guilds']:>7} {result['total_tracks']:>7} "
+            f"{result['bytes_per_track']:>12} {result['allocated_bytes'] // 1024:>10} "
+            f"{result['rss_delta_bytes'] // 1024:>9}"
+        )
+    for result in results:
+        if result['top_sites']:
+            print(f"\nTop allocation sites ({result['mode']}, {result['total_tracks']} tracks):")
+            for site in result['top_sites']:
+                print(f"  {site['size_diff'] // 1024:>8} KiB  {site['count_diff']:>7} blocks  {site['site']}")
+
+
+async def main_async(args) -> list:
+    musicbot.bot.loop = asyncio.get_running_loop()
+    # Loudness analysis would spawn FFmpeg for every unseen track; it is not what is measured here
+    musicbot.LOUDNESS_NORMALIZATION = False
+    info = load_info()
+
+    previous_cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='musicologo-memreport-'))
+    # One throwaway pass so lazy imports and first-use caches are not counted against tracks
+    await fill_queues(info, 1, 1, keep_info=False)
+    clear_queues()
+    tracemalloc.start(args.frames)
+    results = []
+    try:
+        for tracks in args.tracks:
+            for keep_info in (False, True):
+                results.append(await measure(info, args.guilds, tracks, keep_info, args.top))
+    finally:
+        tracemalloc.stop()
+        os.chdir(previous_cwd)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Report memory held per queued track')
+    parser.add_argument('--guilds', type=int, default=10, help='Number of guilds to fill')
+    parser.add_argument('--tracks', type=int, nargs='+', default=[50, 500],
+                        help='Tracks queued per guild, one measurement per value')
+    parser.add_argument('--top', type=int, default=0, help='Show this many top allocation sites')
+    parser.add_argument('--frames', type=int, default=1, help='Traceback depth recorded by tracemalloc')
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(main_async(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+In-memory stand-in for a Redis server, for trying STATE_BACKEND=redis locally.
+
+Speaks enough of the Redis protocol (RESP2) for the bot's state backend: strings
+with NX/XX and expiry, lists, hashes, sets and MULTI/EXEC with WATCH. Data lives in this
+process only. Run two bots with different NODE_ID values against it and stop one
+to watch the other take over its guilds once the lease runs out.
+
+Usage:
+    python tools/respserver.py --port 6390
+    STATE_BACKEND=redis REDIS_URL=redis://localhost:6390/0 python bot.py
+"""
+import argparse
+import asyncio
+import time
+
+
+class RespError(Exception):
+    pass
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+
+    def touch(self, key):
+        """Record a write, failing transactions that WATCH the key"""
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def version(self, key) -> int:
+        self.get(key)
+        return self.versions.get(key, 0)
+
+    def get(self, key, kind=None):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self.touch(key)
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise RespError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def delete(self, key) -> bool:
+        self.expires.pop(key, None)
+        self.touch(key)
+        return self.data.pop(key, None) is not None
+
+
+class Server:
+    def __init__(self, password: str = None):
+        self.store = Store()
+        self.password = password
+        self.commands = {
+            'PING': self.ping, 'AUTH': self.auth, 'SELECT': self.select, 'FLUSHALL': self.flushall,
+            'GET': self.get, 'SET': self.set, 'DEL': self.delete, 'EXISTS': self.exists,
+            'PEXPIRE': self.pexpire, 'RPUSH': self.rpush, 'LRANGE': self.lrange,
+            'HSET': self.hset, 'HGETALL': self.hgetall, 'SADD': self.sadd, 'SREM': self.srem,
+            'SMEMBERS': self.smembers,
+        }
+
+    def ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def auth(self, *args):
+        if self.password is not None and args[-1].decode() != self.password:
+            raise RespError('WRONGPASS invalid password')
+        return 'OK'
+
+    def select(self, db):
+        return 'OK'
+
+    def flushall(self):
+        for key in list(self.store.data):
+            self.store.delete(key)
+        return 'OK'
+
+    def get(self, key):
+        return self.store.get(key, bytes)
+
+    def set(self, key, value, *options):
+        options = [option.upper() if isinstance(option, bytes) else option for option in options]
+        exists = self.store.get(key) is not None
+        if (b'NX' in options and exists) or (b'XX' in options and not exists):
+            return None
+        self.store.data[key] = value
+        self.store.expires.pop(key, None)
+        self.store.touch(key)
+        for unit, scale in ((b'PX', 0.001), (b'EX', 1.0)):
+            if unit in options:
+                self.store.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        return 'OK'
+
+    def delete(self, *keys):
+        return sum(self.store.delete(key) for key in keys)
+
+    def exists(self, *keys):
+        return sum(self.store.get(key) is not None for key in keys)
+
+    def pexpire(self, key, milliseconds):
+        if self.store.get(key) is None:
+            return 0
+        self.store.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        self.store.touch(key)
+        return 1
+
+    def rpush(self, key, *values):
+        items = self.store.get(key, list)
+        if items is None:
+            items = self.store.data[key] = []
+        items.extend(values)
+        self.store.touch(key)
+        return len(items)
+
+    def lrange(self, key, start, stop):
+        items = self.store.get(key, list) or []
+        start, stop = int(start), int(stop)
+        stop = len(items) if stop == -1 else stop + 1
+        return items[start:stop]
+
+    def hset(self, key, *pairs):
+        fields = self.store.get(key, dict)
+        if fields is None:
+            fields = self.store.data[key] = {}
+        added = 0
+        for index in range(0, len(pairs), 2):
+            added += pairs[index] not in fields
+            fields[pairs[index]] = pairs[index + 1]
+        self.store.touch(key)
+        return added
+
+    def hgetall(self, key):
+        fields = self.store.get(key, dict) or {}
+        return [part for pair in fields.items() for part in pair]
+
+    def sadd(self, key, *members):
+        values = self.store.get(key, set)
+        if values is None:
+            values = self.store.data[key] = set()
+        before = len(values)
+        values.update(members)
+        self.store.touch(key)
+        return len(values) - before
+
+    def srem(self, key, *members):
+        values = self.store.get(key, set) or set()
+        removed = len(values & set(members))
+        values.difference_update(members)
+        self.store.touch(key)
+        return removed
+
+    def smembers(self, key):
+        return sorted(self.store.get(key, set) or ())
+
+    def call(self, args: list):
+        name = args[0].decode().upper()
+        handler = self.commands.get(name)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args[1:])
+        except RespError as e:
+            return e
+        except (TypeError, ValueError, IndexError):
+            return RespError(f"ERR wrong arguments for '{name}' command")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        transaction = None
+        watched = {}
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                name = args[0].decode().upper()
+                if name == 'MULTI':
+                    transaction = []
+                    reply = 'OK'
+                elif name == 'EXEC':
+                    if transaction is None:
+                        reply = RespError('ERR EXEC without MULTI')
+                    elif any(self.store.version(key) != version for key, version in watched.items()):
+                        reply = None
+                    else:
+                        reply = [self.call(queued) for queued in transaction]
+                    transaction = None
+                    watched = {}
+                elif name == 'DISCARD':
+                    transaction = None
+                    watched = {}
+                    reply = 'OK'
+                elif name == 'WATCH' and transaction is None:
+                    watched.update((key, self.store.version(key)) for key in args[1:])
+                    reply = 'OK'
+                elif name == 'UNWATCH' and transaction is None:
+                    watched = {}
+                    reply = 'OK'
+                elif transaction is not None:
+                    transaction.append(args)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.call(args)
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def encode(value) -> bytes:
+    if isinstance(value, RespError):
+        return b'-%s\r\n' % str(value).encode()
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        return b'+%s\r\n' % value.encode()
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+
+
+async def serve(host: str, port: int, password: str = None):
+    server = await asyncio.start_server(Server(password).handle, host, port)
+    print(f'Listening on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='In-memory Redis stand-in for the state backend')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--password', help='Require AUTH with this password')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.password))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()